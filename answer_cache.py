@@ -0,0 +1,175 @@
+"""Similarity-matched answer cache for repeat FAQ questions.
+
+Transcribed questions are normalized and matched against earlier ones with a
+TF-IDF cosine index. A close enough match returns the stored answer (and its
+audio, if it was synthesized with the same voice, speed and format) without a chat
+completion. Entries are partitioned by a fingerprint of the system prompt and
+model, so changing the business name, phone number or hours never serves a
+stale answer.
+"""
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+STOPWORDS = {
+    'a', 'an', 'the', 'is', 'are', 'am', 'was', 'be', 'do', 'does', 'did', 'i', 'me', 'my', 'we', 'you',
+    'your', 'it', 'to', 'of', 'on', 'in', 'for', 'at', 'and', 'or', 'can', 'could', 'would', 'please',
+    'hi', 'hello', 'hey', 'um', 'uh', 'so', 'just', 'like', 'what', 'tell', 'know', 'want', 'wanted',
+    'there', 'this', 'that', 'yes', 'okay', 'ok', 'thanks', 'thank'
+}
+
+
+def normalize_question(text: str) -> str:
+    return re.sub(r'\s+', ' ', re.sub(r"[^a-z0-9' ]+", ' ', text.lower())).strip()
+
+
+def stem(word: str) -> str:
+    # Just enough folding for "weekends"/"weekend" and "hours"/"hour" to meet
+    for suffix in ('ing', 'ed', 's'):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix) and not word.endswith('ss'):
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    words = [stem(w) for w in normalize_question(text).split() if w not in STOPWORDS]
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+def fingerprint(*parts: str) -> str:
+    return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()[:16]
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    similarity: float
+    audio: Optional[bytes] = None
+
+
+@dataclass
+class _Entry:
+    question: str
+    terms: Counter
+    answer: str
+    audio: Dict[Tuple[str, float, str], bytes] = field(default_factory=dict)
+    vector: Dict[str, float] = field(default_factory=dict)
+
+
+class _Partition:
+    def __init__(self):
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.df: Counter = Counter()
+        self.dirty = False
+
+    def idf(self, term: str) -> float:
+        return math.log((1 + len(self.entries)) / (1 + self.df[term])) + 1
+
+    def vectorize(self, terms: Counter) -> Dict[str, float]:
+        vector = {term: count * self.idf(term) for term, count in terms.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {term: v / norm for term, v in vector.items()}
+
+    def reindex(self):
+        if self.dirty:
+            for entry in self.entries.values():
+                entry.vector = self.vectorize(entry.terms)
+            self.dirty = False
+
+
+# ==================== CACHE ====================
+@dataclass
+class AnswerCacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class AnswerCache:
+    def __init__(self, threshold: float = 0.8, max_entries: int = 2000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.stats = AnswerCacheStats()
+        self._partitions: "OrderedDict[str, _Partition]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, question: str, fingerprint: str, voice: str = None, speed: float = 1.0,
+               response_format: str = 'mp3') -> Optional[CachedAnswer]:
+        terms = Counter(tokenize(question))
+        with self._lock:
+            partition = self._partitions.get(fingerprint)
+            if not terms or partition is None or not partition.entries:
+                self.stats.misses += 1
+                return None
+
+            partition.reindex()
+            query = partition.vectorize(terms)
+            best, best_score = None, 0.0
+            for entry in partition.entries.values():
+                score = sum(weight * entry.vector.get(term, 0.0) for term, weight in query.items())
+                if score > best_score:
+                    best, best_score = entry, score
+
+            if best is None or best_score < self.threshold:
+                self.stats.misses += 1
+                return None
+
+            self.stats.hits += 1
+            partition.entries.move_to_end(best.question)
+            return CachedAnswer(best.question, best.answer, best_score, best.audio.get((voice, round(speed, 2), response_format)))
+
+    def store(self, question: str, answer: str, fingerprint: str, voice: str = None, speed: float = 1.0,
+              audio: bytes = None, response_format: str = 'mp3'):
+        key = normalize_question(question)
+        terms = Counter(tokenize(question))
+        if not key or not terms or not answer:
+            return
+        with self._lock:
+            partition = self._partitions.setdefault(fingerprint, _Partition())
+            self._partitions.move_to_end(fingerprint)
+            entry = partition.entries.get(key)
+            if entry is None:
+                entry = _Entry(key, terms, answer)
+                partition.entries[key] = entry
+                partition.df.update(terms.keys())
+            else:
+                entry.answer = answer
+                entry.audio.clear()
+                partition.entries.move_to_end(key)
+            if audio is not None:
+                entry.audio[(voice, round(speed, 2), response_format)] = audio
+            partition.dirty = True
+            self.stats.stores += 1
+            self._trim()
+
+    def invalidate(self, keep_fingerprint: str = None):
+        """Drop every partition except ``keep_fingerprint`` (all of them if None)."""
+        with self._lock:
+            for fingerprint in list(self._partitions):
+                if fingerprint != keep_fingerprint:
+                    del self._partitions[fingerprint]
+
+    def __len__(self):
+        return sum(len(p.entries) for p in self._partitions.values())
+
+    def _trim(self):
+        total = len(self)
+        while total > self.max_entries and self._partitions:
+            fingerprint, partition = next(iter(self._partitions.items()))
+            if not partition.entries:
+                del self._partitions[fingerprint]
+                continue
+            _, entry = partition.entries.popitem(last=False)
+            partition.df.subtract(entry.terms.keys())
+            partition.dirty = True
+            total -= 1
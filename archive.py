@@ -0,0 +1,382 @@
+"""Append-only archive of call recordings: what the caller sent and what was said back.
+
+Clips are appended to large segment files (``archive/seg-00000.dat`` and on)
+rather than kept one file per clip. With ffmpeg installed they are re-encoded
+to Opus first; without it they are kept as they came. Each clip is stored once
+per content hash, so a recording uploaded twice, or an answer voiced the same
+way twice, takes its space once.
+
+A SQLite index maps each archived call to its clips and each clip to
+(segment, offset, length). Reads are memoryview slices of the mapped segment,
+so playing a call back copies nothing until the bytes are sent.
+
+Writers take the index's write lock around each append, so the app and its
+call workers (jobs.py) can archive into the same segments. An append cut short
+by a crash is past the segment's recorded end and is overwritten by the next.
+Calls older than the retention period are dropped. Clips no call uses any more
+are left in place until compaction, which copies the live clips out of
+mostly-dead segments and deletes those files.
+"""
+import io
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+from audio_io import BufferReader, BytesLike, as_memoryview
+from paths import data_dir
+from preprocess import HAS_FFMPEG, AudioSegment
+from replays import upload_digest
+
+logger = logging.getLogger(__name__)
+
+REF_PREFIX = 'archive:'
+MIME = {'ogg': 'audio/ogg', 'mp3': 'audio/mpeg', 'wav': 'audio/wav', 'm4a': 'audio/mp4', 'webm': 'audio/webm',
+        'pcm': 'audio/L16'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    size INTEGER NOT NULL DEFAULT 0,
+    live INTEGER NOT NULL DEFAULT 0,  -- bytes of clips some call still uses
+    sealed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS clips (
+    hash TEXT PRIMARY KEY,  -- of the clip as it came, before encoding
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    refs INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS clips_segment ON clips(segment);
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    caller TEXT,
+    response TEXT
+);
+CREATE INDEX IF NOT EXISTS recordings_created ON recordings(created);
+"""
+
+
+@dataclass(frozen=True)
+class ArchiveSettings:
+    segment_bytes: int = 64 * 1024 * 1024  # a segment is sealed once the next clip would take it past this
+    retention_days: float = 90.0  # 0 keeps calls forever
+    compact_ratio: float = 0.5  # sealed segments with less than this share of live bytes are compacted
+    bitrate: str = '24k'  # Opus; plenty for telephone speech
+    sample_rate: int = 16000
+    sync: bool = True  # fdatasync a call's appends before they are indexed
+
+    @classmethod
+    def from_env(cls) -> 'ArchiveSettings':
+        settings = cls()
+        overrides = {}
+        for name, value in vars(settings).items():
+            raw = os.environ.get(f"VOICE_ARCHIVE_{name.upper()}")
+            if raw is not None:
+                overrides[name] = raw.lower() in ('1', 'true', 'yes') if isinstance(value, bool) else type(value)(raw)
+        return replace(settings, **overrides)
+
+
+@dataclass(frozen=True)
+class Clip:
+    data: memoryview
+    format: str
+
+    @property
+    def mime(self) -> str:
+        return MIME.get(self.format, 'application/octet-stream')
+
+    def reader(self) -> BufferReader:
+        """A file over the clip, for players that want one."""
+        return BufferReader(self.data, name=f"clip.{self.format}")
+
+
+@dataclass(frozen=True)
+class Recording:
+    id: int
+    created: float
+    caller: Optional[Clip] = None
+    response: Optional[Clip] = None
+
+
+@dataclass
+class ArchiveStats:
+    recordings: int = 0
+    clips: int = 0
+    segments: int = 0
+    bytes: int = 0
+    live_bytes: int = 0
+
+
+def sniff_format(data: BytesLike, filename: str = '') -> str:
+    view = as_memoryview(data)
+    head = bytes(view[:12])
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return 'wav'
+    if head[:4] == b'OggS':
+        return 'ogg'
+    if head[:3] == b'ID3' or head[:2] in (b'\xff\xfb', b'\xff\xf3', b'\xff\xf2'):
+        return 'mp3'
+    extension = os.path.splitext(filename)[1].lstrip('.').lower()
+    return extension or 'pcm'
+
+
+def parse_ref(audio_ref: Optional[str]) -> Optional[int]:
+    """The archive id in a call's ``audio_ref``, or None for a file path or no audio."""
+    if not audio_ref or not audio_ref.startswith(REF_PREFIX):
+        return None
+    try:
+        return int(audio_ref[len(REF_PREFIX):])
+    except ValueError:
+        return None
+
+
+class AudioArchive:
+    def __init__(self, directory: str = None, settings: ArchiveSettings = None):
+        self.directory = directory or data_dir('archive')
+        os.makedirs(self.directory, exist_ok=True)
+        self.settings = settings or ArchiveSettings.from_env()
+        self._local = threading.local()
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._maps_lock = threading.Lock()
+        self._conn.executescript(SCHEMA)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(os.path.join(self.directory, 'index.db'), timeout=30,
+                                                      check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"seg-{segment:05d}.dat")
+
+    # ==================== WRITES ====================
+    def put(self, caller: BytesLike = None, response: BytesLike = None, caller_name: str = 'audio.wav') -> str:
+        """Archive a call's audio (either side may be missing); returns the ``audio_ref`` for its history row."""
+        clips = []
+        for data, name in ((caller, caller_name), (response, 'response')):
+            if data is None or not len(as_memoryview(data)):
+                clips.append(None)
+                continue
+            digest = upload_digest(data)
+            # Encoding is the slow part: skip it for a clip that is already here
+            known = self._conn.execute('SELECT 1 FROM clips WHERE hash = ?', (digest,)).fetchone()
+            clips.append((digest, data, name, None if known else self._encode(data, name)))
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            written = set()
+            hashes = [self._store(conn, *clip, written) if clip is not None else None for clip in clips]
+            self._sync(written)
+            cursor = conn.execute('INSERT INTO recordings (created, caller, response) VALUES (?, ?, ?)',
+                                  (time.time(), *hashes))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return f"{REF_PREFIX}{cursor.lastrowid}"
+
+    def _encode(self, data: BytesLike, name: str) -> Tuple[bytes, str]:
+        """Opus in an Ogg container when ffmpeg can decode the clip; otherwise the clip as it came."""
+        original = sniff_format(data, name)
+        if AudioSegment is not None and HAS_FFMPEG and original not in ('ogg', 'pcm'):
+            try:
+                segment = AudioSegment.from_file(BufferReader(data, name=name), format=original)
+                segment = segment.set_channels(1).set_frame_rate(self.settings.sample_rate)
+                out = io.BytesIO()
+                segment.export(out, format='ogg', codec='libopus', bitrate=self.settings.bitrate)
+                encoded = out.getvalue()
+                if len(encoded) < len(as_memoryview(data)):
+                    return encoded, 'ogg'
+            except Exception as e:
+                logger.warning("could not encode %s for the archive (%s); keeping it as %s", name, e, original)
+        return bytes(as_memoryview(data)), original
+
+    def _store(self, conn: sqlite3.Connection, digest: str, data: BytesLike, name: str,
+               encoded: Optional[Tuple[bytes, str]], written: set) -> str:
+        row = conn.execute('SELECT segment, length, refs FROM clips WHERE hash = ?', (digest,)).fetchone()
+        if row is not None:
+            segment, length, refs = row
+            conn.execute('UPDATE clips SET refs = refs + 1 WHERE hash = ?', (digest,))
+            if not refs:  # revived before compaction got to it
+                conn.execute('UPDATE segments SET live = live + ? WHERE id = ?', (length, segment))
+            return digest
+        # Compaction can drop an unused clip between the check in put() and here; encode it after all
+        payload, fmt = encoded or self._encode(data, name)
+        segment, offset = self._append(conn, payload)
+        written.add(segment)
+        conn.execute('INSERT INTO clips VALUES (?, ?, ?, ?, ?, 1)', (digest, segment, offset, len(payload), fmt))
+        return digest
+
+    def _append(self, conn: sqlite3.Connection, payload: bytes) -> Tuple[int, int]:
+        """Write ``payload`` at the end of the open segment; the caller holds the write lock and syncs it."""
+        row = conn.execute('SELECT id, size FROM segments WHERE sealed = 0 ORDER BY id DESC LIMIT 1').fetchone()
+        if row is not None and row[1] and row[1] + len(payload) > self.settings.segment_bytes:
+            conn.execute('UPDATE segments SET sealed = 1 WHERE id = ?', (row[0],))
+            row = None
+        if row is None:
+            row = (conn.execute('INSERT INTO segments (size) VALUES (0)').lastrowid, 0)
+        segment, offset = row
+        fd = os.open(self._segment_path(segment), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(fd, payload, offset)
+        finally:
+            os.close(fd)
+        conn.execute('UPDATE segments SET size = ?, live = live + ? WHERE id = ?',
+                     (offset + len(payload), len(payload), segment))
+        return segment, offset
+
+    def _sync(self, segments):
+        """Flush appends to disk before the index says they are there."""
+        if not self.settings.sync:
+            return
+        for segment in segments:
+            fd = os.open(self._segment_path(segment), os.O_RDONLY)
+            try:
+                os.fdatasync(fd)
+            finally:
+                os.close(fd)
+
+    # ==================== READS ====================
+    def recording(self, audio_ref: str) -> Optional[Recording]:
+        """A call's archived audio, or None when the ref isn't an archive ref or the call has expired."""
+        recording_id = parse_ref(audio_ref)
+        if recording_id is None:
+            return None
+        for attempt in range(2):
+            row = self._conn.execute(
+                'SELECT r.created, c.segment, c.offset, c.length, c.format, s.segment, s.offset, s.length, s.format '
+                'FROM recordings r LEFT JOIN clips c ON c.hash = r.caller LEFT JOIN clips s ON s.hash = r.response '
+                'WHERE r.id = ?', (recording_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            try:
+                return Recording(recording_id, row[0], self._clip(*row[1:5]), self._clip(*row[5:9]))
+            except FileNotFoundError:
+                # Compaction moved the clip and removed its old segment in between; look it up again
+                with self._maps_lock:
+                    self._maps.clear()
+        return None
+
+    def _clip(self, segment: Optional[int], offset: int, length: int, fmt: str) -> Optional[Clip]:
+        if segment is None:
+            return None
+        return Clip(self._map(segment, offset + length)[offset:offset + length], fmt)
+
+    def _map(self, segment: int, end: int) -> memoryview:
+        with self._maps_lock:
+            mapped = self._maps.get(segment)
+            if mapped is None or len(mapped) < end:
+                # The open segment grows; map it again to reach newer clips. Views of the old map keep it alive
+                with open(self._segment_path(segment), 'rb') as f:
+                    mapped = self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(mapped)
+
+    def stats(self) -> ArchiveStats:
+        conn = self._conn
+        segments, size, live = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(live), 0) FROM segments').fetchone()
+        return ArchiveStats(conn.execute('SELECT COUNT(*) FROM recordings').fetchone()[0],
+                            conn.execute('SELECT COUNT(*) FROM clips').fetchone()[0], segments, size, live)
+
+    # ==================== RETENTION & COMPACTION ====================
+    def delete(self, audio_refs: List[str]) -> int:
+        ids = [recording_id for recording_id in map(parse_ref, audio_refs) if recording_id is not None]
+        return self._drop('SELECT id, caller, response FROM recordings WHERE id IN '
+                          f"({', '.join('?' * len(ids))})", ids) if ids else 0
+
+    def expire(self, now: float = None) -> int:
+        """Drop calls past the retention period; their clips stay until compaction."""
+        if not self.settings.retention_days:
+            return 0
+        cutoff = (now or time.time()) - self.settings.retention_days * 86400
+        return self._drop('SELECT id, caller, response FROM recordings WHERE created < ?', (cutoff,))
+
+    def _drop(self, query: str, params) -> int:
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(query, params).fetchall()
+            for recording_id, *hashes in rows:
+                for digest in filter(None, hashes):
+                    conn.execute('UPDATE clips SET refs = refs - 1 WHERE hash = ?', (digest,))
+                    conn.execute('UPDATE segments SET live = live - (SELECT length FROM clips WHERE hash = ?) '
+                                 'WHERE id = (SELECT segment FROM clips WHERE hash = ? AND refs = 0)',
+                                 (digest, digest))
+                conn.execute('DELETE FROM recordings WHERE id = ?', (recording_id,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return len(rows)
+
+    def compact(self) -> Tuple[int, int]:
+        """Copy live clips out of sealed segments that are mostly dead; returns (segments removed, bytes freed)."""
+        conn = self._conn
+        candidates = conn.execute('SELECT id, size FROM segments WHERE sealed = 1 AND live < size * ?',
+                                  (self.settings.compact_ratio,)).fetchall()
+        removed, freed = 0, 0
+        for segment, size in candidates:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                live = conn.execute('SELECT hash, offset, length FROM clips WHERE segment = ? AND refs > 0',
+                                    (segment,)).fetchall()
+                if live:
+                    source = self._map(segment, max(offset + length for _, offset, length in live))
+                written = set()
+                for digest, offset, length in live:
+                    new_segment, new_offset = self._append(conn, bytes(source[offset:offset + length]))
+                    written.add(new_segment)
+                    conn.execute('UPDATE clips SET segment = ?, offset = ? WHERE hash = ?',
+                                 (new_segment, new_offset, digest))
+                self._sync(written)
+                conn.execute('DELETE FROM clips WHERE segment = ?', (segment,))
+                conn.execute('DELETE FROM segments WHERE id = ?', (segment,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            with self._maps_lock:
+                self._maps.pop(segment, None)
+            # Readers still holding views of it keep the mapping; the space is freed when they let go
+            os.remove(self._segment_path(segment))
+            removed += 1
+            freed += size - sum(length for _, _, length in live)
+        return removed, freed
+
+    def maintain(self) -> Tuple[int, int, int]:
+        """Apply retention, then compact; returns (calls expired, segments removed, bytes freed)."""
+        expired = self.expire()
+        return (expired, *self.compact())
+
+    def clear(self):
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            segments = [segment for segment, in conn.execute('SELECT id FROM segments').fetchall()]
+            conn.execute('DELETE FROM recordings')
+            conn.execute('DELETE FROM clips')
+            conn.execute('DELETE FROM segments')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        with self._maps_lock:
+            self._maps.clear()
+        for segment in segments:
+            try:
+                os.remove(self._segment_path(segment))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,177 @@
+"""In-memory audio buffers (no temp files between upload, API calls and playback), WAV parsing and PCM codecs."""
+import io
+import os
+import struct
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+BytesLike = Union[bytes, bytearray, memoryview, io.BytesIO]
+
+
+def as_memoryview(data: BytesLike) -> memoryview:
+    """View an upload (bytes, bytearray, memoryview or BytesIO/UploadedFile) without copying it."""
+    if isinstance(data, io.BytesIO):
+        return data.getbuffer()
+    return memoryview(data).cast('B')
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable read-only file over a memoryview.
+
+    Lets httpx stream a multipart upload straight out of the caller's buffer;
+    only the current read chunk is ever copied.
+    """
+
+    def __init__(self, data: BytesLike, name: str = 'audio'):
+        self._view = as_memoryview(data)
+        self._pos = 0
+        self.name = name
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self._view[self._pos:self._pos + len(buffer)]
+        n = len(chunk)
+        buffer[:n] = chunk
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+
+def _wav_chunks(view: memoryview) -> Iterator[Tuple[bytes, int, int]]:
+    """(chunk id, payload offset, payload size) for each chunk of a RIFF/WAVE file; nothing for other formats."""
+    if len(view) < 12 or bytes(view[:4]) != b'RIFF' or bytes(view[8:12]) != b'WAVE':
+        return
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id, size = bytes(view[offset:offset + 4]), int.from_bytes(view[offset + 4:offset + 8], 'little')
+        yield chunk_id, offset + 8, min(size, len(view) - offset - 8)
+        offset += 8 + size + size % 2
+
+
+def wav_seconds(data: BytesLike) -> Optional[float]:
+    """Playback length of a WAV file from its header (any encoding), or None for other formats."""
+    view = as_memoryview(data)
+    byte_rate = None
+    for chunk_id, offset, size in _wav_chunks(view):
+        if chunk_id == b'fmt ' and size >= 12:
+            byte_rate = int.from_bytes(view[offset + 8:offset + 12], 'little')
+        elif chunk_id == b'data':
+            return size / byte_rate if byte_rate else None
+    return None
+
+
+def read_wav(data: BytesLike) -> Optional[Tuple[np.ndarray, int]]:
+    """(mono int16 samples, sample rate) of a 16-bit PCM or μ-law WAV, or None for anything else."""
+    view = as_memoryview(data)
+    fmt = None
+    for chunk_id, offset, size in _wav_chunks(view):
+        if chunk_id == b'fmt ' and size >= 16:
+            fmt = struct.unpack('<HHIIHH', view[offset:offset + 16])
+        elif chunk_id == b'data' and fmt is not None:
+            encoding, channels, rate, _, _, bits = fmt
+            payload = view[offset:offset + size]
+            if encoding == 1 and bits == 16:
+                samples = np.frombuffer(payload, dtype='<i2', count=len(payload) // 2)
+            elif encoding == 7 and bits == 8:
+                samples = ulaw_to_pcm16(payload)
+            else:
+                return None
+            if channels > 1:
+                samples = samples[:len(samples) // channels * channels].reshape(-1, channels).mean(axis=1)
+            return samples.astype(np.int16), rate
+    return None
+
+
+def pcm16_wav(samples: np.ndarray, rate: int) -> bytes:
+    """Mono 16-bit PCM samples as a WAV file."""
+    data = samples.astype('<i2').tobytes()
+    fmt = struct.pack('<HHIIHH', 1, 1, rate, rate * 2, 2, 16)
+    body = b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'data' + struct.pack('<I', len(data)) + data
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def concat_wav(clips: List[bytes]) -> bytes:
+    """One WAV file holding the audio of several, which must share a format; the first clip's header is kept."""
+    header = None
+    payloads = []
+    for clip in clips:
+        view = as_memoryview(clip)
+        for chunk_id, offset, size in _wav_chunks(view):
+            if chunk_id == b'fmt ' and header is None:
+                header = bytes(view[offset - 8:offset + size + size % 2])
+            elif chunk_id == b'data':
+                payloads.append(view[offset:offset + size])
+                break
+    data = b''.join(payloads)
+    body = b'WAVE' + header + b'data' + struct.pack('<I', len(data)) + data
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+# ==================== μ-LAW CODEC ====================
+def _ulaw_decode_table() -> np.ndarray:
+    code = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (code >> 4) & 0x07
+    magnitude = ((((code & 0x0F) << 3) + 0x84) << exponent) - 0x84
+    return np.where(code & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def _ulaw_encode_table() -> np.ndarray:
+    # Indexed by a sample's bit pattern read as uint16, so encoding is a single lookup
+    samples = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32)
+    sign = np.where(samples < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(samples), 32635) + 0x84
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+
+ULAW_DECODE = _ulaw_decode_table()
+ULAW_ENCODE = _ulaw_encode_table()
+ULAW_SILENCE = b'\xff'
+
+
+def ulaw_to_pcm16(data: bytes) -> np.ndarray:
+    return ULAW_DECODE[np.frombuffer(data, dtype=np.uint8)]
+
+
+def pcm16_to_ulaw(samples: np.ndarray) -> bytes:
+    return ULAW_ENCODE[samples.astype(np.int16).view(np.uint16)].tobytes()
+
+
+@lru_cache(maxsize=8)
+def _lowpass(ratio: float, taps: int = 31) -> np.ndarray:
+    # Windowed-sinc anti-aliasing filter with its cutoff at the output Nyquist frequency
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(ratio * n) * np.hamming(taps)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+def resample(samples: np.ndarray, rate_in: int, rate_out: int) -> np.ndarray:
+    if rate_in == rate_out or not len(samples):
+        return samples.astype(np.int16)
+    signal = samples.astype(np.float32)
+    if rate_out < rate_in:
+        signal = np.convolve(signal, _lowpass(rate_out / rate_in), mode='same')
+    if rate_in % rate_out == 0:
+        signal = signal[::rate_in // rate_out]
+    else:
+        positions = np.arange(len(signal) * rate_out // rate_in) * (rate_in / rate_out)
+        signal = np.interp(positions, np.arange(len(signal)), signal)
+    return np.clip(np.round(signal), -32768, 32767).astype(np.int16)
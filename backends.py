@@ -0,0 +1,356 @@
+"""Speech backends: where a call's transcription and synthesis run.
+
+``openai`` (the default) sends audio to Whisper and text to the speech endpoint
+over the call's client. The local backends run on this machine's CPU, so they
+keep working without a network and cost nothing per call:
+
+  faster-whisper   CTranslate2 Whisper models, int8-quantized (pip install faster-whisper)
+  piper            Piper ONNX voices (pip install piper-tts)
+
+``CallConfig.stt_backend`` and ``tts_backend`` pick a backend per call, or per
+tenant in its profile; ``name:model`` picks the model as well, e.g.
+``faster-whisper:small.en`` or ``piper:en_US-amy-medium``. Local models load
+once into ``MODEL_POOL`` and are shared by every session, tenant and call in
+the process. Each model runs on its own small thread pool, so inference never
+blocks the event loop. Settings come from ``VOICE_LOCAL_*`` environment variables.
+"""
+import abc
+import asyncio
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, List, Protocol, Tuple
+
+import numpy as np
+
+from audio_io import BufferReader, BytesLike, as_memoryview, pcm16_wav, read_wav, resample
+from metrics import METRICS
+from paths import data_dir
+from pipeline import openai_speech
+from preprocess import HAS_FFMPEG, AudioSegment
+
+try:
+    from faster_whisper import WhisperModel
+except ImportError:
+    WhisperModel = None
+
+try:
+    from piper import PiperVoice
+except ImportError:
+    PiperVoice = None
+
+try:
+    from piper import SynthesisConfig  # piper-tts 1.3+; older releases take length_scale directly
+except ImportError:
+    SynthesisConfig = None
+
+logger = logging.getLogger(__name__)
+
+OPENAI = 'openai'
+WHISPER_RATE = 16000
+PCM_RATE = 24000  # response_format='pcm' from the speech endpoint: 24 kHz 16-bit mono
+FFMPEG_FORMATS = {'aac': 'adts'}  # response formats whose ffmpeg muxer has another name
+
+
+class BackendUnavailable(RuntimeError):
+    """A local backend's package or model files are missing."""
+
+
+class SpeechToText(Protocol):
+    model: str  # what usage is recorded under
+    remote: bool
+
+    async def transcribe(self, audio: BytesLike, filename: str = 'audio.wav') -> str: ...
+
+
+class TextToSpeech(Protocol):
+    model: str  # what usage and cached audio are keyed on
+    remote: bool
+
+    async def synthesize(self, text: str, voice: str, speed: float = 1.0, response_format: str = 'mp3') -> bytes: ...
+
+
+def parse_backend(spec: str) -> Tuple[str, str]:
+    """'faster-whisper:small.en' -> ('faster-whisper', 'small.en'); the model is '' when not given."""
+    name, _, model = (spec or OPENAI).partition(':')
+    return name.strip().lower(), model.strip()
+
+
+# ==================== SETTINGS ====================
+@dataclass(frozen=True)
+class LocalSpeechSettings:
+    whisper_model: str = 'base.en'
+    whisper_compute_type: str = 'int8'
+    whisper_cpu_threads: int = 0  # 0: one per core
+    whisper_beam_size: int = 1
+    # Silero VAD inside faster-whisper skips silence; local audio isn't trimmed by preprocess.py first
+    whisper_vad_filter: bool = True
+    piper_voice: str = 'en_US-lessac-medium'
+    # Whisper downloads and Piper voices (<name>.onnx + <name>.onnx.json); default: models/ in the data directory
+    models_dir: str = ''
+    # Inferences run at once per model; on a CPU one inference already uses every core
+    workers: int = 1
+
+    @classmethod
+    def from_env(cls) -> 'LocalSpeechSettings':
+        settings = cls()
+        overrides = {}
+        for name, value in vars(settings).items():
+            raw = os.environ.get(f"VOICE_LOCAL_{name.upper()}")
+            if raw is None:
+                continue
+            if isinstance(value, bool):
+                overrides[name] = raw.lower() in ('1', 'true', 'yes')
+            else:
+                overrides[name] = type(value)(raw)
+        return replace(settings, **overrides)
+
+    def models_path(self, kind: str) -> str:
+        if self.models_dir:
+            path = os.path.join(os.path.expanduser(self.models_dir), kind)
+            os.makedirs(path, exist_ok=True)
+            return path
+        return data_dir('models', kind)
+
+
+# ==================== OPENAI ====================
+class OpenAITranscriber:
+    remote = True
+
+    def __init__(self, client, model: str = 'whisper-1'):
+        self.client = client
+        self.model = model
+
+    async def transcribe(self, audio: BytesLike, filename: str = 'audio.wav') -> str:
+        # Streamed to the API straight out of the caller's buffer, no temp file or copy
+        METRICS.add_bytes('stt', 'out', len(as_memoryview(audio)))
+        transcript = await self.client.audio.transcriptions.create(
+            model=self.model,
+            file=(filename, BufferReader(audio, name=filename)),
+            response_format="text"
+        )
+        return (transcript if isinstance(transcript, str) else transcript.text).strip()
+
+
+class OpenAISpeech:
+    remote = True
+
+    def __init__(self, client, model: str = 'tts-1'):
+        self.client = client
+        self.model = model
+
+    async def synthesize(self, text: str, voice: str, speed: float = 1.0, response_format: str = 'mp3') -> bytes:
+        return await openai_speech(self.client, text, voice, model=self.model, speed=speed,
+                                   response_format=response_format)
+
+
+# ==================== LOCAL ====================
+class LocalModel(abc.ABC):
+    """A model on this machine: loaded on first use (or by ``load``) and run on its own threads."""
+    remote = False
+    backend = ''
+    package = ''
+
+    def __init__(self, name: str, settings: LocalSpeechSettings):
+        self.name = name
+        self.model = f"{self.backend}:{name}"
+        self.settings = settings
+        self.load_seconds = None
+        self._engine = None
+        self._load_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, settings.workers), thread_name_prefix=self.backend)
+
+    @classmethod
+    @abc.abstractmethod
+    def installed(cls) -> bool:
+        """Whether the package this backend runs on is importable."""
+
+    @classmethod
+    @abc.abstractmethod
+    def default_model(cls, settings: LocalSpeechSettings) -> str:
+        """The model used when a spec names only the backend."""
+
+    def load(self):
+        """The loaded model, loading it now if needed; blocking, so call it off the event loop."""
+        if self._engine is None:
+            with self._load_lock:
+                if self._engine is None:
+                    start = time.perf_counter()
+                    engine = self._load()
+                    self.load_seconds = time.perf_counter() - start
+                    logger.info("loaded %s in %.1f s", self.model, self.load_seconds)
+                    self._engine = engine
+        return self._engine
+
+    @abc.abstractmethod
+    def _load(self):
+        """Load the model from disk (or download it); runs once, under the load lock."""
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: fn(self.load(), *args))
+
+
+class FasterWhisperTranscriber(LocalModel):
+    backend = 'faster-whisper'
+    package = 'faster-whisper'
+
+    @classmethod
+    def installed(cls) -> bool:
+        return WhisperModel is not None
+
+    @classmethod
+    def default_model(cls, settings: LocalSpeechSettings) -> str:
+        return settings.whisper_model
+
+    def _load(self):
+        s = self.settings
+        return WhisperModel(self.name, device='cpu', compute_type=s.whisper_compute_type,
+                            cpu_threads=s.whisper_cpu_threads, num_workers=max(1, s.workers),
+                            download_root=s.models_path('whisper'))
+
+    async def transcribe(self, audio: BytesLike, filename: str = 'audio.wav') -> str:
+        decoded = read_wav(audio)
+        if decoded is not None:
+            samples, rate = decoded
+            source = resample(samples, rate, WHISPER_RATE).astype(np.float32) / 32768
+        else:
+            source = io.BytesIO(bytes(as_memoryview(audio)))  # compressed formats are decoded by faster-whisper
+        return await self._run(self._transcribe, source)
+
+    def _transcribe(self, model, source) -> str:
+        s = self.settings
+        segments, _ = model.transcribe(source, beam_size=s.whisper_beam_size, vad_filter=s.whisper_vad_filter,
+                                       language='en' if self.name.endswith('.en') else None)
+        # Segments are decoded lazily, so the work happens here, on the model's thread
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+
+class PiperSpeech(LocalModel):
+    backend = 'piper'
+    package = 'piper-tts'
+
+    @classmethod
+    def installed(cls) -> bool:
+        return PiperVoice is not None
+
+    @classmethod
+    def default_model(cls, settings: LocalSpeechSettings) -> str:
+        return settings.piper_voice
+
+    def _load(self):
+        path = self.name if self.name.endswith('.onnx') else os.path.join(self.settings.models_path('piper'),
+                                                                          f"{self.name}.onnx")
+        if not os.path.exists(path):
+            raise BackendUnavailable(f"Piper voice {path} not found; download it and its .onnx.json "
+                                     f"from https://huggingface.co/rhasspy/piper-voices")
+        return PiperVoice.load(path)
+
+    async def synthesize(self, text: str, voice: str = '', speed: float = 1.0, response_format: str = 'mp3') -> bytes:
+        # ``voice`` names an OpenAI voice; a Piper model is a single voice, chosen by the backend's model
+        start = time.perf_counter()
+        audio = await self._run(self._synthesize, text, speed, response_format)
+        METRICS.observe('tts', time.perf_counter() - start, model=self.model)
+        METRICS.add_usage(self.model, characters=len(text))
+        return audio
+
+    @staticmethod
+    def _synthesize(voice, text: str, speed: float, response_format: str) -> bytes:
+        length_scale = (getattr(voice.config, 'length_scale', None) or 1.0) / speed
+        rate = voice.config.sample_rate
+        if SynthesisConfig is not None:
+            pcm = b''.join(chunk.audio_int16_bytes
+                           for chunk in voice.synthesize(text, syn_config=SynthesisConfig(length_scale=length_scale)))
+        else:
+            pcm = b''.join(voice.synthesize_stream_raw(text, length_scale=length_scale))
+        return encode_speech(np.frombuffer(pcm, dtype='<i2'), rate, response_format)
+
+
+def encode_speech(samples: np.ndarray, rate: int, response_format: str) -> bytes:
+    """Synthesized samples in the format the speech endpoint would have returned, as near as this machine can."""
+    if response_format == 'pcm':
+        return resample(samples, rate, PCM_RATE).astype('<i2').tobytes()
+    if response_format != 'wav' and AudioSegment is not None and HAS_FFMPEG:
+        segment = AudioSegment(samples.astype('<i2').tobytes(), frame_rate=rate, sample_width=2, channels=1)
+        out = io.BytesIO()
+        segment.export(out, format=FFMPEG_FORMATS.get(response_format, response_format))
+        return out.getvalue()
+    return pcm16_wav(samples, rate)  # no encoder here; WAV plays wherever MP3 does
+
+
+LOCAL_STT = {cls.backend: cls for cls in (FasterWhisperTranscriber,)}
+LOCAL_TTS = {cls.backend: cls for cls in (PiperSpeech,)}
+
+
+# ==================== MODEL POOL ====================
+class ModelPool:
+    """Local models by backend and model name, created once and kept warm for the life of the process."""
+
+    def __init__(self, settings: LocalSpeechSettings = None):
+        self.settings = settings or LocalSpeechSettings.from_env()
+        self._models: Dict[Tuple[str, str], LocalModel] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kinds: Dict[str, type], name: str, model: str = '') -> LocalModel:
+        cls = kinds.get(name)
+        if cls is None:
+            raise ValueError(f"unknown speech backend {name!r}; choose from {', '.join([OPENAI, *kinds])}")
+        if not cls.installed():
+            raise BackendUnavailable(f"{name} is not installed (pip install {cls.package})")
+        model = model or cls.default_model(self.settings)
+        key = (name, model)
+        found = self._models.get(key)
+        if found is None:
+            with self._lock:
+                found = self._models.get(key)
+                if found is None:
+                    found = self._models[key] = cls(model, self.settings)
+        return found
+
+    def transcriber(self, spec: str) -> FasterWhisperTranscriber:
+        return self.get(LOCAL_STT, *parse_backend(spec))
+
+    def speech(self, spec: str) -> PiperSpeech:
+        return self.get(LOCAL_TTS, *parse_backend(spec))
+
+    def warm(self, stt_specs: Iterable[str] = (), tts_specs: Iterable[str] = ()) -> List[LocalModel]:
+        """Load the local models these backends name now, so no caller waits for a model to load."""
+        models = [self.transcriber(spec) for spec in set(stt_specs) if parse_backend(spec)[0] != OPENAI]
+        models += [self.speech(spec) for spec in set(tts_specs) if parse_backend(spec)[0] != OPENAI]
+        for model in models:
+            model.load()
+        return models
+
+    def loaded(self) -> Dict[str, float]:
+        """Seconds each loaded model took to load, by model."""
+        return {m.model: m.load_seconds for m in list(self._models.values()) if m.load_seconds is not None}
+
+
+MODEL_POOL = ModelPool()
+
+
+def speech_to_text(spec: str, client, model: str = 'whisper-1', pool: ModelPool = None) -> SpeechToText:
+    """The transcriber a ``CallConfig.stt_backend`` names; ``model`` is the OpenAI model when it names none."""
+    name, variant = parse_backend(spec)
+    if name == OPENAI:
+        return OpenAITranscriber(client, variant or model)
+    return (pool or MODEL_POOL).get(LOCAL_STT, name, variant)
+
+
+def text_to_speech(spec: str, client, model: str = 'tts-1', pool: ModelPool = None) -> TextToSpeech:
+    """The synthesizer a ``CallConfig.tts_backend`` names; ``model`` is the OpenAI model when it names none."""
+    name, variant = parse_backend(spec)
+    if name == OPENAI:
+        return OpenAISpeech(client, variant or model)
+    return (pool or MODEL_POOL).get(LOCAL_TTS, name, variant)
+
+
+def available_backends() -> Dict[str, List[str]]:
+    """Backend names usable in this process, for 'stt' and 'tts'."""
+    return {
+        'stt': [OPENAI] + [name for name, cls in LOCAL_STT.items() if cls.installed()],
+        'tts': [OPENAI] + [name for name, cls in LOCAL_TTS.items() if cls.installed()],
+    }
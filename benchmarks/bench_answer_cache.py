@@ -0,0 +1,84 @@
+"""Replay a recorded question corpus with and without the answer cache.
+
+Reports hit rate and p50/p95 response latency (transcript in hand -> last
+audio chunk) for both runs.
+
+    python benchmarks/bench_answer_cache.py --repeat 3
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_cache import AnswerCache
+from benchmarks.fake_openai import FakeOpenAI
+from call_processor import CallConfig, CallProcessor
+
+# Transcripts as they come back from Whisper: the Tips panel test questions,
+# their common phrasings, and a tail of one-off questions.
+CORPUS = [
+    "What are your business hours?",
+    "How can I contact you?",
+    "What services do you offer?",
+    "Are you open on weekends?",
+    "Hi, what are your business hours?",
+    "Um, what are your business hours please?",
+    "How can I contact you?",
+    "Are you open on the weekend?",
+    "What services do you offer?",
+    "Hello, how can I contact you?",
+    "What are your business hours?",
+    "Do you deliver to the airport?",
+    "Are you open on weekends?",
+    "Can I speak to the manager about my order from last Tuesday?",
+    "What are your business hours?",
+    "What services do you offer?",
+    "Is there parking near your office?",
+    "How can I contact you?",
+    "Are you open on weekends?",
+    "I'd like to cancel my appointment for Friday.",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def replay(processor, questions):
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        async for _ in processor.stream_response(question, CallConfig()):
+            pass
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def run(repeat):
+    questions = CORPUS * repeat
+    with FakeOpenAI(llm_token_delay=0.01) as server:
+        baseline = await replay(CallProcessor.from_api_key('test', base_url=server.base_url), questions)
+        cache = AnswerCache()
+        cached = await replay(CallProcessor.from_api_key('test', base_url=server.base_url, answer_cache=cache), questions)
+
+    print(f"questions replayed: {len(questions)}   answer cache hit rate: {cache.stats.hit_rate:.0%}")
+    for name, latencies in (('no cache', baseline), ('cache', cached)):
+        print(f"{name:<9} p50 {statistics.median(latencies):7.1f} ms   p95 {percentile(latencies, 0.95):7.1f} ms")
+    print(f"saved     p50 {statistics.median(baseline) - statistics.median(cached):7.1f} ms   "
+          f"p95 {percentile(baseline, 0.95) - percentile(cached, 0.95):7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=2, help='times to replay the corpus')
+    args = parser.parse_args()
+    asyncio.run(run(args.repeat))
+
+
+if __name__ == '__main__':
+    main()
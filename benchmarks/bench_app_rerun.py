@@ -0,0 +1,125 @@
+"""Streamlit rerun wall time as call history grows, measured with AppTest.
+
+Seeds a call history of each size in a temporary data directory and times:
+
+  full rerun      the whole script, as any interaction cost before the app was
+                  split into fragments (and still does outside them)
+  history open    a full rerun with the Call History tab's page of calls shown
+  sidebar edit    a rerun of just the sidebar's business-settings fragment
+
+AppTest has no public way to rerun one fragment, so the last column queues the
+fragment's id the way the browser does, through AppTest internals; it is left
+blank for a script without that fragment. --app times another copy of the
+script, e.g. an older revision saved next to voice_app.py, for comparison.
+
+    python benchmarks/bench_app_rerun.py --calls 10 1000 10000 --reruns 10
+"""
+import argparse
+import functools
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import streamlit as st
+from streamlit.runtime.scriptrunner_utils.script_requests import RerunData
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import local_script_runner
+
+from benchmarks.bench_call_store import synthetic_calls
+from call_store import CallStore
+
+
+def seed(calls):
+    store = CallStore()
+    batch = []
+    for record in synthetic_calls(calls):
+        batch.append(record)
+        if len(batch) == 5000:
+            store.add_many(batch)
+            batch = []
+    store.add_many(batch)
+    store.flush()
+    store.close()
+
+
+def fragment_id(at, name):
+    for fid, fragment in at._fragment_storage._fragments.items():
+        cells = fragment.__closure__ or ()
+        if any(getattr(cell.cell_contents, '__name__', None) == name for cell in cells):
+            return fid
+    return None
+
+
+@contextmanager
+def fragment_reruns(fid):
+    local_script_runner.RerunData = functools.partial(RerunData, fragment_id_queue=[fid])
+    try:
+        yield
+    finally:
+        local_script_runner.RerunData = RerunData
+
+
+def rerun_ms(at, reruns):
+    samples = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        samples.append((time.perf_counter() - start) * 1000)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+    return statistics.median(samples), max(samples)
+
+
+def measure(app, calls, reruns):
+    results = {}
+    with tempfile.TemporaryDirectory() as data:
+        os.environ['VOICE_DATA_DIR'] = data
+        seed(calls)
+        # get_call_store() must open this size's store; clearing outside a script run warns per cache
+        logging.getLogger('streamlit.runtime.scriptrunner_utils.script_run_context').setLevel(logging.ERROR)
+        st.cache_resource.clear()
+        at = AppTest.from_file(app, default_timeout=120)
+        at.session_state['api_key'] = 'sk-test'  # renders every tab; reruns make no API calls
+        at.run()
+        results['full'] = rerun_ms(at, reruns)
+        sidebar = fragment_id(at, 'business_settings')
+        if sidebar is not None:
+            with fragment_reruns(sidebar):
+                results['sidebar'] = rerun_ms(at, reruns)
+            at.run()  # a fragment run's tree holds only that fragment's elements
+        toggles = [t for t in at.toggle if t.key == 'show_history']
+        if toggles:  # an older app without the toggle renders history on every rerun
+            toggles[0].set_value(True).run()
+            results['history'] = rerun_ms(at, reruns)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--reruns', type=int, default=10)
+    parser.add_argument('--app', type=os.path.abspath, default=os.path.join(ROOT, 'voice_app.py'))
+    args = parser.parse_args()
+
+    # AppTest recompiles the script on every run, which a server does once; magic's AST pass dominates that
+    st.config.set_option('runner.magicEnabled', False)
+
+    print(f"{os.path.basename(args.app)}: median / max ms per rerun over {args.reruns} reruns")
+    columns = (('full', 'full rerun'), ('history', 'history open'), ('sidebar', 'sidebar edit'))
+    print(f"{'calls':>7}" + "".join(f" {title:>15}" for _, title in columns))
+    for calls in args.calls:
+        results = measure(args.app, calls, args.reruns)
+        cells = [f"{results[key][0]:>6.0f} / {results[key][1]:<6.0f}" if key in results else f"{'—':>15}"
+                 for key, _ in columns]
+        print(f"{calls:>7} " + " ".join(cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Call-recording archive: write throughput, random-read latency and storage per call hour.
+
+Synthetic calls (a 16 kHz WAV upload and a 24 kHz WAV reply, as the app's
+local TTS returns) go into an AudioArchive and, for comparison, into one file
+per clip, which is how the app kept audio before. --repeat of the uploads are
+sent again (retries, double clicks, the same voicemail forwarded twice).
+
+  write    calls/s archived, with and without fsync per append
+  read     a random call's clips: archive mmap slice vs open() + read() of
+           its files, touching every page of the audio
+  storage  bytes on disk per hour of call audio. Clips are Opus when ffmpeg
+           is installed and stored as uploaded otherwise
+  retention  half the calls expire; compaction time and the space it frees
+
+    python benchmarks/bench_archive.py --calls 200 --seconds 10
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import replace
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import AudioArchive, ArchiveSettings
+from audio_io import pcm16_wav
+from preprocess import HAS_FFMPEG
+
+PAGE = 4096
+
+
+def speech(seconds: float, rate: int, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = 110 + 40 * rng.random()
+    voice = sum(np.sin(2 * np.pi * pitch * k * t + rng.random() * 6) / k for k in range(1, 12))
+    envelope = 0.4 + 0.6 * np.abs(np.sin(2 * np.pi * (2.5 + rng.random()) * t))
+    samples = 5000 * voice * envelope + rng.normal(0, 200, len(t))
+    return pcm16_wav(np.clip(samples, -32768, 32767).astype(np.int16), rate)
+
+
+def make_calls(count: int, seconds: float, repeat: float):
+    """(upload, reply) pairs; a few base clips, made unique by their last samples so dedupe has to earn its keep."""
+    bases = [(speech(seconds, 16000, i), speech(seconds * 0.8, 24000, 100 + i)) for i in range(4)]
+    calls = []
+    for i in range(count):
+        if calls and random.random() < repeat:
+            calls.append(random.choice(calls))
+            continue
+        caller, reply = bases[i % len(bases)]
+        calls.append((caller[:-8] + os.urandom(8), reply[:-8] + os.urandom(8)))
+    return calls
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1e6
+
+
+def disk_bytes(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+
+def write_files(directory: str, calls, sync: bool):
+    os.makedirs(directory)
+    paths = []
+    for i, (caller, reply) in enumerate(calls):
+        pair = []
+        for side, data in (('caller', caller), ('reply', reply)):
+            path = os.path.join(directory, f"{i}-{side}.wav")
+            with open(path, 'wb') as f:
+                f.write(data)
+                if sync:
+                    os.fsync(f.fileno())
+            pair.append(path)
+        paths.append(pair)
+    return paths
+
+
+def touch(view) -> int:
+    # Reads one byte per page, so the mapping is really faulted in
+    return sum(view[offset] for offset in range(0, len(view), PAGE))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=10.0, help="caller's side; the reply is 80%% of it")
+    parser.add_argument('--repeat', type=float, default=0.1)
+    parser.add_argument('--reads', type=int, default=2000)
+    parser.add_argument('--segment-mb', type=int, default=64)
+    args = parser.parse_args()
+    random.seed(0)
+    calls = make_calls(args.calls, args.seconds, args.repeat)
+    audio_hours = args.calls * args.seconds * 1.8 / 3600
+    settings = replace(ArchiveSettings.from_env(), segment_bytes=args.segment_mb * 1024 * 1024)
+    print(f"{args.calls} calls, {args.seconds:g}s + {args.seconds * 0.8:g}s each, {args.repeat:.0%} repeated; "
+          f"clips {'encoded to Opus ' + settings.bitrate if HAS_FFMPEG else 'stored as uploaded (no ffmpeg)'}\n")
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'write':<26} {'calls/s':>8} {'MB/s in':>8}")
+        raw_mb = sum(len(caller) + len(reply) for caller, reply in calls) / 1e6
+        results = {}
+        for sync in (False, True):
+            name = f"{'fsync' if sync else 'no-sync'}"
+            start = time.perf_counter()
+            paths = write_files(os.path.join(directory, f"files-{name}"), calls, sync)
+            elapsed = time.perf_counter() - start
+            print(f"{'file per clip, ' + name:<26} {len(calls) / elapsed:>8.0f} {raw_mb / elapsed:>8.1f}")
+            archive = AudioArchive(os.path.join(directory, f"archive-{name}"), replace(settings, sync=sync))
+            start = time.perf_counter()
+            refs = [archive.put(caller, reply, 'call.wav') for caller, reply in calls]
+            elapsed = time.perf_counter() - start
+            print(f"{'archive, ' + name:<26} {len(calls) / elapsed:>8.0f} {raw_mb / elapsed:>8.1f}")
+            results[sync] = (archive, refs, paths)
+
+        archive, refs, paths = results[True]
+        picks = [random.randrange(len(refs)) for _ in range(args.reads)]
+        print(f"\n{'read a random call':<26} {'p50 us':>8} {'p95 us':>8}")
+        timings = []
+        for i in picks:
+            start = time.perf_counter()
+            for path in paths[i]:
+                with open(path, 'rb') as f:
+                    touch(memoryview(f.read()))
+            timings.append(time.perf_counter() - start)
+        print(f"{'file per clip':<26} {percentile(timings, 0.5):>8.0f} {percentile(timings, 0.95):>8.0f}")
+        timings = []
+        for i in picks:
+            start = time.perf_counter()
+            recording = archive.recording(refs[i])
+            touch(recording.caller.data)
+            touch(recording.response.data)
+            timings.append(time.perf_counter() - start)
+        print(f"{'archive (mmap slices)':<26} {percentile(timings, 0.5):>8.0f} {percentile(timings, 0.95):>8.0f}")
+
+        files = disk_bytes(os.path.join(directory, 'files-fsync'))
+        stored = disk_bytes(archive.directory)
+        stats = archive.stats()
+        print(f"\n{'storage':<26} {'MB':>8} {'MB/call h':>10}")
+        print(f"{'file per clip':<26} {files / 1e6:>8.1f} {files / 1e6 / audio_hours:>10.0f}")
+        print(f"{'archive':<26} {stored / 1e6:>8.1f} {stored / 1e6 / audio_hours:>10.0f}   "
+              f"({stats.clips} clips for {stats.recordings} calls in {stats.segments} segment(s))")
+
+        # Half the calls fall out of the retention period
+        cutoff = time.time() - settings.retention_days * 86400 - 1
+        expired_ids = [int(ref.split(':')[1]) for ref in refs[:len(refs) // 2]]
+        archive._conn.executemany('UPDATE recordings SET created = ? WHERE id = ?', [(cutoff, i) for i in expired_ids])
+        start = time.perf_counter()
+        expired, removed, freed = archive.maintain()
+        elapsed = time.perf_counter() - start
+        left = archive.stats()
+        print(f"\nretention: {expired} calls expired; compaction removed {removed} segment(s) and freed "
+              f"{freed / 1e6:.1f} MB in {elapsed:.2f}s; {left.bytes / 1e6:.1f} MB left, {left.live_bytes / 1e6:.1f} MB live")
+        if not removed:
+            print("(nothing to compact: the calls fit in the open segment; try a smaller --segment-mb)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Per-call disk I/O and latency: the old temp-file flow versus in-memory buffers.
+
+The "tempfile" flow reproduces what voice_app.py used to do on every call:
+write the upload to a NamedTemporaryFile, reopen it for Whisper, write the
+TTS reply to a second temp file and read it back twice for playback and
+download. File traffic is taken from /proc/self/io (Linux) read/write
+counters, so it includes page-cache writes the block device may never see.
+
+    python benchmarks/bench_audio_io.py --sessions 1 8 32 --upload-kb 2048
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI
+from call_processor import CallConfig, CallProcessor
+from pipeline import join_audio
+
+
+def file_io():
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['wchar']), int(fields['rchar'])
+    except OSError:
+        return 0, 0
+
+
+async def tempfile_call(processor, upload, config):
+    client = processor.client
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp:
+        tmp.write(upload)
+        tmp_path = tmp.name
+    with open(tmp_path, 'rb') as audio:
+        transcript = await client.audio.transcriptions.create(model="whisper-1", file=audio, response_format="text")
+    os.unlink(tmp_path)
+
+    chunks = [chunk async for chunk in processor.stream_response(transcript, config)]
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as audio_tmp:
+        audio_tmp.write(join_audio(chunks))
+        audio_response_path = audio_tmp.name
+    for _ in ('play', 'download'):
+        with open(audio_response_path, 'rb') as f:
+            f.read()
+    os.unlink(audio_response_path)
+
+
+async def in_memory_call(processor, upload, config):
+    await processor.process(memoryview(upload), config, filename='call.wav')
+
+
+async def measure(call, processor, upload, sessions, calls_per_session):
+    config = CallConfig()
+    latencies = []
+
+    async def session():
+        for _ in range(calls_per_session):
+            start = time.perf_counter()
+            await call(processor, upload, config)
+            latencies.append(time.perf_counter() - start)
+
+    wchar, rchar = file_io()
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    wchar_after, rchar_after = file_io()
+    calls = sessions * calls_per_session
+    return latencies, (wchar_after - wchar) / calls, (rchar_after - rchar) / calls
+
+
+async def run(levels, upload_kb, calls_per_session):
+    upload = b'RIFF' + os.urandom(upload_kb * 1024)
+    fast = dict(stt_delay=0.05, llm_first_token_delay=0.05, llm_token_delay=0.002, tts_base_delay=0.03)
+    with FakeOpenAI(**fast) as server:
+        processor = CallProcessor.from_api_key('test', base_url=server.base_url)
+        print(f"{'flow':<10} {'sessions':>8} {'p50 ms':>8} {'p95 ms':>8} {'written/call':>14} {'read/call':>12}")
+        for sessions in levels:
+            for name, call in (('tempfile', tempfile_call), ('in-memory', in_memory_call)):
+                latencies, written, read = await measure(call, processor, upload, sessions, calls_per_session)
+                ms = sorted(l * 1000 for l in latencies)
+                print(f"{name:<10} {sessions:>8} {statistics.median(ms):>8.0f} {ms[min(len(ms) - 1, int(len(ms) * 0.95))]:>8.0f} "
+                      f"{written / 1024:>11.0f} KB {read / 1024:>9.0f} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--upload-kb', type=int, default=2048)
+    parser.add_argument('--calls', type=int, default=3, help='calls per session')
+    args = parser.parse_args()
+    asyncio.run(run(args.sessions, args.upload_kb, args.calls))
+
+
+if __name__ == '__main__':
+    main()
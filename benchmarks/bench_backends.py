@@ -0,0 +1,156 @@
+"""Speech backends on this CPU against the remote path: latency and real-time factor.
+
+Each transcription backend transcribes phone turns (8 kHz μ-law WAV, what the
+gateway sends) of each --seconds length; each speech backend voices the
+sentences of a typical reply as 24 kHz PCM. Real-time factor (RTF) is
+processing time over audio length, so under 1.0 is faster than real time;
+'RTF xN' is the same with --concurrency requests at once, where local models
+share the CPU.
+
+'openai' runs against the fake server, whose delays stand in for the network
+and the API; --live uses the real API with $OPENAI_API_KEY instead. 'load' is
+the model load the warm pool pays once per process, not per call. A local
+backend whose package or model isn't available is skipped with the reason.
+
+Synthetic turns aren't speech, so faster-whisper's VAD filter is off for them;
+--audio DIR transcribes real WAV recordings (16-bit PCM) with it on.
+
+    python benchmarks/bench_backends.py --stt openai faster-whisper:tiny.en faster-whisper:base.en \\
+        --tts openai piper:en_US-lessac-medium --seconds 2 5 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from dataclasses import replace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import LocalSpeechSettings, ModelPool, speech_to_text, text_to_speech
+from benchmarks.fake_openai import DEFAULT_REPLY, FakeOpenAI
+from benchmarks.fake_twilio import load_recordings, synthetic_utterance
+from clients import PoolSettings, build_client
+from pipeline import split_sentences
+from telephony import SAMPLE_RATE, TTS_SAMPLE_RATE, ulaw_wav
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def load(backend):
+    if backend.remote:
+        return None
+    start = time.perf_counter()
+    await asyncio.to_thread(backend.load)
+    return time.perf_counter() - start
+
+
+def label(backend):
+    return f"openai:{backend.model}" if backend.remote else backend.model
+
+
+def fmt_load(seconds):
+    return f"{seconds:.1f}s" if seconds is not None else '—'
+
+
+async def bench_stt(backend, turns, repeats, concurrency):
+    """Rows of (audio seconds, p50, p95, RTF, RTF under concurrency) per turn length."""
+    await backend.transcribe(turns[0][1], 'warmup.wav')
+    rows = []
+    for seconds, audio in turns:
+        latencies = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            await backend.transcribe(audio, 'turn.wav')
+            latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        await asyncio.gather(*(backend.transcribe(audio, 'turn.wav') for _ in range(concurrency)))
+        parallel_rtf = (time.perf_counter() - start) / (seconds * concurrency)
+        p50 = percentile(latencies, 0.5)
+        rows.append((seconds, p50, percentile(latencies, 0.95), p50 / seconds, parallel_rtf))
+    return rows
+
+
+async def bench_tts(backend, sentences, repeats, concurrency):
+    """(p50 and p95 per sentence, RTF, RTF under concurrency) over the reply's sentences."""
+    await backend.synthesize(sentences[0], 'nova', response_format='pcm')
+    latencies, spoken, busy = [], 0.0, 0.0
+    for _ in range(repeats):
+        for sentence in sentences:
+            start = time.perf_counter()
+            audio = await backend.synthesize(sentence, 'nova', response_format='pcm')
+            latencies.append(time.perf_counter() - start)
+            busy += latencies[-1]
+            spoken += len(audio) / 2 / TTS_SAMPLE_RATE
+    start = time.perf_counter()
+    clips = await asyncio.gather(*(backend.synthesize(sentence, 'nova', response_format='pcm')
+                                   for sentence in sentences * concurrency))
+    parallel_rtf = (time.perf_counter() - start) / (sum(len(clip) for clip in clips) / 2 / TTS_SAMPLE_RATE)
+    return percentile(latencies, 0.5), percentile(latencies, 0.95), busy / spoken, parallel_rtf
+
+
+async def run(args, base_url, api_key):
+    client, _ = build_client(api_key, PoolSettings(), base_url=base_url)
+    settings = LocalSpeechSettings.from_env()
+    if args.audio:
+        recordings = load_recordings(args.audio)
+        turns = [(len(r) / SAMPLE_RATE, ulaw_wav(r)) for r in recordings]
+    else:
+        settings = replace(settings, whisper_vad_filter=False)
+        turns = [(seconds, ulaw_wav(synthetic_utterance(seconds, seed=i))) for i, seconds in enumerate(args.seconds)]
+    pool = ModelPool(settings)
+    xn = f"RTF x{args.concurrency}"
+
+    print(f"{'transcription':<26} {'load':>6} {'audio':>6} {'p50 ms':>8} {'p95 ms':>8} {'RTF':>6} {xn:>8}")
+    for spec in args.stt:
+        try:
+            backend = speech_to_text(spec, client, pool=pool)
+            load_seconds = await load(backend)
+            rows = await bench_stt(backend, turns, args.repeats, args.concurrency)
+        except Exception as e:
+            print(f"{spec:<26} skipped: {str(e).splitlines()[0][:90]}")
+            continue
+        for i, (seconds, p50, p95, rtf, parallel_rtf) in enumerate(rows):
+            name, loaded = (label(backend), fmt_load(load_seconds)) if i == 0 else ('', '')
+            print(f"{name:<26} {loaded:>6} {seconds:>5.1f}s {p50 * 1000:>8.0f} {p95 * 1000:>8.0f} "
+                  f"{rtf:>6.2f} {parallel_rtf:>8.2f}")
+
+    sentences = list(split_sentences([DEFAULT_REPLY]))
+    print(f"\n{'speech (per sentence)':<26} {'load':>6} {'p50 ms':>8} {'p95 ms':>8} {'RTF':>6} {xn:>8}")
+    for spec in args.tts:
+        try:
+            backend = text_to_speech(spec, client, pool=pool)
+            load_seconds = await load(backend)
+            p50, p95, rtf, parallel_rtf = await bench_tts(backend, sentences, args.repeats, args.concurrency)
+        except Exception as e:
+            print(f"{spec:<26} skipped: {str(e).splitlines()[0][:90]}")
+            continue
+        print(f"{label(backend):<26} {fmt_load(load_seconds):>6} {p50 * 1000:>8.0f} {p95 * 1000:>8.0f} "
+              f"{rtf:>6.2f} {parallel_rtf:>8.2f}")
+    await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stt', nargs='+', default=['openai', 'faster-whisper:tiny.en', 'faster-whisper:base.en'])
+    parser.add_argument('--tts', nargs='+', default=['openai', 'piper:en_US-lessac-medium'])
+    parser.add_argument('--seconds', type=float, nargs='+', default=[2, 5, 10], help='synthetic turn lengths')
+    parser.add_argument('--audio', help='directory of WAV recordings to transcribe instead')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--live', action='store_true', help='time the real API ($OPENAI_API_KEY) as the remote path')
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPU(s); remote path: {'OpenAI API' if args.live else 'fake server'}\n")
+    if args.live:
+        asyncio.run(run(args, None, os.environ['OPENAI_API_KEY']))
+        return
+    with FakeOpenAI() as server:
+        asyncio.run(run(args, server.base_url, 'test'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""End-to-end calls at each Response Length and Speech Speed: tokens, audio seconds and latency.
+
+Every call is transcribed, answered and synthesized through one CallProcessor
+against the fake OpenAI server, whose model ignores the length asked for in the
+prompt and rambles on for --reply-words words unless it is stopped. That is the
+case the generation budget (budget.py) is there for: max_tokens ends the
+completion, and the spoken cap closes it after the last sentence that fits, so
+shorter settings generate, synthesize and play less.
+
+  tokens     completion tokens the server sent before the stream ended
+  words      words the caller hears
+  audio s    playback length of the reply (24 kHz PCM, slower or faster with speed)
+
+    python benchmarks/bench_budget.py --calls 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI
+from budget import LENGTH_WORDS
+from call_processor import CallConfig, CallProcessor, generation_budget
+from clients import PoolSettings, build_client
+
+SENTENCES = [
+    "Hello! Thank you for calling Acme Plumbing.",
+    "We are open from 9 AM to 9 PM, Monday to Saturday, and we take emergency calls on Sundays too.",
+    "Our technicians handle leaking pipes, blocked drains, water heaters and full bathroom refits.",
+    "We usually have someone at your door within a day of your call, often the same afternoon.",
+    "A standard visit is eighty dollars, which covers the first hour of work on site.",
+    "We always give you a written quote before starting anything bigger, so there are no surprises.",
+    "All of our repairs come with a twelve month warranty on both parts and labour.",
+]
+CLOSING = "Is there anything else I can help you with today? Feel free to call us at +1234567890. Have a great day!"
+PCM_BYTES_PER_SECOND = 24000 * 2
+
+
+def rambling_reply(words: int) -> str:
+    body, count = [], 0
+    while count < words:
+        sentence = SENTENCES[1 + len(body) % (len(SENTENCES) - 1)]
+        body.append(sentence)
+        count += len(sentence.split())
+    return " ".join([SENTENCES[0], *body, CLOSING])
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+
+async def run(server, calls, speeds):
+    client, _ = build_client('test', PoolSettings(), base_url=server.base_url)
+    processor = CallProcessor(client)
+    await processor.process(b'ID3' + bytes(4096), CallConfig(audio_format='pcm'))  # warm the connection pool
+
+    print(f"{'response length':<16} {'speed':>5} {'max tokens':>10} {'tokens':>7} {'words':>6} {'audio s':>8} "
+          f"{'first audio p50 ms':>19} {'call p50/p95 ms':>17}")
+    for length in LENGTH_WORDS:
+        for speed in speeds:
+            config = CallConfig(business_name="Acme Plumbing", response_length=length, speed=speed,
+                                audio_format='pcm')
+            tokens, words, seconds, firsts, totals = [], [], [], [], []
+            for _ in range(calls):
+                sent = len(server.completion_tokens)
+                result = await processor.process(b'ID3' + bytes(4096), config)
+                await asyncio.sleep(0.05)  # let the server notice a closed stream
+                tokens.append(sum(server.completion_tokens[sent:]))
+                words.append(len(result.ai_response.split()))
+                seconds.append(len(result.audio) / PCM_BYTES_PER_SECOND)
+                firsts.append(result.timings['first_audio'])
+                totals.append(result.timings['total'])
+            print(f"{length:<16} {speed:>5.1f} {generation_budget(config).max_tokens:>10} "
+                  f"{statistics.mean(tokens):>7.0f} {statistics.mean(words):>6.0f} {statistics.mean(seconds):>8.1f} "
+                  f"{percentile(firsts, 0.5):>19.0f} {percentile(totals, 0.5):>8.0f} / {percentile(totals, 0.95):<7.0f}")
+    await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=10)
+    parser.add_argument('--reply-words', type=int, default=300)
+    parser.add_argument('--speeds', type=float, nargs='+', default=[1.0, 1.5])
+    args = parser.parse_args()
+    with FakeOpenAI(reply=rambling_reply(args.reply_words), stt_delay=0.1) as server:
+        asyncio.run(run(server, args.calls, args.speeds))
+
+
+if __name__ == '__main__':
+    main()
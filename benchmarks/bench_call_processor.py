@@ -0,0 +1,55 @@
+"""Load test: calls per second through one CallProcessor as concurrency grows.
+
+    python benchmarks/bench_call_processor.py --concurrency 1 4 16 64
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI
+from call_processor import CallConfig, CallProcessor
+
+AUDIO = b'RIFF' + b'\x00' * 64_000
+
+
+async def load(processor, concurrency, calls):
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one_call():
+        async with slots:
+            result = await processor.process(AUDIO, CallConfig(), filename='call.wav')
+            latencies.append(result.timings['total'])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_call() for _ in range(calls)))
+    return calls / (time.perf_counter() - start), latencies
+
+
+async def run(levels, calls_per_level):
+    with FakeOpenAI() as server:
+        processor = CallProcessor.from_api_key('test', base_url=server.base_url)
+        print(f"{'concurrency':>11}  {'calls/s':>8}  {'p50 ms':>8}  {'max ms':>8}")
+        for concurrency in levels:
+            calls = max(calls_per_level, concurrency * 2)
+            rate, latencies = await load(processor, concurrency, calls)
+            print(f"{concurrency:>11}  {rate:>8.2f}  {statistics.median(latencies) * 1000:>8.0f}  "
+                  f"{max(latencies) * 1000:>8.0f}")
+        await processor.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--calls', type=int, default=8, help='minimum calls per concurrency level')
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.calls))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Call store at scale: batched insert throughput, page loads and full-text search.
+
+    python benchmarks/bench_call_store.py --calls 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from call_store import CallStore
+
+QUESTIONS = [
+    "What are your business hours?", "How can I contact you?", "Are you open on weekends?",
+    "I need to reschedule my appointment", "Do you offer refunds on damaged items?",
+    "Can someone call me back about my invoice?", "Where is your nearest location?",
+]
+ANSWERS = [
+    "Hello! Thank you for calling. We are open 9 AM to 9 PM, Monday to Saturday.",
+    "Thanks for calling! Someone from our team will call you back shortly.",
+    "Hello! You can reach us at +1234567890. Have a great day!",
+]
+
+
+def synthetic_calls(n):
+    start = datetime(2025, 1, 1)
+    for i in range(n):
+        yield {
+            'timestamp': (start + timedelta(minutes=7 * i)).strftime('%Y-%m-%d %H:%M:%S'),
+            'customer_message': f"{random.choice(QUESTIONS)} ref {i}",
+            'ai_response': random.choice(ANSWERS),
+            'duration': 'N/A'
+        }
+
+
+def timed(fn, repeat=20):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CallStore(os.path.join(tmp, 'calls.db'))
+        start = time.perf_counter()
+        for record in synthetic_calls(args.calls):
+            store.add(record)
+        store.flush()
+        elapsed = time.perf_counter() - start
+        print(f"insert      {args.calls} calls in {elapsed:.2f}s  ({args.calls / elapsed:,.0f} calls/s)")
+
+        total = store.count()
+        last_page = (total - 1) // 20
+        print(f"count       {timed(store.count):8.2f} ms")
+        print(f"first page  {timed(lambda: store.page(0)):8.2f} ms")
+        print(f"page 500    {timed(lambda: store.page(500)):8.2f} ms")
+        print(f"last page   {timed(lambda: store.page(last_page)):8.2f} ms")
+        print(f"search 'refunds' (common)      {timed(lambda: store.search('refunds')):8.2f} ms")
+        print(f"search 'ref {total // 2}' (rare)  {timed(lambda: store.search(f'ref {total // 2}')):8.2f} ms")
+        print(f"search count 'weekends'        {timed(lambda: store.search_count('weekends')):8.2f} ms")
+        print(f"db size     {os.path.getsize(store.path) / 1e6:.1f} MB")
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
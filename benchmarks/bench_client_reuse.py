@@ -0,0 +1,70 @@
+"""Per-call latency with a fresh OpenAI client per call versus the pooled registry client.
+
+The fake server charges ``--connect-ms`` on every new connection to stand in for
+the TLS handshake a real api.openai.com connection costs.
+
+    python benchmarks/bench_client_reuse.py --calls 20 --connect-ms 60
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI
+from call_processor import CallConfig, CallProcessor
+from clients import PoolSettings, build_client, get_client, pool_stats
+
+AUDIO = b'RIFF' + b'\x00' * 64_000
+
+
+async def fresh_client_per_call(server, calls):
+    latencies = []
+    for _ in range(calls):
+        client, _ = build_client('test', PoolSettings(), base_url=server.base_url)
+        start = time.perf_counter()
+        await CallProcessor(client).process(AUDIO, CallConfig())
+        latencies.append(time.perf_counter() - start)
+        await client.close()
+    return latencies
+
+
+async def pooled_client(server, calls):
+    processor = CallProcessor(get_client('test', base_url=server.base_url))
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await processor.process(AUDIO, CallConfig())
+        latencies.append(time.perf_counter() - start)
+    return latencies, pool_stats(processor.client)
+
+
+def report(name, latencies, connections):
+    ms = sorted(l * 1000 for l in latencies)
+    print(f"{name:<8} p50 {statistics.median(ms):7.1f} ms   p95 {ms[min(len(ms) - 1, int(len(ms) * 0.95))]:7.1f} ms   "
+          f"connections opened {connections}")
+
+
+async def run(calls, connect_ms):
+    fast = dict(stt_delay=0.05, llm_first_token_delay=0.05, llm_token_delay=0.002, tts_base_delay=0.03)
+    with FakeOpenAI(connect_delay=connect_ms / 1000, **fast) as server:
+        report('fresh', await fresh_client_per_call(server, calls), server.connections)
+    with FakeOpenAI(connect_delay=connect_ms / 1000, **fast) as server:
+        latencies, stats = await pooled_client(server, calls)
+        report('pooled', latencies, server.connections)
+        print(f"pool stats: {stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=20)
+    parser.add_argument('--connect-ms', type=float, default=60.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.calls, args.connect_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Export throughput and peak RSS for 1M synthetic call records.
+
+Each format runs in a fresh process so its peak RSS is its own. "json (old)"
+is the previous approach: the whole history as a list, json.dumps(indent=2).
+
+    python benchmarks/bench_export.py --records 100000 1000000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from export import available_formats, export_records
+
+
+def synthetic_calls(n):
+    for i in range(n):
+        yield {
+            'id': i + 1,
+            'timestamp': f"2025-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00",
+            'customer_message': f"Hi, what are your business hours on weekends? This is caller {i}.",
+            'ai_response': "Hello! Thank you for calling My Business. We are open 9 AM - 9 PM, Monday to "
+                           "Saturday. Is there anything else I can help you with today? Have a great day!",
+            'duration': 'N/A',
+            'audio_ref': f"seg-{i // 10_000:05d}:{i * 4096}:4096",
+        }
+
+
+def run_format(fmt, records, results):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryFile() as out:
+        start = time.perf_counter()
+        if fmt == 'json (old)':
+            out.write(json.dumps(list(synthetic_calls(records)), indent=2).encode())
+        else:
+            export_records(synthetic_calls(records), fmt, out, include_audio=True)
+        elapsed = time.perf_counter() - start
+        size = out.tell()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((elapsed, size, baseline / 1024, peak / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, nargs='+', default=[1_000_000])
+    parser.add_argument('--skip-old', action='store_true', help="don't run the in-memory json.dumps baseline")
+    args = parser.parse_args()
+
+    formats = available_formats() + ([] if args.skip_old else ['json (old)'])
+    print(f"{'format':<11} {'records':>9} {'seconds':>8} {'records/s':>10} {'size MB':>8} {'peak RSS MB':>12} {'growth MB':>10}")
+    for records in args.records:
+        for fmt in formats:
+            results = multiprocessing.Queue()
+            child = multiprocessing.Process(target=run_format, args=(fmt, records, results))
+            child.start()
+            elapsed, size, baseline, peak = results.get()
+            child.join()
+            print(f"{fmt:<11} {records:>9} {elapsed:>8.2f} {records / elapsed:>10,.0f} {size / 1e6:>8.1f} "
+                  f"{peak:>12.0f} {peak - baseline:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Call job queue: throughput by worker count, and recovery with workers killed mid-job.
+
+Calls are submitted to a JobQueue in a temporary directory and answered by a
+JobRunner's worker processes against the fake OpenAI server.
+
+  throughput  --jobs calls with 1, 2 and 4 worker processes: calls/min and
+              submit-to-answered latency
+  recovery    the same calls while a random worker is SIGKILLed every
+              --kill-every seconds. Recovery time runs from the kill until
+              each of its jobs is taken up by another worker. Redone requests
+              are what the fake server saw beyond one pass of every stage:
+              work lost with the worker, the rest came from checkpoints.
+
+    python benchmarks/bench_jobs.py --jobs 40 --kill-every 1.5
+"""
+import argparse
+import os
+import random
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI
+from call_processor import CallConfig, CallProcessor
+from clients import PoolSettings, build_client
+from jobs import JobQueue, JobRunner, JobSettings
+from pipeline import split_sentences
+
+TRANSCRIPT = "Do you fix tankless water heaters in older houses?"
+
+
+def plain_processor(api_key, base_url):
+    # No caches, so every job does every stage
+    client, _ = build_client(api_key, PoolSettings(), base_url=base_url)
+    return CallProcessor(client)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float('nan')
+
+
+def start_runner(server, directory, workers, lease):
+    queue = JobQueue(os.path.join(directory, f"jobs-{workers}-{time.monotonic_ns()}.db"),
+                     JobSettings(workers=workers, lease=lease))
+    finished = []
+    runner = JobRunner(queue, 'test', base_url=server.base_url, factory=plain_processor, on_done=finished.append)
+    runner.start()
+    # Workers take a moment to spawn and import; don't count that against the queue
+    runner.submit(b'warm-up', 'warm.mp3', CallConfig())
+    while not finished:
+        time.sleep(0.05)
+    finished.clear()
+    return queue, runner, finished
+
+
+def submit_all(runner, jobs):
+    return [runner.submit(os.urandom(4096), 'call.mp3', CallConfig()) for _ in range(jobs)]
+
+
+def wait(finished, count, timeout=600):
+    deadline = time.monotonic() + timeout
+    while len(finished) < count and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def throughput(server, directory, jobs, lease):
+    print(f"{'workers':>7} {'calls/min':>10} {'latency p50/p95 s':>18}")
+    for workers in (1, 2, 4):
+        queue, runner, finished = start_runner(server, directory, workers, lease)
+        start = time.perf_counter()
+        submit_all(runner, jobs)
+        wait(finished, jobs)
+        elapsed = time.perf_counter() - start
+        latencies = [job.updated - job.created for job in finished]
+        print(f"{workers:>7} {len(finished) / elapsed * 60:>10.0f} "
+              f"{percentile(latencies, 0.5):>8.2f} / {percentile(latencies, 0.95):<7.2f}")
+        runner.stop()
+
+
+def recovery(server, directory, jobs, lease, kill_every, workers=2):
+    queue, runner, finished = start_runner(server, directory, workers, lease)
+    before = dict(server.request_counts)
+    recoveries, kills = [], 0
+    stop = threading.Event()
+
+    def kill_loop():
+        nonlocal kills
+        while not stop.wait(kill_every):
+            process = random.choice(runner.processes)
+            held = [job_id for (job_id,) in queue._conn.execute(
+                "SELECT id FROM jobs WHERE worker = ? AND state = 'running'", (process.pid,)).fetchall()]
+            killed = time.perf_counter()
+            try:
+                os.kill(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                continue
+            kills += 1
+            for job_id in held:
+                # Recovered once another worker holds the job, or it has finished
+                while not stop.is_set():
+                    job = queue.get(job_id)
+                    if job.finished or job.worker not in (None, process.pid):
+                        recoveries.append(time.perf_counter() - killed)
+                        break
+                    time.sleep(0.01)
+
+    start = time.perf_counter()
+    submit_all(runner, jobs)
+    killer = threading.Thread(target=kill_loop, daemon=True)
+    killer.start()
+    wait(finished, jobs)
+    stop.set()
+    killer.join()
+    elapsed = time.perf_counter() - start
+    runner.stop()
+
+    sentences = len(list(split_sentences([server.reply])))
+    sent = {route.rsplit('/', 1)[-1]: count - before.get(route, 0) for route, count in server.request_counts.items()}
+    done = sum(job.state == 'done' for job in finished)
+    print(f"\n{workers} workers, one killed every {kill_every:g}s: {kills} kills, {runner.stats.restarts} restarts, "
+          f"{runner.stats.released} jobs handed back")
+    print(f"{done} answered, {len(finished) - done} failed, {jobs - len(finished)} lost "
+          f"in {elapsed:.1f}s ({len(finished) / elapsed * 60:.0f} calls/min)")
+    if recoveries:
+        print(f"recovery p50 {percentile(recoveries, 0.5) * 1000:.0f} ms, p95 {percentile(recoveries, 0.95) * 1000:.0f} ms, "
+              f"max {max(recoveries) * 1000:.0f} ms over {len(recoveries)} interrupted jobs")
+    print(f"redone requests: {sent.get('transcriptions', 0) - jobs} transcriptions, "
+          f"{sent.get('completions', 0) - jobs} completions, {sent.get('speech', 0) - jobs * sentences} sentences "
+          f"(of {jobs}, {jobs}, {jobs * sentences})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=40)
+    parser.add_argument('--kill-every', type=float, default=1.5)
+    parser.add_argument('--lease', type=float, default=30.0)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory, FakeOpenAI(transcript=TRANSCRIPT) as server:
+        os.environ['VOICE_DATA_DIR'] = directory  # workers keep their call history here
+        throughput(server, directory, args.jobs, args.lease)
+        recovery(server, directory, args.jobs, args.lease, args.kill_every)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Cost of leaving instrumentation on: per-record overhead and calls/s with metrics on vs off.
+
+The fake OpenAI server answers instantly, so the calls/s comparison is
+dominated by client-side work and any metrics overhead shows up in full;
+against the real API it is a far smaller share. Rounds alternate on/off so
+drift on a busy machine affects both sides alike.
+
+    python benchmarks/bench_metrics.py --calls 200 --concurrency 20 --rounds 3
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI
+from call_processor import CallConfig, CallProcessor
+from metrics import METRICS, call_scope, otel_trace, span
+from telephony import ulaw_wav
+
+TURN = ulaw_wav(b'\xff' * 16000)  # two seconds of 8 kHz μ-law
+
+
+def per_record(n=200_000):
+    results = {}
+    start = time.perf_counter()
+    for _ in range(n):
+        METRICS.observe('stt', 0.3)
+    results['observe'] = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    for _ in range(n):
+        with span('render'):
+            pass
+    results['span'] = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    for _ in range(n):
+        METRICS.add_usage('gpt-4o', input_tokens=200, cached_tokens=0, output_tokens=40)
+    results['add_usage'] = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    for _ in range(100):
+        METRICS.render()
+    results['render /metrics'] = (time.perf_counter() - start) / 100
+    return results
+
+
+async def throughput(processor, calls, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with slots:
+            with call_scope():
+                await processor.process(TURN, CallConfig(), filename='turn.wav')
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    return calls / (time.perf_counter() - start)
+
+
+async def compare(server, calls, concurrency, rounds):
+    processor = CallProcessor.from_api_key('test', base_url=server.base_url)
+    await throughput(processor, concurrency, concurrency)  # warm the connection pool
+    rates = {True: [], False: []}
+    for _ in range(rounds):
+        for enabled in (False, True):
+            METRICS.enabled = enabled
+            rates[enabled].append(await throughput(processor, calls, concurrency))
+    METRICS.enabled = True
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"OpenTelemetry: {'installed' if otel_trace is not None else 'not installed'}")
+    for name, seconds in per_record().items():
+        print(f"{name:<16} {seconds * 1e6:>9.2f} us")
+
+    with FakeOpenAI(stt_delay=0, llm_first_token_delay=0, llm_token_delay=0, tts_base_delay=0,
+                    tts_char_delay=0) as server:
+        rates = asyncio.run(compare(server, args.calls, args.concurrency, args.rounds))
+    off, on = max(rates[False]), max(rates[True])
+    print(f"\n{'metrics':<8} {'calls/s (best of ' + str(args.rounds) + ')':>22}")
+    print(f"{'off':<8} {off:>22.1f}")
+    print(f"{'on':<8} {on:>22.1f}")
+    print(f"overhead {(off - on) / off:>21.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Perceived reply latency with and without pre-rendered greeting and filler clips.
+
+Answers --turns questions through one CallProcessor against the fake OpenAI
+server, once with no phrase bank and once with the set rendered up front, and
+times from the transcript to:
+
+  first audio     the first clip a caller hears: the answer's first sentence, or
+                  a recorded greeting (first turn) or filler (later turns)
+  answer audio    the first sentence of the answer itself
+
+Every question is new and matches no intent, so every answer waits for the model.
+
+    python benchmarks/bench_phrases.py --turns 30
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI
+from call_processor import CallConfig, CallProcessor
+from clients import PoolSettings, build_client
+from phrases import BOOKENDS, PhraseBank
+
+REPLY = "We are open from 9 AM to 9 PM, Monday to Saturday, and walk-ins are welcome."
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+
+async def reply_timings(processor, config, turn):
+    start = time.perf_counter()
+    first = answer = None
+    async for chunk in processor.stream_response(f"question {time.perf_counter()}", config, turn=turn):
+        elapsed = time.perf_counter() - start
+        first = first if first is not None else elapsed
+        if answer is None and chunk.source not in BOOKENDS:
+            answer = elapsed
+    return first, answer
+
+
+async def run(server, turns):
+    client, _ = build_client('test', PoolSettings(), base_url=server.base_url)
+    config = CallConfig(business_name="Acme Plumbing")
+    plain = CallProcessor(client)
+    bank = PhraseBank()
+    bookended = CallProcessor(client, phrases=bank)
+    start = time.perf_counter()
+    await bank.render(bookended.synthesize, config)
+    print(f"phrase set rendered in {(time.perf_counter() - start) * 1000:.0f} ms (in the background, once per settings)\n")
+
+    await reply_timings(plain, config, 1)  # warm the connection pool
+    rows = []
+    for label, processor, turn in (('no phrases', plain, 1), ('greeting (turn 1)', bookended, 1),
+                                   ('filler (turn 2+)', bookended, 2)):
+        firsts, answers = [], []
+        for _ in range(turns):
+            first, answer = await reply_timings(processor, config, turn)
+            firsts.append(first)
+            answers.append(answer)
+        rows.append((label, firsts, answers))
+
+    print(f"{'reply':<18} {'first audio p50/p95 ms':>24} {'answer audio p50/p95 ms':>25} {'masked p50 ms':>14}")
+    for label, firsts, answers in rows:
+        print(f"{label:<18} {percentile(firsts, 0.5):>11.0f} / {percentile(firsts, 0.95):<10.0f} "
+              f"{percentile(answers, 0.5):>12.0f} / {percentile(answers, 0.95):<10.0f} "
+              f"{percentile(answers, 0.5) - percentile(firsts, 0.5):>14.0f}")
+    await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=30)
+    args = parser.parse_args()
+    with FakeOpenAI(reply=REPLY) as server:
+        asyncio.run(run(server, args.turns))
+
+
+if __name__ == '__main__':
+    main()
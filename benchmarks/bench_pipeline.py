@@ -0,0 +1,65 @@
+"""Time-to-first-audio-byte: sequential chat -> TTS versus the sentence pipeline.
+
+    python benchmarks/bench_pipeline.py --runs 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import AsyncOpenAI
+
+from benchmarks.fake_openai import FakeOpenAI
+from pipeline import stream_voice_response
+
+MESSAGES = [
+    {"role": "system", "content": "You are a professional phone answering assistant."},
+    {"role": "user", "content": "What are your business hours?"}
+]
+
+
+async def sequential(client):
+    start = time.perf_counter()
+    response = await client.chat.completions.create(model="gpt-4o", messages=MESSAGES, temperature=0.7, max_tokens=300)
+    await client.audio.speech.create(model="tts-1", voice="nova", input=response.choices[0].message.content, speed=1.0)
+    first = time.perf_counter() - start
+    return first, first
+
+
+async def pipelined(client):
+    start = time.perf_counter()
+    first = None
+    async for chunk in stream_voice_response(client, MESSAGES, "nova"):
+        if first is None and chunk.audio:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def report(name, samples):
+    firsts = [s[0] * 1000 for s in samples]
+    totals = [s[1] * 1000 for s in samples]
+    print(f"{name:<12} first audio byte p50 {statistics.median(firsts):7.1f} ms   "
+          f"complete p50 {statistics.median(totals):7.1f} ms")
+
+
+async def run(runs):
+    with FakeOpenAI() as server:
+        client = AsyncOpenAI(api_key='test', base_url=server.base_url)
+        report('before', [await sequential(client) for _ in range(runs)])
+        report('after', [await pipelined(client) for _ in range(runs)])
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Whisper upload size and STT latency with and without client-side preprocessing.
+
+Synthesizes stereo 44.1 kHz WAV "voicemails" (tone bursts separated by pauses,
+with dead air at both ends). The fake server charges ``--stt-s-per-mb`` for
+every megabyte uploaded, standing in for uplink time and Whisper decode cost.
+
+    python benchmarks/bench_preprocess.py --minutes 0.5 3 8
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydub import AudioSegment
+from pydub.generators import Sine
+
+from benchmarks.fake_openai import FakeOpenAI
+from call_processor import CallConfig, CallProcessor
+from preprocess import HAS_FFMPEG, PreprocessConfig
+
+
+def voicemail(minutes):
+    word = Sine(220).to_audio_segment(duration=350, volume=-12)
+    pause = AudioSegment.silent(duration=250, frame_rate=44100)
+    sentence = sum([word + pause] * 8, AudioSegment.silent(duration=0, frame_rate=44100))
+    body = AudioSegment.silent(duration=0, frame_rate=44100)
+    while len(body) < minutes * 60_000:
+        body += sentence + AudioSegment.silent(duration=900, frame_rate=44100)
+    mono = AudioSegment.silent(duration=3000, frame_rate=44100) + body + AudioSegment.silent(duration=4000, frame_rate=44100)
+    stereo = AudioSegment.from_mono_audiosegments(mono.set_frame_rate(44100), mono.set_frame_rate(44100))
+    out = io.BytesIO()
+    stereo.export(out, format='wav')
+    return out.getvalue()
+
+
+async def run(minutes_list, stt_s_per_mb):
+    with FakeOpenAI(stt_delay=0.2, stt_seconds_per_mb=stt_s_per_mb) as server:
+        raw = CallProcessor.from_api_key('test', base_url=server.base_url)
+        prepped = CallProcessor(raw.client, preprocess_config=PreprocessConfig())
+        print(f"codec: {'opus' if HAS_FFMPEG else 'wav 16 kHz mono (ffmpeg not installed)'}")
+        print(f"{'minutes':>7} {'original':>10} {'uploaded':>10} {'saved':>7} {'chunks':>6} "
+              f"{'STT raw':>9} {'STT prep':>9} {'latency saved':>14}")
+        for minutes in minutes_list:
+            audio = voicemail(minutes)
+            start = time.perf_counter()
+            await raw.transcribe(audio, CallConfig(), 'voicemail.wav')
+            raw_seconds = time.perf_counter() - start
+
+            report = {}
+            start = time.perf_counter()
+            await prepped.transcribe(audio, CallConfig(), 'voicemail.wav', report=report)
+            prep_seconds = time.perf_counter() - start
+
+            print(f"{minutes:>7} {len(audio) / 1e6:>8.1f}MB {report['upload_bytes'] / 1e6:>8.2f}MB "
+                  f"{report['upload_bytes_saved'] / len(audio):>6.0%} {report['stt_chunks']:>6} "
+                  f"{raw_seconds:>8.2f}s {prep_seconds:>8.2f}s {raw_seconds - prep_seconds:>13.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--minutes', type=float, nargs='+', default=[0.5, 3, 8])
+    parser.add_argument('--stt-s-per-mb', type=float, default=0.15)
+    args = parser.parse_args()
+    asyncio.run(run(args.minutes, args.stt_s_per_mb))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Goodput and tail latency against an API that throttles and stalls.
+
+Two scenarios against the fake OpenAI server, each run three ways through one
+CallProcessor:
+
+  overload  a burst of whole calls; 429 (Retry-After) once a route has more
+            than --capacity requests in flight, plus a few at random
+  stalls    TTS requests at light load, but a share of responses stall for
+            --slow-delay seconds (the tail that hedging is for)
+
+  SDK retries   the OpenAI SDK on its own (2 retries, no shared limits)
+  scheduler     shared AIMD concurrency + jittered, Retry-After-aware retries
+  + hedging     as above, with slow TTS requests hedged past their p95
+
+    python benchmarks/bench_scheduler.py --calls 80 --concurrency 40
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI
+from call_processor import CallConfig, CallProcessor
+from clients import PoolSettings, build_client
+from pipeline import split_sentences
+from scheduler import SchedulerSettings
+from telephony import ulaw_wav
+
+TURN = ulaw_wav(b'\xff' * 16000)
+
+MODES = {
+    'SDK retries': SchedulerSettings(enabled=False),
+    'scheduler': SchedulerSettings(hedge_speech=False),
+    '+ hedging': SchedulerSettings(),
+}
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else float('nan')
+
+
+async def burst(server, scheduling, calls, concurrency):
+    client, transport = build_client('test', PoolSettings(), base_url=server.base_url, scheduling=scheduling)
+    processor = CallProcessor(client)
+    slots = asyncio.Semaphore(concurrency)
+    latencies, first_audio, failures = [], [], {}
+
+    async def one():
+        async with slots:
+            start = time.perf_counter()
+            try:
+                result = await processor.process(TURN, CallConfig(), filename='turn.wav')
+            except Exception as e:
+                failures[type(e).__name__] = failures.get(type(e).__name__, 0) + 1
+                return
+            latencies.append(time.perf_counter() - start)
+            first_audio.append(result.timings['first_audio'])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    elapsed = time.perf_counter() - start
+    stats = transport.scheduler.snapshot() if transport.scheduler is not None else {}
+    await client.close()
+    return latencies, first_audio, failures, elapsed, stats
+
+
+async def tts_burst(server, scheduling, requests, concurrency):
+    client, transport = build_client('test', PoolSettings(), base_url=server.base_url, scheduling=scheduling)
+    processor = CallProcessor(client)
+    sentences = list(split_sentences([server.reply]))
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with slots:
+            start = time.perf_counter()
+            await processor.synthesize(sentences[i % len(sentences)], CallConfig())
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    stats = transport.scheduler.snapshot()['speech'] if transport.scheduler is not None else {}
+    await client.close()
+    return latencies, stats
+
+
+def run_stalls(label, server_options, requests, concurrency):
+    print(f"\n{label}")
+    print(f"{'mode':<12} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>7} {'requests':>9} {'hedges':>7} "
+          f"{'hedge wins':>11}")
+    for name, scheduling in MODES.items():
+        with FakeOpenAI(seed=2, **server_options) as server:
+            latencies, stats = asyncio.run(tts_burst(server, scheduling, requests, concurrency))
+            sent = sum(server.request_counts.values())
+        print(f"{name:<12} {pct(latencies, 0.5):>7.0f} {pct(latencies, 0.95):>7.0f} {pct(latencies, 0.99):>7.0f} "
+              f"{max(latencies) * 1000:>7.0f} {sent:>9} {stats.get('hedges', 0):>7} {stats.get('hedge_wins', 0):>11}")
+
+
+def run(label, server_options, calls, concurrency):
+    print(f"\n{label}")
+    print(f"{'mode':<12} {'ok':>4} {'failed':>7} {'goodput/s':>10} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+          f"{'1st audio p99':>14} {'429s':>5} {'requests':>9} {'hedges':>7}")
+    for name, scheduling in MODES.items():
+        with FakeOpenAI(retry_after=0.5, seed=1, **server_options) as server:
+            latencies, first_audio, failures, elapsed, stats = asyncio.run(
+                burst(server, scheduling, calls, concurrency))
+            throttled = sum(server.throttled.values())
+            requests = sum(server.request_counts.values())
+        hedges = stats.get('speech', {}).get('hedges', 0)
+        print(f"{name:<12} {len(latencies):>4} {sum(failures.values()):>7} {len(latencies) / elapsed:>10.2f} "
+              f"{pct(latencies, 0.5):>7.0f} {pct(latencies, 0.95):>7.0f} {pct(latencies, 0.99):>7.0f} "
+              f"{pct(first_audio, 0.99):>14.0f} {throttled:>5} {requests:>9} {hedges:>7}")
+        if failures:
+            print(f"{'':<12} failures: {failures}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=80)
+    parser.add_argument('--concurrency', type=int, default=40, help='concurrent calls in the overload burst')
+    parser.add_argument('--capacity', type=int, default=12, help='requests per route in flight before 429s')
+    parser.add_argument('--throttle-rate', type=float, default=0.02)
+    parser.add_argument('--tts-requests', type=int, default=400)
+    parser.add_argument('--slow-rate', type=float, default=0.02)
+    parser.add_argument('--slow-delay', type=float, default=2.0)
+    args = parser.parse_args()
+
+    run(f"overload: {args.calls} calls, {args.concurrency} at a time; 429 above {args.capacity} in flight "
+        f"per route and {args.throttle_rate:.0%} at random",
+        dict(capacity=args.capacity, throttle_rate=args.throttle_rate), args.calls, args.concurrency)
+    run_stalls(f"stalls: {args.tts_requests} TTS requests, 4 at a time; {args.slow_rate:.0%} of responses "
+               f"+{args.slow_delay:g}s", dict(slow_rate=args.slow_rate, slow_delay=args.slow_delay),
+               args.tts_requests, 4)
+
+
+if __name__ == '__main__':
+    main()
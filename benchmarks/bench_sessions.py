@@ -0,0 +1,117 @@
+"""Ten-turn conversations: prompt tokens, prefix-cache hits and latency per turn.
+
+Each conversation is --turns questions from one caller, answered by GPT-4o
+through the fake OpenAI server, which reports cached prompt tokens the way
+OpenAI's prompt caching does and charges --prompt-token-ms of time to first
+token for every prompt token it didn't have cached. Three ways to answer:
+
+  standalone    every turn on its own, as before sessions.py
+  full history  every earlier turn resent verbatim, no budget
+  session       earlier turns within the token budget, older ones summarized
+
+    python benchmarks/bench_sessions.py --conversations 5 --turns 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI
+from call_processor import CallConfig, CallProcessor
+from clients import PoolSettings, build_client
+from sessions import SessionSettings, SessionStore
+
+REPLY = ("We can certainly help with that. Our technicians handle leaking pipes, blocked drains, water heaters "
+         "and bathroom refits, and we usually have someone out within a day of your call. A standard visit "
+         "is eighty dollars, which covers the first hour of work, and we always give you a written quote "
+         "before starting anything bigger. We are open from 9 AM to 9 PM, Monday to Saturday.")
+QUESTIONS = [
+    "Hi, my kitchen sink has been leaking since this morning, can you help?",
+    "How soon could someone come out?",
+    "What would a visit like that cost me?",
+    "Does that include parts, or just the labour?",
+    "And if it turns out the pipe behind the wall is damaged?",
+    "Do you give a warranty on that kind of repair?",
+    "Could the same person also look at my water heater while they're here?",
+    "It's about fifteen years old, is it worth repairing?",
+    "Okay. Can I book for Saturday morning then?",
+    "Great, what should I do until they arrive?",
+]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def converse(processor, server, caller, turns):
+    """(prompt tokens, cached tokens, seconds) for each turn of one conversation."""
+    config = CallConfig(business_name="Acme Plumbing", caller=caller)
+    rows = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        await processor.answer(f"{QUESTIONS[turn % len(QUESTIONS)]} ({caller})", config)
+        elapsed = time.perf_counter() - start
+        usage = next(usage for model, usage in reversed(server.chat_usage) if model == config.chat_model)
+        rows.append((usage['prompt_tokens'], usage['prompt_tokens_details']['cached_tokens'], elapsed))
+        await asyncio.sleep(0)  # let a summary that is due start
+    return rows
+
+
+async def run(server, args):
+    client, _ = build_client('test', PoolSettings(), base_url=server.base_url)
+    modes = [
+        ('standalone', None),
+        ('full history', SessionStore(SessionSettings(history_tokens=10 ** 9))),
+        ('session', SessionStore(SessionSettings(history_tokens=args.history_tokens))),
+    ]
+    results = {}
+    for label, sessions in modes:
+        processor = CallProcessor(client, sessions=sessions)
+        results[label] = [await converse(processor, server, f"+1555000{label[:2]}{n:03d}" if sessions is not None else '',
+                                         args.turns) for n in range(args.conversations)]
+        if sessions is not None:
+            results[label + ' summaries'] = sessions.stats.summaries
+
+    print(f"mean per turn over {args.conversations} conversations; prompt tokens / cached share / latency ms\n")
+    header = f"{'turn':>4}" + "".join(f" {label:>26}" for label, _ in modes)
+    print(header)
+    for turn in range(args.turns):
+        cells = []
+        for label, _ in modes:
+            rows = [conversation[turn] for conversation in results[label]]
+            prompt = sum(r[0] for r in rows) / len(rows)
+            cached = sum(r[1] for r in rows) / max(1, sum(r[0] for r in rows))
+            latency = sum(r[2] for r in rows) / len(rows) * 1000
+            cells.append(f"{prompt:>8.0f} / {cached:>4.0%} / {latency:>6.0f}")
+        print(f"{turn + 1:>4}" + "".join(f" {cell:>26}" for cell in cells))
+
+    print()
+    for label, _ in modes:
+        rows = [row for conversation in results[label] for row in conversation]
+        prompt, cached = sum(r[0] for r in rows), sum(r[1] for r in rows)
+        latencies = [r[2] * 1000 for r in rows]
+        summaries = results.get(label + ' summaries')
+        print(f"{label:<13} {prompt:>8,} prompt tokens, {cached / max(1, prompt):>4.0%} cached, "
+              f"p50 {percentile(latencies, 0.5):.0f} ms, p95 {percentile(latencies, 0.95):.0f} ms"
+              + (f", {summaries} summaries" if summaries else ""))
+    await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, default=5)
+    parser.add_argument('--turns', type=int, default=10)
+    parser.add_argument('--history-tokens', type=int, default=SessionSettings.history_tokens)
+    parser.add_argument('--prompt-token-ms', type=float, default=0.2,
+                        help='time to first token per uncached prompt token')
+    args = parser.parse_args()
+    with FakeOpenAI(reply=REPLY, llm_token_delay=0, llm_prompt_token_delay=args.prompt_token_ms / 1000) as server:
+        asyncio.run(run(server, args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Speculative replies on phone calls: mouth-to-ear latency saved against tokens wasted.
+
+Fake Twilio callers talk to the Media Streams gateway, in this process, against
+the fake OpenAI server, whose transcript grows with the length of the audio
+sent (--words-per-second), so a partial turn transcribes as the start of the
+sentence. Turns come in three kinds, in turn:
+
+  plain      the caller says it in one go and stops
+  short tail the caller pauses (--gap, under the hangover) and adds a word or two
+  long tail  the caller pauses and goes on for a while
+
+Each --pause-ms is a gateway setting; 0 is speculation off. Mouth-to-ear is
+measured on the caller side, from the last frame of speech to the first reply
+frame. Hits are speculative replies played; wasted tokens are the prompt and
+completion tokens the cancelled ones used, from the gateway's own count, and
+tokens/turn is every completion token the fake server streamed. A pause that
+leaves less than a transcription's time before the hangover speculates too
+late to help, which is why pause_ms should sit well under it.
+
+    python benchmarks/bench_speculation.py --calls 4 --turns 6 --pause-ms 0 200 300
+"""
+import argparse
+import asyncio
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_io import ULAW_SILENCE
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.fake_twilio import FakeTwilioCall, synthetic_utterance
+from call_processor import CallProcessor
+from speculation import SpeculationSettings
+from telephony import SAMPLE_RATE, GatewaySettings, MediaStreamGateway
+
+TRANSCRIPT = ("Hi, I was wondering whether you fix tankless water heaters in older houses, "
+              "and what you would charge to come out and take a look at one this week")
+REPLY = "Yes, we service tankless heaters of any age. A visit is 89 dollars, and we have openings on Thursday."
+KINDS = ('plain', 'short tail', 'long tail')
+
+
+def turn(kind: int, gap: float, seed: int) -> bytes:
+    silence = ULAW_SILENCE * int(gap * SAMPLE_RATE)
+    if kind == 0:
+        return synthetic_utterance(3.0, seed=seed)
+    if kind == 1:
+        return synthetic_utterance(2.6, seed=seed) + silence + synthetic_utterance(0.5, seed=seed + 1)
+    return synthetic_utterance(1.8, seed=seed) + silence + synthetic_utterance(1.6, seed=seed + 1)
+
+
+def percentile(values, q):
+    values = sorted(v for v in values if not math.isnan(v))
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else float('nan')
+
+
+async def level(pause_ms: int, calls: int, turns: int, gap: float, words_per_second: float):
+    with FakeOpenAI(reply=REPLY, transcript=TRANSCRIPT, transcript_words_per_second=words_per_second,
+                    stt_delay=0.25, llm_first_token_delay=0.3, llm_token_delay=0.01,
+                    tts_base_delay=0.1, tts_char_delay=0.001) as server:
+        settings = GatewaySettings(speculation=SpeculationSettings(pause_ms=pause_ms))
+        gateway = MediaStreamGateway(CallProcessor.from_api_key('test', base_url=server.base_url),
+                                     settings=settings)
+        async with gateway.serve('127.0.0.1', 0) as ws_server:
+            port = ws_server.sockets[0].getsockname()[1]
+            replays = [FakeTwilioCall(f"ws://127.0.0.1:{port}/media",
+                                      [turn(t % len(KINDS), gap, seed=10 * c + t) for t in range(turns)])
+                       for c in range(calls)]
+
+            async def staggered(i, replay):
+                await asyncio.sleep(i / calls)
+                return await replay.run()
+
+            reports = await asyncio.gather(*(staggered(i, replay) for i, replay in enumerate(replays)))
+            # Let cancelled replies settle before their tokens are counted
+            await asyncio.sleep(0.5)
+        by_kind = {kind: [r.mouth_to_ear[t] for r in reports for t in range(len(r.mouth_to_ear))
+                          if t % len(KINDS) == k] for k, kind in enumerate(KINDS)}
+        latencies = [latency for r in reports for latency in r.mouth_to_ear]
+        return latencies, by_kind, gateway.stats, sum(server.completion_tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=4)
+    parser.add_argument('--turns', type=int, default=6)
+    parser.add_argument('--pause-ms', type=int, nargs='+', default=[0, 200, 300])
+    parser.add_argument('--gap', type=float, default=0.4, help="seconds the caller hesitates mid-turn")
+    parser.add_argument('--words-per-second', type=float, default=3.0)
+    args = parser.parse_args()
+
+    hangover = GatewaySettings().vad.hangover_ms
+    print(f"hangover {hangover} ms, mid-turn gap {args.gap * 1000:.0f} ms, "
+          f"{args.calls} calls x {args.turns} turns; mouth-to-ear p50 ms by turn kind\n")
+    print(f"{'pause ms':>8} {'p50 ms':>7} {'p95 ms':>7} " + " ".join(f"{kind:>10}" for kind in KINDS)
+          + f" {'speculated':>10} {'hits':>5} {'wasted tok/turn':>16} {'tokens/turn':>12}")
+    baseline = None
+    for pause_ms in args.pause_ms:
+        latencies, by_kind, stats, tokens = asyncio.run(
+            level(pause_ms, args.calls, args.turns, args.gap, args.words_per_second))
+        turns = max(1, len(latencies))
+        p50 = percentile(latencies, 0.5)
+        print(f"{pause_ms or 'off':>8} {p50:>7.0f} {percentile(latencies, 0.95):>7.0f} "
+              + " ".join(f"{percentile(values, 0.5):>10.0f}" for values in by_kind.values())
+              + f" {stats.speculations:>10} {stats.speculation_hits:>5} {stats.wasted_tokens / turns:>16.1f}"
+              f" {tokens / turns:>12.1f}")
+        if baseline is None:
+            baseline = p50
+        elif not math.isnan(baseline):
+            print(f"{'':>8} saves {baseline - p50:.0f} ms at p50")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Mouth-to-ear latency through the Media Streams gateway as concurrent calls grow.
+
+The gateway runs in its own process against the fake OpenAI server; fake
+Twilio calls replay caller turns in real time (synthetic speech, or the WAV
+files in --recordings) and interrupt the reply on the second turn. Mouth-to-ear
+is measured on the caller side, from the last frame of speech sent to the
+first reply frame received, so it includes the endpointing hangover. The
+gateway's CPU time per second of call audio shows how many calls one process
+can carry independently of this machine's core count, which the fake callers
+and fake OpenAI server share.
+
+    python benchmarks/bench_telephony.py --calls 1 10 50 --turns 3
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.fake_twilio import FakeTwilioCall, load_recordings, synthetic_utterance
+from call_processor import CallProcessor
+from telephony import GatewaySettings, MediaStreamGateway
+
+REPLY = "We are open from 9 AM to 9 PM, Monday to Saturday. Is there anything else I can help you with?"
+
+
+def serve_gateway(base_url, ports):
+    async def run():
+        gateway = MediaStreamGateway(CallProcessor.from_api_key('test', base_url=base_url))
+        async with gateway.serve('127.0.0.1', 0) as server:
+            ports.put(server.sockets[0].getsockname()[1])
+            await asyncio.get_running_loop().create_future()
+
+    asyncio.run(run())
+
+
+def health(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/health") as response:
+        return json.load(response)
+
+
+def cpu_seconds(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except OSError:
+        return float('nan')
+
+
+def percentile(values, q):
+    values = sorted(v for v in values if not math.isnan(v))
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else float('nan')
+
+
+async def level(port, calls, turns, utterances):
+    replays = [FakeTwilioCall(f"ws://127.0.0.1:{port}/media",
+                              [utterances[(c + t) % len(utterances)] for t in range(turns)],
+                              barge_in_turns=[1] if turns > 2 else [])
+               for c in range(calls)]
+    # Callers dial in over the first second rather than all on the same frame
+    async def staggered(i, replay):
+        await asyncio.sleep(i / calls)
+        return await replay.run()
+
+    return await asyncio.gather(*(staggered(i, replay) for i, replay in enumerate(replays)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--turns', type=int, default=3)
+    parser.add_argument('--recordings', help='directory of 16-bit WAV files, one caller utterance each')
+    args = parser.parse_args()
+
+    utterances = (load_recordings(args.recordings) if args.recordings
+                  else [synthetic_utterance(1.2 + 0.4 * i, seed=i) for i in range(4)])
+    budget = GatewaySettings.turn_budget_ms
+    with FakeOpenAI(reply=REPLY, stt_delay=0.25, llm_first_token_delay=0.2, llm_token_delay=0.01,
+                    tts_base_delay=0.1, tts_char_delay=0.001) as server:
+        ports = multiprocessing.get_context('spawn').Queue()
+        gateway = multiprocessing.get_context('spawn').Process(target=serve_gateway, args=(server.base_url, ports),
+                                                               daemon=True)
+        gateway.start()
+        port = ports.get(timeout=30)
+        try:
+            print(f"{os.cpu_count()} CPU(s); turn budget {budget} ms")
+            print(f"{'calls':>5} {'turns':>6} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'over budget':>12} "
+                  f"{'missed':>7} {'barge-in stop p50/p95 ms':>25} {'gateway CPU ms/call-s':>22}")
+            for calls in args.calls:
+                before, cpu_before = health(port), cpu_seconds(gateway.pid)
+                start = time.perf_counter()
+                reports = asyncio.run(level(port, calls, args.turns, utterances))
+                call_seconds = calls * (time.perf_counter() - start)
+                after, cpu = health(port), cpu_seconds(gateway.pid) - cpu_before
+                latencies = [l for r in reports for l in r.mouth_to_ear]
+                stops = [s for r in reports for s in r.barge_in_stop]
+                missed = sum(r.missed_turns for r in reports)
+                over = sum(l * 1000 > budget for l in latencies)
+                print(f"{calls:>5} {len(latencies):>6} {percentile(latencies, 0.5):>7.0f} "
+                      f"{percentile(latencies, 0.95):>7.0f} {percentile(latencies, 0.99):>7.0f} "
+                      f"{over / max(1, len(latencies)):>11.0%} {missed:>7} "
+                      f"{percentile(stops, 0.5):>12.0f} / {percentile(stops, 0.95):<10.0f} {cpu * 1000 / call_seconds:>22.1f}")
+                print(f"      gateway: {after['turns'] - before['turns']} turns, "
+                      f"{after['barge_ins'] - before['barge_ins']} barge-ins, "
+                      f"{after['budget_misses'] - before['budget_misses']} over budget")
+        finally:
+            gateway.terminate()
+
+
+if __name__ == '__main__':
+    main()
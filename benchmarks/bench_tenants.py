@@ -0,0 +1,140 @@
+"""Routing calls across many tenants: lookup cost, load time and calls/s.
+
+Loads --tenants synthetic business profiles from a JSON file, then compares:
+
+  route          TenantRegistry.route(dialed number): the tenant's config and processor
+  rebuild        what a call cost before: a CallConfig and system prompt built from
+                 f-strings, and the answer-cache key hashed from it
+
+and whole calls per second through the registry against the fake OpenAI
+server: every call to one tenant, versus calls spread over all of them (each
+tenant's first call creates its caches, and its answer cache starts empty).
+
+    python benchmarks/bench_tenants.py --tenants 1000 --calls 400
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_cache import fingerprint
+from benchmarks.fake_openai import FakeOpenAI
+from call_processor import CallConfig, compile_prompt
+from clients import PoolSettings, build_client
+from telephony import ulaw_wav
+from tenants import TenantRegistry
+
+TURN = ulaw_wav(b'\xff' * 16000)
+VOICES = ['alloy', 'echo', 'fable', 'onyx', 'nova', 'shimmer']
+STYLES = ['Professional', 'Friendly', 'Casual', 'Formal']
+LENGTHS = ['Very Short', 'Short', 'Medium', 'Long']
+
+
+def synthetic_tenants(n):
+    rng = random.Random(5)
+    return [{
+        'id': f"tenant-{i:05d}",
+        'business_name': f"{rng.choice(['Acme', 'Bright', 'Harbor', 'Summit'])} {rng.choice(['Plumbing', 'Dental', 'Auto', 'Bakery'])} {i}",
+        'phone_number': f"+1 (555) {i // 10000:03d}-{i % 10000:04d}",
+        'business_hours': f"{rng.randint(6, 10)} AM - {rng.randint(4, 11)} PM, Monday to {rng.choice(['Friday', 'Saturday'])}",
+        'voice': rng.choice(VOICES),
+        'speed': rng.choice([0.9, 1.0, 1.1]),
+        'response_style': rng.choice(STYLES),
+        'response_length': rng.choice(LENGTHS),
+        'include_callback': rng.random() < 0.7,
+        'include_hours': rng.random() < 0.5,
+    } for i in range(n)]
+
+
+def per_call_us(fn, dialed, rounds=5):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for number in dialed:
+            fn(number)
+        best = min(best, (time.perf_counter() - start) / len(dialed))
+    return best * 1e6
+
+
+async def throughput(server, path, calls, concurrency):
+    client, _ = build_client('test', PoolSettings(), base_url=server.base_url)
+    registry = TenantRegistry.load(client, path)
+    numbers = [number for tenant in registry for number in tenant.numbers]
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(number):
+        async with slots:
+            tenant, processor = registry.route(number)
+            await processor.process(TURN, tenant.config, filename='turn.wav')
+
+    rates = {}
+    await asyncio.gather(*(one(numbers[-1]) for _ in range(concurrency)))  # warm the connection pool
+    for label, targets in (('one tenant', [numbers[0]] * calls), ('all tenants', random.choices(numbers, k=calls))):
+        start = time.perf_counter()
+        await asyncio.gather(*(one(number) for number in targets))
+        rates[label] = calls / (time.perf_counter() - start)
+    await client.close()
+    return rates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tenants', type=int, default=1000)
+    parser.add_argument('--calls', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data:
+        os.environ['VOICE_DATA_DIR'] = data
+        profiles = synthetic_tenants(args.tenants)
+        path = os.path.join(data, 'tenants.json')
+        with open(path, 'w') as f:
+            json.dump(profiles, f)
+
+        client, _ = build_client('test', PoolSettings())  # never called: routing makes no requests
+        tracemalloc.start()
+        start = time.perf_counter()
+        registry = TenantRegistry.load(client, path)
+        load_seconds = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"loaded {len(registry)} tenants in {load_seconds * 1000:.0f} ms, {memory / 1e6:.1f} MB "
+              f"({memory / len(registry) / 1000:.1f} KB per tenant, prompts compiled)")
+
+        numbers = [number for tenant in registry for number in tenant.numbers]
+        dialed = random.Random(1).choices(numbers, k=20000)
+        by_number = {tenant.numbers[0]: profile for tenant, profile in zip(registry, profiles)}
+        for tenant in registry:
+            registry.processor_for(tenant)  # time steady-state routing, not first-call cache setup
+
+        def rebuild(number):
+            profile = by_number[number]
+            config = CallConfig(**{k: v for k, v in profile.items() if k != 'id'})
+            prompt = compile_prompt.__wrapped__(config.business_name, config.phone_number, config.business_hours,
+                                                config.response_style, config.response_length,
+                                                config.include_callback, config.include_hours)
+            return config, fingerprint(prompt, config.chat_model)
+
+        route_us = per_call_us(registry.route, dialed)
+        rebuild_us = per_call_us(rebuild, dialed)
+        print(f"\n{'per call':<10} {'us':>8}")
+        print(f"{'route':<10} {route_us:>8.2f}")
+        print(f"{'rebuild':<10} {rebuild_us:>8.2f}")
+
+        with FakeOpenAI(stt_delay=0, llm_first_token_delay=0, llm_token_delay=0, tts_base_delay=0,
+                        tts_char_delay=0) as server:
+            rates = asyncio.run(throughput(server, path, args.calls, args.concurrency))
+        print(f"\n{'calls':<14} {'calls/s':>8}")
+        for label, rate in rates.items():
+            print(f"{label:<14} {rate:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
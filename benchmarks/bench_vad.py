@@ -0,0 +1,142 @@
+"""Endpointing quality over a corpus of caller turns: delay, false cut-offs, bytes saved.
+
+Each synthetic turn is leading silence, a run of words with short gaps (and
+sometimes a ~400 ms hesitation), then trailing silence, over line noise at
+several levels. The true end of speech is known, so for every backend and
+hangover setting this reports:
+
+  endpoint delay  - from the end of speech to 'utterance_complete'
+  false cut-offs  - turns where an utterance completed before the caller finished
+  bytes saved     - share of the recording that never goes to Whisper
+
+"whole file" is the upload-everything baseline: nothing can start until the
+recording ends. --recordings DIR adds a row per backend for real WAV files
+(one turn each; no ground truth, so any extra utterance counts as a cut-off).
+
+    python benchmarks/bench_vad.py --turns 60 --hangover 300 500 800
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vad import Endpointer, VADConfig, webrtcvad
+
+RATE = 8000
+NOISE_LEVELS = {'quiet line': -70.0, 'office': -48.0, 'street': -36.0}
+
+
+def word(rng, seconds, level_dbfs):
+    t = np.arange(int(seconds * RATE)) / RATE
+    pitch = rng.uniform(100, 220)
+    voice = sum(np.sin(2 * np.pi * pitch * k * t + rng.uniform(0, 6)) / k for k in range(1, 10))
+    envelope = np.sin(np.pi * t / seconds) ** 0.5
+    signal = voice * envelope
+    rms = np.sqrt(np.mean(signal ** 2)) or 1.0
+    return signal * (32768 * 10 ** (level_dbfs / 20) / rms)
+
+
+def synthetic_turn(rng, noise_dbfs):
+    """PCM for one caller turn, with the true start and end of speech in ms."""
+    level = rng.uniform(-26, -16)
+    pieces = [np.zeros(int(rng.uniform(0.3, 2.0) * RATE))]
+    start_ms = len(pieces[0]) * 1000 / RATE
+    words = int(rng.integers(4, 14))
+    hesitation = int(rng.integers(1, words)) if rng.random() < 0.4 else -1
+    for i in range(words):
+        pieces.append(word(rng, rng.uniform(0.15, 0.5), level))
+        if i < words - 1:
+            gap = rng.uniform(0.35, 0.45) if i == hesitation else rng.uniform(0.05, 0.25)
+            pieces.append(np.zeros(int(gap * RATE)))
+    end_ms = sum(len(p) for p in pieces) * 1000 / RATE
+    pieces.append(np.zeros(int(2.0 * RATE)))
+    signal = np.concatenate(pieces)
+    signal += rng.normal(0, 32768 * 10 ** (noise_dbfs / 20), len(signal))
+    return np.clip(signal, -32768, 32767).astype('<i2').tobytes(), start_ms, end_ms
+
+
+def load_wav_turns(directory):
+    import wave
+    from audio_io import resample
+    turns = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith('.wav'):
+            continue
+        with wave.open(os.path.join(directory, name), 'rb') as w:
+            channels, rate = w.getnchannels(), w.getframerate()
+            samples = np.frombuffer(w.readframes(w.getnframes()), dtype='<i2').reshape(-1, channels).mean(axis=1)
+        turns.append((resample(samples, rate, RATE).tobytes(), None, None))
+    return turns
+
+
+def evaluate(turns, config):
+    delays, cutoffs, missed, sent, total, frames, busy = [], 0, 0, 0, 0, 0, 0.0
+    for pcm, _, end_ms in turns:
+        endpointer = Endpointer(config)
+        start = time.perf_counter()
+        # Fed in 20 ms pieces, the way frames arrive from a phone line
+        events = []
+        for offset in range(0, len(pcm), endpointer.frame_bytes):
+            events.extend(endpointer.push(pcm[offset:offset + endpointer.frame_bytes]))
+        events.extend(endpointer.flush())
+        busy += time.perf_counter() - start
+        frames += len(pcm) // endpointer.frame_bytes
+
+        complete = [e for e in events if e.kind == 'utterance_complete']
+        sent += sum(len(e.audio) for e in complete)
+        total += len(pcm)
+        if not complete:
+            missed += 1
+            continue
+        if end_ms is None:
+            cutoffs += len(complete) > 1
+            continue
+        cutoffs += any(e.at_ms < end_ms for e in complete)
+        after = [e.at_ms - end_ms for e in complete if e.at_ms >= end_ms]
+        if after:
+            delays.append(after[0])
+    return delays, cutoffs, missed, 1 - sent / total, busy / max(1, frames) * 1e6, endpointer.backend
+
+
+def pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=60, help='synthetic turns per noise level')
+    parser.add_argument('--hangover', type=int, nargs='+', default=[300, 500, 800])
+    parser.add_argument('--recordings', help='directory of 16-bit WAV files, one caller turn each')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    corpora = {name: [synthetic_turn(rng, level) for _ in range(args.turns)] for name, level in NOISE_LEVELS.items()}
+    if args.recordings:
+        corpora['recordings'] = load_wav_turns(args.recordings)
+    backends = ['energy'] + (['webrtc'] if webrtcvad is not None else [])
+    if webrtcvad is None:
+        print("webrtcvad not installed; energy backend only")
+
+    print(f"{'corpus':<11} {'endpointer':<18} {'delay p50':>9} {'delay p95':>9} {'cut-offs':>9} {'missed':>7} "
+          f"{'bytes saved':>11} {'us/frame':>9}")
+    for name, turns in corpora.items():
+        if turns[0][2] is not None:
+            whole = [len(pcm) / 2 / RATE * 1000 - end_ms for pcm, _, end_ms in turns]
+            print(f"{name:<11} {'whole file':<18} {pct(whole, 0.5):>7.0f}ms {pct(whole, 0.95):>7.0f}ms "
+                  f"{0:>8.0%} {0:>7} {0:>11.0%} {'':>9}")
+        for backend in backends:
+            for hangover in args.hangover:
+                config = VADConfig(sample_rate=RATE, backend=backend, hangover_ms=hangover)
+                delays, cutoffs, missed, saved, cost, used = evaluate(turns, config)
+                label = f"{used} {hangover}ms"
+                print(f"{name:<11} {label:<18} {pct(delays, 0.5):>7.0f}ms {pct(delays, 0.95):>7.0f}ms "
+                      f"{cutoffs / len(turns):>8.0%} {missed:>7} {saved:>11.0%} {cost:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Overnight voicemail batch: files per minute by stage concurrency, and resume.
+
+Writes --files synthetic voicemails (16-bit WAV) to a temp directory and
+answers them with voicemail_batch against the fake OpenAI server. The first
+row is the click-through-one-at-a-time baseline (one worker per stage). The
+run with the most workers is then repeated against the same checkpoint to show
+that a rerun makes no API calls.
+
+    python benchmarks/bench_voicemail.py --files 40 --workers 1 4 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI
+from call_processor import CallConfig, CallProcessor
+from call_store import CallStore
+from preprocess import PreprocessConfig
+from voicemail_batch import BatchSettings, Checkpoint, VoicemailBatch, find_audio
+
+
+def write_voicemails(directory, count, seconds=20, rate=16000):
+    rng = np.random.default_rng(3)
+    for i in range(count):
+        t = np.arange(int(seconds * rate)) / rate
+        # Speech-like bursts separated by pauses, with silence before and after
+        envelope = (np.sin(2 * np.pi * 0.4 * t) > -0.3) * (t > 1.5) * (t < seconds - 2)
+        voice = sum(np.sin(2 * np.pi * rng.uniform(100, 200) * k * t) / k for k in range(1, 8))
+        samples = np.clip(4000 * voice * envelope + rng.normal(0, 30, len(t)), -32768, 32767).astype('<i2')
+        with wave.open(os.path.join(directory, f"voicemail_{i:03d}.wav"), 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(rate)
+            w.writeframes(samples.tobytes())
+
+
+async def run_batch(server, paths, workdir, workers, label):
+    processor = CallProcessor.from_api_key('test', base_url=server.base_url, preprocess_config=PreprocessConfig())
+    checkpoint = Checkpoint(os.path.join(workdir, f"checkpoint-{workers}.jsonl"))
+    store = CallStore(os.path.join(workdir, 'calls.db'))
+    settings = BatchSettings(stt_workers=workers, llm_workers=workers, tts_workers=workers, backoff=0.1)
+    before = sum(server.request_counts.values())
+    report = await VoicemailBatch(processor, CallConfig(), os.path.join(workdir, 'replies'), checkpoint,
+                                  store=store, settings=settings).run(paths)
+    checkpoint.close()
+    store.close()
+    stages = "  ".join(f"{stage} p50 {sorted(s)[len(s) // 2]:.2f}s" if s else f"{stage} -"
+                       for stage, s in report.stage_seconds.items())
+    print(f"{label:<14} {workers:>7} {len(report.done):>5} {report.skipped:>7} {report.seconds:>8.1f} "
+          f"{report.files_per_minute:>9.1f} {sum(server.request_counts.values()) - before:>9}  {stages}")
+
+
+async def run_all(server, paths, workdir, worker_counts):
+    # One event loop throughout: the shared OpenAI client stays bound to the loop it first ran on
+    for workers in worker_counts:
+        await run_batch(server, paths, workdir, workers, 'fresh')
+    await run_batch(server, paths, workdir, max(worker_counts), 'rerun')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=40)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8], help='workers per stage')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir, FakeOpenAI(stt_seconds_per_mb=0.5) as server:
+        inbox = os.path.join(workdir, 'inbox')
+        os.makedirs(inbox)
+        write_voicemails(inbox, args.files)
+        paths = find_audio([inbox])
+        print(f"{'run':<14} {'workers':>7} {'done':>5} {'skipped':>7} {'seconds':>8} {'files/min':>9} "
+              f"{'API calls':>9}  per-stage time")
+        asyncio.run(run_all(server, paths, workdir, args.workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+"""Local stand-in for the OpenAI endpoints voice_app.py uses, with tunable latency.
+
+Start it with ``FakeOpenAI().start()`` and point a client at ``server.base_url``.
+It can also misbehave like a loaded API: 429s with Retry-After once a route
+has more than ``capacity`` requests in flight or at random (``throttle_rate``),
+and occasional slow responses (``slow_rate``, ``slow_delay``).
+
+Chat requests report ``cached_tokens`` the way OpenAI's prompt caching does:
+the longest prefix of the prompt seen in an earlier request, in 128-token
+steps from 1,024 tokens. ``llm_prompt_token_delay`` adds time to first token
+for every prompt token that wasn't cached. Replies honor ``stop`` and
+``max_tokens`` (one token per word), and ``completion_tokens`` records how
+many tokens each stream sent before it ended or the client closed it.
+
+With ``transcript_words_per_second`` set, a WAV upload is transcribed as the
+first words of ``transcript`` its length could hold, so a clip cut short
+returns the start of the sentence, as a caller's partial turn would.
+"""
+import json
+import math
+import random
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = (
+    "Hello! Thank you for calling My Business. "
+    "We are open from 9 AM to 9 PM, Monday to Saturday. "
+    "Is there anything else I can help you with today? "
+    "Feel free to call us at +1234567890. Have a great day!"
+)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 512
+
+    def handle_error(self, request, client_address):
+        # Clients hang up on cancelled and hedged requests; that is not a server fault
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class FakeOpenAI:
+    def __init__(self, reply=DEFAULT_REPLY, transcript="What are your business hours?",
+                 stt_delay=0.3, llm_first_token_delay=0.25, llm_token_delay=0.02,
+                 tts_base_delay=0.15, tts_char_delay=0.002, audio_bytes_per_char=160, connect_delay=0.0,
+                 stt_seconds_per_mb=0.0, speech_seconds_per_char=0.06, capacity=0, throttle_rate=0.0,
+                 retry_after=1.0, slow_rate=0.0, slow_delay=2.0, llm_prompt_token_delay=0.0, transcript_words_per_second=0.0, seed=None):
+        self.reply = reply
+        self.transcript = transcript
+        self.transcript_words_per_second = transcript_words_per_second
+        self.stt_delay = stt_delay
+        # Upload + decode cost that grows with the size of the audio sent to Whisper
+        self.stt_seconds_per_mb = stt_seconds_per_mb
+        self.llm_first_token_delay = llm_first_token_delay
+        self.llm_token_delay = llm_token_delay
+        self.llm_prompt_token_delay = llm_prompt_token_delay
+        self.prompt_prefixes = set()
+        self.chat_usage = []  # (model, prompt usage) per chat request, in arrival order
+        self.completion_tokens = []
+        self.tts_base_delay = tts_base_delay
+        self.tts_char_delay = tts_char_delay
+        self.audio_bytes_per_char = audio_bytes_per_char
+        # Playback length of response_format='pcm' speech (24 kHz, 16-bit mono)
+        self.speech_seconds_per_char = speech_seconds_per_char
+        # Extra cost paid once per new TCP connection, standing in for a TLS handshake
+        self.connect_delay = connect_delay
+        self.connections = 0
+        # Fault injection: per-route concurrency above which requests get 429, random 429s, slow responses
+        self.capacity = capacity
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.random = random.Random(seed)
+        self.in_flight = {}
+        self.throttled = {}
+        self._lock = threading.Lock()
+        self.request_counts = {}
+        self.bytes_received = {}
+        self._server = None
+
+    # ==================== LIFECYCLE ====================
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), self._handler_class())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    # ==================== RESPONSES ====================
+    def tokens(self, stop=None, max_tokens=None):
+        """The reply's tokens up to the first stop sequence, at most ``max_tokens``; and the finish reason."""
+        reply = self.reply
+        for sequence in stop or ():
+            reply = reply.split(sequence)[0]
+        words = reply.split(' ')
+        tokens = [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+        if max_tokens and len(tokens) > max_tokens:
+            return tokens[:max_tokens], 'length'
+        return tokens, 'stop'
+
+    def transcribe(self, body):
+        """``transcript``, or as much of it as the uploaded WAV's length holds."""
+        if not self.transcript_words_per_second:
+            return self.transcript
+        fmt = body.find(b'WAVEfmt ') + 4
+        data = body.find(b'data', fmt)
+        if fmt < 4 or data < 0:
+            return self.transcript
+        byte_rate = struct.unpack_from('<I', body, fmt + 16)[0]
+        seconds = struct.unpack_from('<I', body, data + 4)[0] / byte_rate
+        words = self.transcript.split(' ')
+        return " ".join(words[:round(seconds * self.transcript_words_per_second)])
+
+    def prompt_usage(self, messages):
+        """Prompt tokens (about four characters each) and how many of them a prefix cache would serve."""
+        prompt = "".join(f"<{m.get('role')}>{m.get('content', '')}" for m in messages)
+        tokens = (len(prompt) + 3) // 4
+        cached = 0
+        with self._lock:
+            for length in range(1024, tokens + 1, 128):
+                prefix = hash(prompt[:length * 4])
+                if prefix in self.prompt_prefixes:
+                    cached = length
+                self.prompt_prefixes.add(prefix)
+        return {'prompt_tokens': tokens, 'prompt_tokens_details': {'cached_tokens': cached}}
+
+    def speech_bytes(self, text, response_format='mp3', speed=1.0):
+        if response_format == 'pcm':
+            # A quiet 220 Hz tone, so the audio is not mistaken for silence
+            samples = int(24000 * self.speech_seconds_per_char * len(text) / speed)
+            tone = [int(3000 * math.sin(2 * math.pi * 220 * i / 24000)) for i in range(24000 // 220 * 2)]
+            period = struct.pack(f'<{len(tone)}h', *tone)
+            return (period * (samples // len(tone) + 1))[:samples * 2]
+        return b'ID3' + b'\xff' * (len(text) * self.audio_bytes_per_char)
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                fake.connections += 1
+                time.sleep(fake.connect_delay)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                route = self.path.split('?')[0].rstrip('/')
+                fake.request_counts[route] = fake.request_counts.get(route, 0) + 1
+                fake.bytes_received[route] = fake.bytes_received.get(route, 0) + len(body)
+                with fake._lock:
+                    fake.in_flight[route] = fake.in_flight.get(route, 0) + 1
+                    overloaded = bool(fake.capacity) and fake.in_flight[route] > fake.capacity
+                    throttle = overloaded or fake.random.random() < fake.throttle_rate
+                    slow = fake.random.random() < fake.slow_rate
+                    if throttle:
+                        fake.throttled[route] = fake.throttled.get(route, 0) + 1
+                try:
+                    if throttle:
+                        self._throttle()
+                        return
+                    if slow:
+                        time.sleep(fake.slow_delay)
+                    self._route(route, body)
+                finally:
+                    with fake._lock:
+                        fake.in_flight[route] -= 1
+
+            def _throttle(self):
+                payload = json.dumps({'error': {'message': 'Rate limit reached', 'type': 'requests',
+                                                'code': 'rate_limit_exceeded'}}).encode()
+                self.send_response(429)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Retry-After', f"{fake.retry_after:g}")
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _route(self, route, body):
+                if route.endswith('/audio/transcriptions'):
+                    time.sleep(fake.stt_delay + fake.stt_seconds_per_mb * len(body) / 1e6)
+                    self._send(200, fake.transcribe(body).encode(), 'text/plain')
+                elif route.endswith('/chat/completions'):
+                    self._chat(json.loads(body or b'{}'))
+                elif route.endswith('/audio/speech'):
+                    request = json.loads(body or b'{}')
+                    text = request.get('input', '')
+                    response_format = request.get('response_format', 'mp3')
+                    time.sleep(fake.tts_base_delay + fake.tts_char_delay * len(text))
+                    self._send(200, fake.speech_bytes(text, response_format, request.get('speed') or 1.0),
+                               'audio/pcm' if response_format == 'pcm' else 'audio/mpeg')
+                else:
+                    self._send(404, b'{"error": {"message": "not found"}}', 'application/json')
+
+            def _send(self, status, payload, content_type):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _chat(self, request):
+                stop = request.get('stop')
+                tokens, finish_reason = fake.tokens([stop] if isinstance(stop, str) else stop,
+                                                    request.get('max_tokens'))
+                reply = "".join(tokens)
+                base = {'id': 'chatcmpl-fake', 'created': int(time.time()), 'model': request.get('model', 'gpt-4o')}
+                prompt = fake.prompt_usage(request.get('messages', []))
+                fake.chat_usage.append((base['model'], prompt))
+                uncached = prompt['prompt_tokens'] - prompt['prompt_tokens_details']['cached_tokens']
+                time.sleep(fake.llm_first_token_delay + fake.llm_prompt_token_delay * uncached)
+                if not request.get('stream'):
+                    time.sleep(fake.llm_token_delay * len(tokens))
+                    fake.completion_tokens.append(len(tokens))
+                    payload = dict(base, object='chat.completion', choices=[{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': reply},
+                        'finish_reason': finish_reason
+                    }], usage=dict(prompt, completion_tokens=len(tokens),
+                                   total_tokens=prompt['prompt_tokens'] + len(tokens)))
+                    self._send(200, json.dumps(payload).encode(), 'application/json')
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                sent = 0
+                try:
+                    for i, token in enumerate(tokens):
+                        if i:
+                            time.sleep(fake.llm_token_delay)
+                        chunk = dict(base, object='chat.completion.chunk', choices=[{
+                            'index': 0, 'delta': {'content': token}, 'finish_reason': None
+                        }])
+                        self._event(json.dumps(chunk))
+                        sent += 1
+                finally:
+                    fake.completion_tokens.append(sent)
+                self._event(json.dumps(dict(base, object='chat.completion.chunk', choices=[{
+                    'index': 0, 'delta': {}, 'finish_reason': finish_reason
+                }])))
+                if (request.get('stream_options') or {}).get('include_usage'):
+                    self._event(json.dumps(dict(base, object='chat.completion.chunk', choices=[], usage=dict(
+                        prompt, completion_tokens=len(tokens), total_tokens=prompt['prompt_tokens'] + len(tokens)
+                    ))))
+                self._event('[DONE]')
+                self.wfile.write(b'0\r\n\r\n')
+                self.wfile.flush()
+
+            def _event(self, data):
+                payload = f"data: {data}\n\n".encode()
+                self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b'\r\n')
+                self.wfile.flush()
+
+        return Handler
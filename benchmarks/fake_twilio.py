@@ -0,0 +1,176 @@
+"""Twilio's side of a Media Stream, for driving telephony.py without a phone line.
+
+``FakeTwilioCall`` replays a caller's utterances into the gateway as 20 ms
+μ-law frames in real time, with silence between them, and "plays" the reply
+audio at real time the way Twilio does: marks are echoed once playback reaches
+them, and a ``clear`` drops whatever is still buffered.
+"""
+import asyncio
+import base64
+import json
+import os
+import wave
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import numpy as np
+from websockets.asyncio.client import connect
+
+from audio_io import ULAW_SILENCE, pcm16_to_ulaw, resample
+from telephony import FRAME_BYTES, FRAME_MS, SAMPLE_RATE
+
+
+# ==================== RECORDINGS ====================
+def synthetic_utterance(seconds: float, seed: int = 0) -> bytes:
+    """A voiced, syllable-modulated signal that an energy detector treats as speech."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 110 + 40 * rng.random()
+    voice = sum(np.sin(2 * np.pi * pitch * k * t + rng.random() * 6) / k for k in range(1, 12))
+    envelope = 0.4 + 0.6 * np.abs(np.sin(2 * np.pi * (2.5 + rng.random()) * t))
+    samples = 5000 * voice * envelope + rng.normal(0, 200, len(t))
+    return pcm16_to_ulaw(np.clip(samples, -32768, 32767).astype(np.int16))
+
+
+def load_recording(path: str) -> bytes:
+    """A WAV file as 8 kHz mono μ-law."""
+    with wave.open(path, 'rb') as w:
+        channels, width, rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+        raw = w.readframes(w.getnframes())
+    if width != 2:
+        raise ValueError(f"{path}: expected 16-bit PCM, got {width * 8}-bit")
+    samples = np.frombuffer(raw, dtype='<i2').reshape(-1, channels).mean(axis=1)
+    return pcm16_to_ulaw(resample(samples, rate, SAMPLE_RATE))
+
+
+def load_recordings(directory: str) -> List[bytes]:
+    return [load_recording(os.path.join(directory, name)) for name in sorted(os.listdir(directory))
+            if name.lower().endswith('.wav')]
+
+
+# ==================== CALL ====================
+@dataclass
+class CallReport:
+    mouth_to_ear: List[float] = field(default_factory=list)  # end of caller speech -> first reply audio heard
+    barge_in_stop: List[float] = field(default_factory=list)  # caller talks over reply -> playback cleared
+    missed_turns: int = 0
+
+
+class FakeTwilioCall:
+    def __init__(self, url: str, utterances: Sequence[bytes], barge_in_turns: Sequence[int] = (),
+                 barge_in_after: float = 0.5, pause: float = 0.6, reply_timeout: float = 15.0,
+                 parameters: Optional[dict] = None):
+        self.url = url
+        self.utterances = list(utterances)
+        self.barge_in_turns = set(barge_in_turns)
+        self.barge_in_after = barge_in_after
+        self.pause = pause
+        self.reply_timeout = reply_timeout
+        self.parameters = parameters or {}
+        self.report = CallReport()
+        self.stream_sid = f"MZ{os.urandom(16).hex()}"
+        self._mic: List[bytes] = []
+        self._mic_empty = asyncio.Event()
+        self._first_audio = asyncio.Event()
+        self._first_audio_at = 0.0
+        self._played = asyncio.Event()
+        self._cleared_at = 0.0
+        self._play_until = 0.0
+        self._marks = {}
+
+    async def run(self) -> CallReport:
+        async with connect(self.url, compression=None, max_size=None) as ws:
+            await ws.send(json.dumps({'event': 'connected', 'protocol': 'Call', 'version': '1.0.0'}))
+            await ws.send(json.dumps({'event': 'start', 'streamSid': self.stream_sid, 'start': {
+                'streamSid': self.stream_sid, 'callSid': f"CA{os.urandom(16).hex()}", 'tracks': ['inbound'],
+                'customParameters': self.parameters,
+                'mediaFormat': {'encoding': 'audio/x-mulaw', 'sampleRate': SAMPLE_RATE, 'channels': 1}}}))
+            sender = asyncio.create_task(self._send_frames(ws))
+            receiver = asyncio.create_task(self._receive(ws))
+            try:
+                await self._script()
+            finally:
+                sender.cancel()
+                receiver.cancel()
+                for task in self._marks.values():
+                    task.cancel()
+                await ws.send(json.dumps({'event': 'stop', 'streamSid': self.stream_sid}))
+        return self.report
+
+    async def _script(self):
+        loop = asyncio.get_running_loop()
+        for turn, utterance in enumerate(self.utterances):
+            interrupting = turn - 1 in self.barge_in_turns
+            started = loop.time()
+            await self._say(utterance)
+            if interrupting:
+                self.report.barge_in_stop.append(self._cleared_at - started if self._cleared_at else float('nan'))
+            speech_end = loop.time()
+            self._first_audio.clear()
+            self._played.clear()
+            try:
+                await asyncio.wait_for(self._first_audio.wait(), self.reply_timeout)
+            except asyncio.TimeoutError:
+                self.report.missed_turns += 1
+                continue
+            self.report.mouth_to_ear.append(self._first_audio_at - speech_end)
+            if turn in self.barge_in_turns and turn + 1 < len(self.utterances):
+                await asyncio.sleep(self.barge_in_after)
+                self._cleared_at = 0.0
+                continue
+            await asyncio.wait_for(self._played.wait(), self.reply_timeout * 4)
+            await asyncio.sleep(self.pause)
+
+    async def _say(self, utterance: bytes):
+        self._mic = [utterance[i:i + FRAME_BYTES] for i in range(0, len(utterance), FRAME_BYTES)]
+        self._mic_empty.clear()
+        await self._mic_empty.wait()
+
+    async def _send_frames(self, ws):
+        # Frames go out on a fixed 20 ms clock, silence when the caller isn't talking
+        loop = asyncio.get_running_loop()
+        silence = ULAW_SILENCE * FRAME_BYTES
+        tick, chunk = loop.time(), 0
+        while True:
+            frame = self._mic.pop(0) if self._mic else silence
+            chunk += 1
+            await ws.send(json.dumps({'event': 'media', 'streamSid': self.stream_sid, 'media': {
+                'track': 'inbound', 'chunk': str(chunk), 'timestamp': str(chunk * FRAME_MS),
+                'payload': base64.b64encode(frame).decode()}}))
+            if not self._mic:
+                self._mic_empty.set()
+            tick += FRAME_MS / 1000
+            await asyncio.sleep(max(0.0, tick - loop.time()))
+
+    async def _receive(self, ws):
+        loop = asyncio.get_running_loop()
+        async for message in ws:
+            event = json.loads(message)
+            kind = event.get('event')
+            now = loop.time()
+            if kind == 'media':
+                audio = base64.b64decode(event['media']['payload'])
+                if not self._first_audio.is_set():
+                    self._first_audio_at = now
+                    self._first_audio.set()
+                self._play_until = max(self._play_until, now) + len(audio) / SAMPLE_RATE
+            elif kind == 'mark':
+                name = event['mark']['name']
+                self._marks[name] = asyncio.create_task(self._echo_mark(ws, name, self._play_until))
+            elif kind == 'clear':
+                self._cleared_at = now
+                self._play_until = now
+                # Twilio answers a clear by returning every mark still queued
+                for name, task in list(self._marks.items()):
+                    task.cancel()
+                    await self._echo_mark(ws, name, now)
+
+    async def _echo_mark(self, ws, name: str, at: float):
+        await asyncio.sleep(max(0.0, at - asyncio.get_running_loop().time()))
+        self._marks.pop(name, None)
+        await ws.send(json.dumps({'event': 'mark', 'streamSid': self.stream_sid, 'mark': {'name': name}}))
+        self._played.set()
+
+
+async def replay_calls(url: str, calls: Sequence[FakeTwilioCall]) -> List[CallReport]:
+    return await asyncio.gather(*(call.run() for call in calls))
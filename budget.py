@@ -0,0 +1,84 @@
+"""How long an answer may run, from the Response Length and Speech Speed settings.
+
+Response Length sets the word target the prompt asks for. The budget turns it
+into limits that hold even when the model overruns:
+
+  max_tokens   room for the target plus the greeting, closing, hours and
+               callback lines the prompt asks for, so generation ends early
+  max_words    the spoken cap: the reply is cut after the last whole sentence
+               that fits, and the rest is neither generated nor synthesized
+  stop         sequences that end a reply the caller shouldn't hear the rest
+               of, such as the model starting to write the customer's part
+
+Speech speed is clamped to what the TTS endpoint accepts. At a given word count,
+faster speech makes for shorter audio, so ``seconds`` is what the caller hears.
+"""
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Tuple
+
+LENGTH_WORDS = {'Very Short': 30, 'Short': 60, 'Medium': 100, 'Long': 160}
+WORDS_PER_SECOND = 2.5  # tts-1 at speed 1.0 speaks about 150 words a minute
+TOKENS_PER_WORD = 1.5  # generous for English, so max_tokens rarely cuts a sentence the word cap would keep
+LENGTH_SLACK = 1.25  # "under 100 words" is read loosely; only well past it is the reply cut
+MIN_SPEED, MAX_SPEED = 0.25, 4.0
+
+GREETING_WORDS = 20  # "Hello! Thank you for calling ..." and "Is there anything else ...? Have a great day!"
+CALLBACK_WORDS = 8
+HOURS_WORDS = 5  # plus the hours themselves
+STOP = ("\nCustomer:", "\nCaller:")
+STOP_GREETED = ("Is there anything else",)  # the recorded closing asks this after the answer
+
+
+@dataclass(frozen=True)
+class GenerationBudget:
+    max_tokens: int
+    max_words: int
+    stop: Tuple[str, ...]
+    speed: float
+
+    @property
+    def seconds(self) -> float:
+        """Longest the answer can be spoken for."""
+        return spoken_seconds(self.max_words, self.speed)
+
+
+def spoken_seconds(words: int, speed: float = 1.0) -> float:
+    return words / (WORDS_PER_SECOND * speed)
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+# Memoized like the prompt it goes with: built once per business and settings
+@lru_cache(maxsize=8192)
+def compile_budget(business_name: str, business_hours: str, response_length: str = 'Medium',
+                   include_callback: bool = True, include_hours: bool = True, greeted: bool = False,
+                   speed: float = 1.0, max_tokens: int = None) -> GenerationBudget:
+    words = round(LENGTH_WORDS.get(response_length, 100) * LENGTH_SLACK)
+    if not greeted:
+        words += GREETING_WORDS + count_words(business_name)
+    if include_callback:
+        words += CALLBACK_WORDS
+    if include_hours:
+        words += HOURS_WORDS + count_words(business_hours)
+    tokens = math.ceil(words * TOKENS_PER_WORD) + 20
+    return GenerationBudget(
+        max_tokens=min(tokens, max_tokens) if max_tokens else tokens,
+        max_words=words,
+        stop=STOP + STOP_GREETED if greeted else STOP,
+        speed=min(MAX_SPEED, max(MIN_SPEED, float(speed)))
+    )
+
+
+def trim_to_budget(sentences, max_words: int) -> Tuple[list, bool]:
+    """The leading sentences that fit in ``max_words`` (always at least one), and whether any were cut."""
+    kept, words = [], 0
+    for sentence in sentences:
+        words += count_words(sentence)
+        if kept and words > max_words:
+            return kept, True
+        kept.append(sentence)
+    return kept, False
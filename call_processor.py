@@ -0,0 +1,534 @@
+"""Headless call processing: transcription, response generation and synthesis.
+
+voice_app.py drives this through ``run_sync``/``iterate_sync``; servers and
+scripts can ``await CallProcessor.process`` directly and share one processor
+across many concurrent calls.
+"""
+import asyncio
+import threading
+import time
+from contextlib import aclosing
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from openai import AsyncOpenAI
+
+from clients import get_client, shared
+from answer_cache import AnswerCache, fingerprint
+from audio_io import BytesLike, wav_seconds
+from backends import OPENAI, SpeechToText, TextToSpeech, parse_backend, speech_to_text, text_to_speech
+from budget import LENGTH_WORDS, GenerationBudget, compile_budget, trim_to_budget
+from intents import IntentClassifier
+from metrics import METRICS
+from phrases import BOOKENDS, PhraseBank
+from preprocess import PreprocessConfig, preprocess
+from replays import ReplayStore, Upload
+from sessions import SessionStore
+from pipeline import AudioChunk, join_audio, split_sentences, stream_chat_text, stream_voice_response, synthesize
+from tts_cache import TTSCache
+
+
+# ==================== CONFIG & RESULT ====================
+@dataclass
+class CallConfig:
+    business_name: str = 'My Business'
+    phone_number: str = '+1234567890'
+    business_hours: str = '9 AM - 9 PM, Monday to Saturday'
+    voice: str = 'nova'
+    speed: float = 1.0
+    stt_model: str = 'whisper-1'
+    chat_model: str = 'gpt-4o'
+    tts_model: str = 'tts-1'
+    # Where speech is transcribed and synthesized: 'openai', or a local backend such as
+    # 'faster-whisper' or 'piper:en_US-amy-medium' (backends.py)
+    stt_backend: str = 'openai'
+    tts_backend: str = 'openai'
+    temperature: float = 0.7
+    # Ceiling on the generation budget (budget.py), which Response Length, the business
+    # details and whether the reply is bookended already size; None leaves it to them
+    max_tokens: Optional[int] = None
+    # Speech format requested from TTS; the phone gateway asks for raw 24 kHz 'pcm'
+    audio_format: str = 'mp3'
+    # How answers are written (the app's Advanced Settings, or a tenant's profile)
+    response_style: str = 'Professional'
+    response_length: str = 'Medium'
+    include_callback: bool = True
+    include_hours: bool = True
+    # Which business the call belongs to (tenants.py); '' for a single-business deployment
+    tenant: str = ''
+    # Set per reply when pre-rendered greeting and closing clips (phrases.py) bookend the answer
+    greeted: bool = False
+    # Who is calling (their number); with a session store, their turns and calls continue one
+    # conversation (sessions.py). '' answers every message on its own
+    caller: str = ''
+
+
+@dataclass
+class CallResult:
+    customer_message: str
+    ai_response: str
+    audio: bytes
+    timestamp: str = field(default_factory=lambda: datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    timings: Dict[str, float] = field(default_factory=dict)
+    # Served from an earlier submission of the same recording (replays.py) rather than answered again
+    replay: bool = False
+    # Where both sides of the call were archived (archive.py), if they were
+    audio_ref: Optional[str] = None
+
+    def to_record(self) -> dict:
+        return {
+            'timestamp': self.timestamp,
+            'customer_message': self.customer_message,
+            'ai_response': self.ai_response,
+            'duration': 'N/A',
+            'audio_ref': self.audio_ref,
+            'replay': int(self.replay)
+        }
+
+
+STYLE_WORDS = {'Professional': 'professional', 'Friendly': 'friendly', 'Casual': 'relaxed, casual', 'Formal': 'formal'}
+
+
+def build_system_prompt(config: CallConfig) -> str:
+    return compile_prompt(config.business_name, config.phone_number, config.business_hours, config.response_style,
+                          config.response_length, config.include_callback, config.include_hours, config.greeted)
+
+
+def generation_budget(config: CallConfig) -> GenerationBudget:
+    return compile_budget(config.business_name, config.business_hours, config.response_length,
+                          config.include_callback, config.include_hours, config.greeted, config.speed,
+                          config.max_tokens)
+
+
+# The same for every business and setting, so it leads the prompt: with the conversation
+# after the system prompt, requests share the longest byte-stable prefix for prompt caching
+PROMPT_PREFIX = """You are a phone answering assistant for a business, talking with a customer on a phone call.
+
+Your role:
+- Answer customer questions using the business details below
+- Provide business information clearly
+- Be friendly and helpful
+- If asked about hours, services, location, or contact - provide the information
+- Speak naturally as if on a phone call
+- Earlier turns of the conversation may come before the customer's message: carry on from them without repeating yourself
+"""
+
+
+# Memoized: a business's prompt is built once, not on every call or turn
+@lru_cache(maxsize=8192)
+def compile_prompt(business_name: str, phone_number: str, business_hours: str, response_style: str = 'Professional',
+                   response_length: str = 'Medium', include_callback: bool = True, include_hours: bool = True,
+                   greeted: bool = False) -> str:
+    style = STYLE_WORDS.get(response_style, response_style.lower())
+    words = LENGTH_WORDS.get(response_length, 100)
+    unknown_line = "\n- If you don't know something, politely say you'll have someone call them back" if include_callback else ""
+    callback_line = "\n- Mention the phone number if they need to call back" if include_callback else ""
+    hours_line = "\n- Mention the business hours in every answer" if include_hours else ""
+    closing = f" Feel free to call us at {phone_number}." if include_callback else ""
+    business = f"""
+Business: {business_name}
+Phone Number: {phone_number}
+Business Hours: {business_hours}
+
+For this business:
+- Answer in a {style} tone
+- Keep responses concise (under {words} words){unknown_line}
+"""
+    if greeted:
+        # The greeting and closing are played from recordings around the answer
+        return PROMPT_PREFIX + business + f"""
+Always:
+- Start directly with the answer: the caller has already been greeted and thanked for calling
+- Don't ask if there is anything else or say goodbye: a closing is played after your answer{hours_line}
+
+Example response style:
+"[Answer their question]."
+"""
+    return PROMPT_PREFIX + business + f"""
+Always:
+- Greet the customer warmly at the start of the call
+- End with a friendly closing{callback_line}{hours_line}
+
+Example response style:
+"Hello! Thank you for calling {business_name}. [Answer their question]. Is there anything else I can help you with today?{closing} Have a great day!"
+"""
+
+
+@lru_cache(maxsize=8192)
+def prompt_key(system_prompt: str, chat_model: str) -> str:
+    """Answer-cache partition for a prompt and model."""
+    return fingerprint(system_prompt, chat_model)
+
+
+def build_messages(customer_message: str, config: CallConfig, history: List[dict] = ()) -> List[dict]:
+    """System prompt, then the conversation so far (sessions.py), then the new message."""
+    return [
+        {"role": "system", "content": build_system_prompt(config)},
+        *history,
+        {"role": "user", "content": customer_message}
+    ]
+
+
+@dataclass
+class RouteStats:
+    """How many responses each route produced (llm, answer_cache, fast_path) and how long they took."""
+    counts: Dict[str, int] = field(default_factory=dict)
+    seconds: Dict[str, float] = field(default_factory=dict)
+
+    def record(self, source: str, elapsed: float):
+        self.counts[source] = self.counts.get(source, 0) + 1
+        self.seconds[source] = self.seconds.get(source, 0.0) + elapsed
+
+    def share(self, source: str) -> float:
+        total = sum(self.counts.values())
+        return self.counts.get(source, 0) / total if total else 0.0
+
+    def mean_latency(self, source: str) -> Optional[float]:
+        count = self.counts.get(source)
+        return self.seconds[source] / count if count else None
+
+
+# ==================== PROCESSOR ====================
+class CallProcessor:
+    """Runs the STT -> LLM -> TTS flow for a call on one shared ``AsyncOpenAI`` client."""
+
+    def __init__(self, client: AsyncOpenAI, tts_cache: Optional[TTSCache] = None,
+                 answer_cache: Optional[AnswerCache] = None, intents: Optional[IntentClassifier] = None,
+                 preprocess_config: Optional[PreprocessConfig] = None, phrases: Optional[PhraseBank] = None,
+                 replays: Optional[ReplayStore] = None, sessions: Optional[SessionStore] = None):
+        self.client = client
+        self.preprocess_config = preprocess_config
+        self.tts_cache = tts_cache
+        self.answer_cache = answer_cache
+        self.intents = intents
+        self.phrases = phrases
+        self.replays = replays
+        self.sessions = sessions
+        self.route_stats = RouteStats()
+
+    @classmethod
+    def from_api_key(cls, api_key: str, base_url: str = None, **caches) -> 'CallProcessor':
+        return cls(get_client(api_key, base_url=base_url), **caches)
+
+    async def transcribe(self, audio_bytes: BytesLike, config: CallConfig, filename: str = 'audio.mp3',
+                         report: Optional[dict] = None, prepare: bool = True, upload: Optional[Upload] = None) -> str:
+        """Transcribe a recording, shrinking and chunking it first when preprocessing is on.
+
+        ``report`` (if given) receives preprocessing/STT seconds, upload bytes saved,
+        silence trimmed and the time saved by transcribing chunks in parallel.
+        ``prepare=False`` skips preprocessing for audio that is already compact,
+        such as 8 kHz phone turns. Local backends never need it: it exists to
+        shrink uploads. With ``upload`` (``replays.identify``) and a replay store,
+        a recording transcribed before by the same engine isn't sent again;
+        ``report['transcript_replayed']`` is then True.
+        """
+        report = report if report is not None else {}
+        if self.replays is None or upload is None:
+            return await self._transcribe(audio_bytes, config, filename, report, prepare)
+        key = self.transcript_key(config)
+        text = await asyncio.to_thread(self.replays.transcript, upload, key)
+        report['transcript_replayed'] = text is not None
+        if text is None:
+            text = await self._transcribe(audio_bytes, config, filename, report, prepare)
+            await asyncio.to_thread(self.replays.put_transcript, upload, key, text)
+        return text
+
+    async def _transcribe(self, audio_bytes: BytesLike, config: CallConfig, filename: str, report: dict,
+                          prepare: bool) -> str:
+        stt = self.speech_to_text(config)
+        if self.preprocess_config is None or not prepare or not stt.remote:
+            start = time.perf_counter()
+            text = await stt.transcribe(audio_bytes, filename)
+            report['stt'] = time.perf_counter() - start
+            METRICS.observe('stt', report['stt'])
+            self._bill_audio(stt, wav_seconds(audio_bytes))
+            return text
+
+        start = time.perf_counter()
+        prepared = await asyncio.to_thread(preprocess, audio_bytes, filename, self.preprocess_config)
+        report['preprocess'] = time.perf_counter() - start
+        METRICS.observe('preprocess', report['preprocess'])
+
+        async def timed(data, name):
+            chunk_start = time.perf_counter()
+            text = await stt.transcribe(data, name)
+            return text, time.perf_counter() - chunk_start
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(timed(data, name) for name, data in prepared.chunks))
+        report['stt'] = time.perf_counter() - start
+        report['stt_chunks'] = len(prepared.chunks)
+        report['upload_bytes'] = prepared.uploaded_bytes
+        report['upload_bytes_saved'] = prepared.bytes_saved
+        report['silence_trimmed'] = prepared.trimmed_ms / 1000
+        report['stt_parallel_saved'] = sum(elapsed for _, elapsed in results) - report['stt']
+        METRICS.observe('stt', report['stt'], chunks=len(prepared.chunks))
+        # Whisper bills the audio it receives: the trimmed recording, or the original when it was passed through
+        self._bill_audio(stt, (prepared.duration_ms - prepared.trimmed_ms) / 1000 if prepared.processed
+                         else wav_seconds(audio_bytes))
+        return " ".join(text for text, _ in results if text)
+
+    @staticmethod
+    def _bill_audio(stt: SpeechToText, seconds: Optional[float]):
+        # Unknown for compressed formats that were sent without decoding
+        if seconds is not None:
+            METRICS.add_usage(stt.model, audio_seconds=seconds)
+
+    def speech_to_text(self, config: CallConfig) -> SpeechToText:
+        return speech_to_text(config.stt_backend, self.client, config.stt_model)
+
+    def text_to_speech(self, config: CallConfig) -> TextToSpeech:
+        return text_to_speech(config.tts_backend, self.client, config.tts_model)
+
+    async def stream_response(self, customer_message: str, config: CallConfig, turn: int = 1,
+                              history: Optional[List[dict]] = None,
+                              lookahead: Optional[int] = None) -> AsyncIterator[AudioChunk]:
+        """The reply's audio, sentence by sentence; ``turn`` is the reply's place in the call (1 for the first).
+
+        ``history`` is the conversation so far as chat messages; None reads it from the session store.
+        ``lookahead`` bounds how far the model's answer runs ahead of the chunks taken (``stream_voice_response``).
+        """
+        start = time.perf_counter()
+        source = None
+        spoken = []
+        async with aclosing(self._respond(customer_message, config, turn, history, lookahead)) as chunks:
+            async for chunk in chunks:
+                if chunk.index == 0:
+                    METRICS.observe('first_audio', time.perf_counter() - start)
+                if source is None and chunk.source not in BOOKENDS:
+                    source = chunk.source
+                    METRICS.observe('first_answer_audio', time.perf_counter() - start)
+                spoken.append(chunk.text)
+                yield chunk
+        if source:
+            self.route_stats.record(source, time.perf_counter() - start)
+        self._record(customer_message, " ".join(spoken), config)
+
+    def prepare_phrases(self, config: CallConfig, loop: asyncio.AbstractEventLoop = None):
+        """Render this config's greeting, fillers and closing in the background, if the processor has a phrase bank."""
+        if self.phrases is not None:
+            return self.phrases.prepare(self.synthesize, config, loop)
+        return None
+
+    async def _respond(self, customer_message: str, config: CallConfig, turn: int = 1,
+                       history: Optional[List[dict]] = None,
+                       lookahead: Optional[int] = None) -> AsyncIterator[AudioChunk]:
+        history = self._history(config) if history is None else history
+        phrases = self.phrases.get(config) if self.phrases is not None else None
+        if phrases is None:
+            shortcut = self._shortcut(customer_message, config, history)
+            async for chunk in self._answer_audio(customer_message, config, shortcut, history, lookahead):
+                yield chunk
+            return
+
+        # Recorded bookends: the greeting (or, while the model is writing, a filler) plays at once
+        greeted = replace(config, greeted=True)
+        shortcut = self._shortcut(customer_message, greeted, history)
+        index = 0
+        if turn <= 1 or shortcut is None:
+            opener, kind = (phrases.greeting, 'greeting') if turn <= 1 else (phrases.filler(turn), 'filler')
+            yield AudioChunk(index=index, text=opener.text, audio=opener.audio, source=kind)
+            index += 1
+        async for chunk in self._answer_audio(customer_message, greeted, shortcut, history, lookahead):
+            yield replace(chunk, index=index)
+            index += 1
+        yield AudioChunk(index=index, text=phrases.closing.text, audio=phrases.closing.audio, source='closing')
+
+    async def _answer_audio(self, customer_message: str, config: CallConfig,
+                            shortcut: Optional[Tuple[str, str, Optional[bytes]]],
+                            history: List[dict] = (), lookahead: Optional[int] = None) -> AsyncIterator[AudioChunk]:
+        if shortcut is not None:
+            answer, source, audio = shortcut
+            async for chunk in self.speak(answer, config, source=source, audio=audio):
+                yield chunk
+            return
+
+        tts = self.text_to_speech(config)
+        budget = generation_budget(config)
+        chunks = []
+        async with aclosing(stream_voice_response(
+            self.client,
+            build_messages(customer_message, config, history),
+            config.voice,
+            speed=budget.speed,
+            max_tokens=budget.max_tokens,
+            temperature=config.temperature,
+            chat_model=config.chat_model,
+            tts_model=tts.model,
+            tts_cache=self.tts_cache,
+            response_format=config.audio_format,
+            tts_backend=tts,
+            stop=budget.stop,
+            max_words=budget.max_words,
+            lookahead=lookahead
+        )) as stream:
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        if not history:
+            self._remember(customer_message, " ".join(c.text for c in chunks), config, audio=join_audio(chunks))
+
+    async def answer(self, customer_message: str, config: CallConfig,
+                     history: Optional[List[dict]] = None) -> Tuple[str, str]:
+        """The reply text and its route, without synthesizing it; ``speak`` voices it later.
+
+        ``history`` is the conversation so far as chat messages; None reads it from the session store.
+        """
+        history = self._history(config) if history is None else history
+        shortcut = self._shortcut(customer_message, config, history)
+        if shortcut is not None:
+            self._record(customer_message, shortcut[0], config)
+            return shortcut[0], shortcut[1]
+        budget = generation_budget(config)
+        deltas = stream_chat_text(self.client, build_messages(customer_message, config, history),
+                                  model=config.chat_model, temperature=config.temperature,
+                                  max_tokens=budget.max_tokens, stop=budget.stop)
+        answer = "".join([delta async for delta in deltas]).strip()
+        sentences, cut = trim_to_budget(split_sentences([answer]), budget.max_words)
+        if cut:
+            METRICS.count('answers_cut', reason='words')
+            answer = " ".join(sentences)
+        if not history:
+            self._remember(customer_message, answer, config)
+        self._record(customer_message, answer, config)
+        return answer, 'llm'
+
+    def _history(self, config: CallConfig) -> List[dict]:
+        if self.sessions is None or not config.caller:
+            return []
+        return self.sessions.history(config.tenant, config.caller, config.chat_model)
+
+    def _record(self, customer_message: str, answer: str, config: CallConfig):
+        if self.sessions is not None and config.caller and answer:
+            self.sessions.record(self.client, config.tenant, config.caller, customer_message, answer,
+                                 config.chat_model)
+
+    def _shortcut(self, customer_message: str, config: CallConfig,
+                  history: List[dict] = ()) -> Optional[Tuple[str, str, Optional[bytes]]]:
+        """(answer, source, audio) from the intent fast path or the answer cache, if either has one.
+
+        Mid-conversation, the answer cache is skipped: a follow-up such as "and on
+        Sundays?" means something else without what came before it.
+        """
+        if self.intents is not None:
+            match = self.intents.classify(customer_message)
+            if match is not None:
+                answer = self.intents.render(match, config.business_name, config.phone_number, config.business_hours,
+                                             bookends=not config.greeted, include_callback=config.include_callback,
+                                             response_length=config.response_length)
+                return answer, 'fast_path', None
+        if self.answer_cache is not None and not history:
+            cached = self.answer_cache.lookup(customer_message, self._answer_key(config), self._voice_key(config),
+                                              config.speed, config.audio_format)
+            if cached is not None:
+                return cached.answer, 'answer_cache', cached.audio
+        return None
+
+    def _remember(self, customer_message: str, answer: str, config: CallConfig, audio: bytes = None):
+        if self.answer_cache is not None:
+            self.answer_cache.store(customer_message, answer, self._answer_key(config), self._voice_key(config),
+                                    config.speed, audio=audio, response_format=config.audio_format)
+
+    @staticmethod
+    def _answer_key(config: CallConfig) -> str:
+        return prompt_key(build_system_prompt(config), config.chat_model)
+
+    @staticmethod
+    def transcript_key(config: CallConfig) -> str:
+        """What a transcript depends on: the speech-to-text engine and model."""
+        return f"{config.stt_backend}|{config.stt_model}"
+
+    @classmethod
+    def replay_key(cls, config: CallConfig) -> str:
+        """What a whole call's result depends on, besides the recording: transcription, prompt and voice."""
+        return fingerprint(cls.transcript_key(config), cls._answer_key(config), cls._voice_key(config),
+                           f"{float(config.speed):.2f}", config.tts_model, config.audio_format)
+
+    @staticmethod
+    def _voice_key(config: CallConfig) -> str:
+        # Cached answer audio from a local voice must not be replayed for an OpenAI one, or the reverse
+        name = parse_backend(config.tts_backend)[0]
+        return config.voice if name == OPENAI else f"{config.voice}@{config.tts_backend}"
+
+    async def speak(self, text: str, config: CallConfig, source: str, audio: bytes = None) -> AsyncIterator[AudioChunk]:
+        """Voice a ready-made answer, sentence by sentence unless its audio is already known."""
+        if audio is not None:
+            yield AudioChunk(index=0, text=text, audio=audio, source=source)
+            return
+        sentences = list(split_sentences([text]))
+        tasks = [asyncio.create_task(self.synthesize(sentence, config)) for sentence in sentences]
+        try:
+            for index, (sentence, task) in enumerate(zip(sentences, tasks)):
+                yield AudioChunk(index=index, text=sentence, audio=await task, source=source)
+        finally:
+            for task in tasks:
+                task.cancel()
+                if task.done() and not task.cancelled():
+                    task.exception()  # retrieved, so an abandoned sentence's error isn't logged
+
+    async def synthesize(self, text: str, config: CallConfig) -> bytes:
+        tts = self.text_to_speech(config)
+        speed = generation_budget(config).speed
+        return await synthesize(self.client, text, config.voice, model=tts.model, speed=speed,
+                                cache=self.tts_cache, response_format=config.audio_format, backend=tts)
+
+    async def process(self, audio_bytes: BytesLike, config: CallConfig, filename: str = 'audio.mp3') -> CallResult:
+        timings = {}
+        start = time.perf_counter()
+        customer_message = await self.transcribe(audio_bytes, config, filename, report=timings)
+
+        chunks = []
+        async for chunk in self.stream_response(customer_message, config):
+            if not chunks:
+                timings['first_audio'] = time.perf_counter() - start
+            if 'first_answer_audio' not in timings and chunk.source not in BOOKENDS:
+                timings['first_answer_audio'] = time.perf_counter() - start
+            chunks.append(chunk)
+        timings['total'] = time.perf_counter() - start
+
+        return CallResult(
+            customer_message=customer_message,
+            ai_response=" ".join(chunk.text for chunk in chunks),
+            audio=join_audio(chunks),
+            timings=timings
+        )
+
+    async def aclose(self):
+        """Close the client, unless it is the key's shared one (``clients.get_client``), which others still use."""
+        if not shared(self.client):
+            await self.client.close()
+
+
+# ==================== SYNC BRIDGE ====================
+# Streamlit reruns are synchronous. Every coroutine runs on one long-lived loop
+# so the client's connection pool survives between reruns instead of being
+# bound to a loop that asyncio.run() tears down after each call.
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='call-processor-loop', daemon=True).start()
+    return _loop
+
+
+def run_sync(coro):
+    return asyncio.run_coroutine_threadsafe(coro, background_loop()).result()
+
+
+def iterate_sync(async_iter) -> Iterator:
+    loop = background_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(async_iter.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(async_iter.aclose(), loop).result()
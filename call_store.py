@@ -0,0 +1,271 @@
+"""Persistent call history in SQLite.
+
+WAL mode so the UI can read while calls are being written, an index on
+timestamp, and an FTS5 index over what the customer said and what the
+assistant answered. Writes are queued and committed in batches by a single
+writer thread; a read first waits for the writes queued before it, so a
+session sees its own calls, but not for those queued after it, and for no
+more than ``read_wait`` seconds: a writer falling behind slows reads no
+further than that (they may then miss the newest calls).
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from paths import data_dir
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    # v1
+    """
+    CREATE TABLE IF NOT EXISTS calls (
+        id INTEGER PRIMARY KEY,
+        timestamp TEXT NOT NULL,
+        customer_message TEXT NOT NULL DEFAULT '',
+        ai_response TEXT NOT NULL DEFAULT '',
+        duration TEXT NOT NULL DEFAULT 'N/A'
+    );
+    CREATE INDEX IF NOT EXISTS calls_timestamp ON calls(timestamp);
+    CREATE VIRTUAL TABLE IF NOT EXISTS calls_fts USING fts5(
+        customer_message, ai_response, content='calls', content_rowid='id'
+    );
+    CREATE TRIGGER IF NOT EXISTS calls_ai AFTER INSERT ON calls BEGIN
+        INSERT INTO calls_fts(rowid, customer_message, ai_response)
+        VALUES (new.id, new.customer_message, new.ai_response);
+    END;
+    CREATE TRIGGER IF NOT EXISTS calls_ad AFTER DELETE ON calls BEGIN
+        INSERT INTO calls_fts(calls_fts, rowid, customer_message, ai_response)
+        VALUES ('delete', old.id, old.customer_message, old.ai_response);
+    END;
+    """,
+    # v2: where a call's recorded audio lives, for exports and playback
+    """
+    ALTER TABLE calls ADD COLUMN audio_ref TEXT;
+    """,
+    # v3: which business (tenants.py) answered the call; '' for single-business deployments
+    """
+    ALTER TABLE calls ADD COLUMN tenant TEXT NOT NULL DEFAULT '';
+    CREATE INDEX IF NOT EXISTS calls_tenant ON calls(tenant, id);
+    """,
+    # v4: 1 when the call was a resubmitted recording answered from replays.py instead of the API
+    """
+    ALTER TABLE calls ADD COLUMN replay INTEGER NOT NULL DEFAULT 0;
+    """,
+]
+
+COLUMNS = ('timestamp', 'customer_message', 'ai_response', 'duration', 'audio_ref', 'tenant', 'replay')
+DEFAULTS = {'duration': 'N/A', 'audio_ref': None, 'tenant': '', 'replay': 0}
+
+
+def _value(record: dict, column: str):
+    value = record.get(column, DEFAULTS.get(column, ''))
+    return None if value is None else str(value)
+
+
+def _tenant_filter(tenant: Optional[str], prefix: str = 'WHERE ') -> Tuple[str, tuple]:
+    return ('', ()) if tenant is None else (f'{prefix}tenant = ?', (tenant,))
+
+
+def _statements(script: str) -> Iterator[str]:
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ''
+
+
+def fts_query(text: str) -> str:
+    # Quote each word so punctuation in a transcript can't be read as FTS syntax
+    return ' '.join(f'"{term}"' for term in text.replace('"', ' ').split())
+
+
+class CallStore:
+    def __init__(self, path: str = None, batch_size: int = 256, flush_interval: float = 0.05,
+                 read_wait: float = 1.0):
+        self.path = path or f"{data_dir()}/calls.db"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.read_wait = read_wait
+        self._local = threading.local()
+        self._pending: "queue.Queue[Optional[dict]]" = queue.Queue()
+        self._queued = 0  # records added so far
+        self._saved = 0  # of those, committed or dropped
+        self._saved_changed = threading.Condition()
+        self._migrate()
+        self._writer = threading.Thread(target=self._write_loop, name='call-store-writer', daemon=True)
+        self._writer.start()
+
+    # ==================== CONNECTIONS ====================
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _migrate(self):
+        conn = self._connect()
+        conn.isolation_level = None
+        # The version is read and every step applied under one write lock, so processes opening
+        # the store at once (the app and its call workers, jobs.py) can't both apply a step
+        conn.execute('BEGIN IMMEDIATE')
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, script in enumerate(SCHEMA[version:], start=version + 1):
+            for statement in _statements(script):
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {number}')
+        conn.execute('COMMIT')
+        conn.close()
+
+    # ==================== WRITES ====================
+    def add(self, record: dict):
+        """Queue a call record; it is committed with the next batch."""
+        self.add_many([record])
+
+    def add_many(self, records: List[dict]):
+        with self._saved_changed:
+            # Numbered in queue order, so flush() knows which batch is the last it waits for
+            for record in records:
+                self._queued += 1
+                self._pending.put(record)
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until every record queued before this call is committed (or dropped after failing).
+
+        Records queued meanwhile aren't waited for. Returns False if ``timeout`` seconds ran out first.
+        """
+        with self._saved_changed:
+            target = self._queued
+            return self._saved_changed.wait_for(lambda: self._saved >= target, timeout)
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._pending.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._pending.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            records = [r for r in batch if r is not None]
+            try:
+                if records:
+                    self._insert(conn, records)
+            finally:
+                with self._saved_changed:
+                    self._saved += len(records)
+                    self._saved_changed.notify_all()
+            if None in batch:
+                conn.close()
+                return
+
+    def _insert(self, conn: sqlite3.Connection, records: List[dict], attempts: int = 3):
+        # A failed batch is retried, then dropped; the writer must outlive it, or flush() never returns
+        for attempt in range(1, attempts + 1):
+            try:
+                with conn:
+                    conn.executemany(
+                        f"INSERT INTO calls ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                        [tuple(_value(r, c) for c in COLUMNS) for r in records]
+                    )
+                return
+            except sqlite3.OperationalError:
+                # Locked by another process past the busy timeout, or the disk is full
+                if attempt == attempts:
+                    logger.exception("dropped %d call(s) that could not be saved to %s", len(records), self.path)
+                    return
+                logger.warning("saving %d call(s) failed (attempt %d of %d); retrying", len(records), attempt,
+                               attempts, exc_info=True)
+                time.sleep(attempt)
+            except sqlite3.Error:
+                logger.exception("dropped %d call(s) that could not be saved to %s", len(records), self.path)
+                return
+
+    def clear(self):
+        self.flush()
+        with self._conn as conn:
+            conn.execute('DELETE FROM calls')
+
+    def close(self):
+        self._pending.put(None)
+        self._writer.join()
+
+    # ==================== READS ====================
+    # ``tenant`` narrows every read to one business's partition; None reads all of them
+    def count(self, tenant: str = None) -> int:
+        self.flush(self.read_wait)
+        if tenant is None:
+            return self._conn.execute('SELECT COUNT(*) FROM calls').fetchone()[0]
+        return self._conn.execute('SELECT COUNT(*) FROM calls WHERE tenant = ?', (tenant,)).fetchone()[0]
+
+    def page(self, page: int = 0, page_size: int = 20, tenant: str = None) -> List[Dict]:
+        """Newest-first page of calls; ``page`` is zero-based."""
+        self.flush(self.read_wait)
+        where, params = _tenant_filter(tenant)
+        rows = self._conn.execute(
+            f'SELECT * FROM calls {where} ORDER BY id DESC LIMIT ? OFFSET ?', (*params, page_size, page * page_size)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def search(self, query: str, limit: int = 20, offset: int = 0, tenant: str = None) -> List[Dict]:
+        """Full-text search over what was said; newest matches first."""
+        self.flush(self.read_wait)
+        terms = fts_query(query)
+        if not terms:
+            return []
+        where, params = _tenant_filter(tenant, 'AND calls.')
+        rows = self._conn.execute(
+            'SELECT calls.* FROM calls_fts JOIN calls ON calls.id = calls_fts.rowid '
+            f'WHERE calls_fts MATCH ? {where} ORDER BY calls.id DESC LIMIT ? OFFSET ?',
+            (terms, *params, limit, offset)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def search_count(self, query: str, tenant: str = None) -> int:
+        self.flush(self.read_wait)
+        terms = fts_query(query)
+        if not terms:
+            return 0
+        if tenant is None:
+            return self._conn.execute('SELECT COUNT(*) FROM calls_fts WHERE calls_fts MATCH ?', (terms,)).fetchone()[0]
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM calls_fts JOIN calls ON calls.id = calls_fts.rowid '
+            'WHERE calls_fts MATCH ? AND calls.tenant = ?', (terms, tenant)
+        ).fetchone()[0]
+
+    def iter_range(self, start: str = None, end: str = None, chunk_size: int = 5000,
+                   tenant: str = None) -> Iterator[Dict]:
+        """Oldest-first calls with ``start <= timestamp < end``, fetched ``chunk_size`` rows at a time."""
+        self.flush(self.read_wait)
+        clauses, params = [], []
+        if tenant is not None:
+            clauses.append('tenant = ?')
+            params.append(tenant)
+        if start:
+            clauses.append('timestamp >= ?')
+            params.append(start)
+        if end:
+            clauses.append('timestamp < ?')
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        # A dedicated connection, so paging through history elsewhere can't disturb this cursor
+        conn = self._connect()
+        try:
+            cursor = conn.execute(f'SELECT * FROM calls {where} ORDER BY timestamp, id', params)
+            while rows := cursor.fetchmany(chunk_size):
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
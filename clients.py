@@ -0,0 +1,204 @@
+"""Process-wide registry of pooled, long-lived OpenAI clients.
+
+Creating ``AsyncOpenAI`` per button click throws away its connection pool, so
+every call pays TCP + TLS setup again. ``get_client`` hands out one client per
+API key for the life of the process, on a keep-alive pool (HTTP/2 when the
+``h2`` package is installed) that reports its own statistics. Requests go
+through the client's ``RequestScheduler`` (scheduler.py), which does rate
+limiting, adaptive concurrency, retries and hedging in place of the SDK's
+own retries.
+"""
+import os
+import threading
+from dataclasses import dataclass, replace
+from typing import Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+from scheduler import RequestScheduler, SchedulerSettings
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# ==================== SETTINGS ====================
+@dataclass(frozen=True)
+class PoolSettings:
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 60.0
+    write_timeout: float = 30.0
+    pool_timeout: float = 10.0
+    http2: bool = True
+
+    @classmethod
+    def from_env(cls) -> 'PoolSettings':
+        settings = cls()
+        overrides = {}
+        for name, value in vars(settings).items():
+            raw = os.environ.get(f"VOICE_POOL_{name.upper()}")
+            if raw is None:
+                continue
+            if isinstance(value, bool):
+                overrides[name] = raw.lower() in ('1', 'true', 'yes')
+            else:
+                overrides[name] = type(value)(raw)
+        return replace(settings, **overrides)
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout
+        )
+
+
+# ==================== POOL STATISTICS ====================
+@dataclass
+class PoolStats:
+    requests: int = 0
+    connections_opened: int = 0
+    waiting: int = 0
+    in_flight: int = 0
+    open_connections: int = 0
+    http2: bool = False
+
+    @property
+    def reused(self) -> int:
+        return max(0, self.requests - self.connections_opened)
+
+    def as_dict(self) -> dict:
+        return {
+            'open': self.open_connections,
+            'opened_total': self.connections_opened,
+            'reused': self.reused,
+            'waiting': self.waiting,
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'http2': self.http2
+        }
+
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """Connection-pooling transport that counts new vs reused connections.
+
+    httpcore's ``trace`` extension reports when a TCP connection is opened and
+    when request headers start going out; a request that has started but not
+    yet sent headers is waiting for a pool slot.
+    """
+
+    def __init__(self, stats: PoolStats, scheduler: Optional[RequestScheduler] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+        self.scheduler = scheduler
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.scheduler is not None:
+            return await self.scheduler.send(request, self._send)
+        return await self._send(request)
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        stats = self.stats
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.waiting += 1
+        acquired = False
+
+        async def trace(event, info):
+            nonlocal acquired
+            if event == 'connection.connect_tcp.complete':
+                stats.connections_opened += 1
+            elif event.endswith('send_request_headers.started') and not acquired:
+                acquired = True
+                stats.waiting -= 1
+
+        request.extensions = {**request.extensions, 'trace': trace}
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            if not acquired:
+                stats.waiting -= 1
+            stats.in_flight -= 1
+
+    def snapshot(self) -> dict:
+        self.stats.open_connections = len(self._pool.connections)
+        return self.stats.as_dict()
+
+
+# ==================== REGISTRY ====================
+_clients: Dict[Tuple[str, str, PoolSettings, SchedulerSettings], Tuple[AsyncOpenAI, InstrumentedTransport]] = {}
+_clients_lock = threading.Lock()
+
+
+def build_client(api_key: str, settings: PoolSettings = None, base_url: str = None,
+                 scheduling: SchedulerSettings = None, **client_kwargs) -> Tuple[AsyncOpenAI, InstrumentedTransport]:
+    settings = settings or PoolSettings.from_env()
+    scheduling = scheduling or SchedulerSettings.from_env()
+    use_http2 = settings.http2 and HTTP2_AVAILABLE
+    scheduler = RequestScheduler(scheduling) if scheduling.enabled else None
+    transport = InstrumentedTransport(PoolStats(http2=use_http2), scheduler, limits=settings.limits(),
+                                      http2=use_http2)
+    http_client = httpx.AsyncClient(transport=transport, timeout=settings.timeout())
+    if scheduler is not None:
+        client_kwargs.setdefault('max_retries', 0)  # the scheduler retries, and knows about every caller
+    client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client,
+                         timeout=settings.timeout(), **client_kwargs)
+    return client, transport
+
+
+def get_client(api_key: str, settings: PoolSettings = None, base_url: str = None,
+               scheduling: SchedulerSettings = None) -> AsyncOpenAI:
+    """Return the shared client for this key, creating it on first use."""
+    settings = settings or PoolSettings.from_env()
+    scheduling = scheduling or SchedulerSettings.from_env()
+    key = (api_key, base_url or '', settings, scheduling)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = build_client(api_key, settings, base_url, scheduling)
+        return _clients[key][0]
+
+
+def _transport_for(client: AsyncOpenAI) -> Optional[InstrumentedTransport]:
+    for registered, transport in list(_clients.values()):
+        if registered is client:
+            return transport
+    return None
+
+
+def pool_stats(client: AsyncOpenAI) -> dict:
+    transport = _transport_for(client)
+    return transport.snapshot() if transport is not None else {}
+
+
+def shared(client: AsyncOpenAI) -> bool:
+    """Whether the client came from ``get_client``, so other users of its key hold it too."""
+    with _clients_lock:
+        return any(registered is client for registered, _ in _clients.values())
+
+
+def scheduled(client: AsyncOpenAI) -> bool:
+    """Whether the client's requests go through a RequestScheduler, which retries them itself."""
+    transport = _transport_for(client)
+    return transport is not None and transport.scheduler is not None
+
+
+def scheduler_stats(client: AsyncOpenAI) -> dict:
+    """Per-endpoint concurrency limit, retries, 429s and hedges; empty when scheduling is off."""
+    transport = _transport_for(client)
+    if transport is None or transport.scheduler is None:
+        return {}
+    return transport.scheduler.snapshot()
@@ -0,0 +1,96 @@
+"""Streaming export of call history to JSON Lines, CSV or Parquet.
+
+Records are pulled from a generator and written in fixed-size chunks, so peak
+memory depends on the chunk size, not on how many calls are exported.
+Parquet needs pyarrow, which is optional.
+"""
+import csv
+import io
+import json
+from datetime import date, timedelta
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+FIELDS = ['id', 'timestamp', 'customer_message', 'ai_response', 'duration']
+AUDIO_FIELDS = ['audio_ref']
+
+FORMATS = {
+    'jsonl': ('JSON Lines', 'application/x-ndjson'),
+    'csv': ('CSV', 'text/csv'),
+    'parquet': ('Parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def available_formats() -> List[str]:
+    return [fmt for fmt in FORMATS if fmt != 'parquet' or pa is not None]
+
+
+def date_bounds(start: Optional[date], end: Optional[date]):
+    """Timestamp strings for an inclusive date range, in the store's 'YYYY-MM-DD HH:MM:SS' format."""
+    lower = f"{start.isoformat()} 00:00:00" if start else None
+    upper = f"{(end + timedelta(days=1)).isoformat()} 00:00:00" if end else None
+    return lower, upper
+
+
+def chunked(records: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    records = iter(records)
+    while chunk := list(islice(records, size)):
+        yield chunk
+
+
+# ==================== WRITERS ====================
+def write_jsonl(records: Iterable[dict], out: BinaryIO, fields: List[str], chunk_size: int) -> int:
+    count = 0
+    for chunk in chunked(records, chunk_size):
+        out.write(''.join(json.dumps({f: r.get(f) for f in fields}, ensure_ascii=False) + '\n' for r in chunk).encode())
+        count += len(chunk)
+    return count
+
+
+def write_csv(records: Iterable[dict], out: BinaryIO, fields: List[str], chunk_size: int) -> int:
+    count = 0
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='', write_through=True)
+    writer = csv.DictWriter(text, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for chunk in chunked(records, chunk_size):
+        writer.writerows(chunk)
+        count += len(chunk)
+    text.detach()
+    return count
+
+
+def write_parquet(records: Iterable[dict], out: BinaryIO, fields: List[str], chunk_size: int) -> int:
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+    schema = pa.schema([(f, pa.int64() if f == 'id' else pa.string()) for f in fields])
+    count = 0
+    # Each chunk becomes its own row group, so only one chunk is ever held in memory
+    with pq.ParquetWriter(out, schema, compression='zstd') as writer:
+        for chunk in chunked(records, chunk_size):
+            columns = {f: [r.get(f) for r in chunk] for f in fields}
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            count += len(chunk)
+    return count
+
+
+WRITERS = {'jsonl': write_jsonl, 'csv': write_csv, 'parquet': write_parquet}
+
+
+def export_records(records: Iterable[dict], fmt: str, out: BinaryIO, include_audio: bool = False,
+                   chunk_size: int = 5000) -> int:
+    """Write ``records`` to ``out`` in ``fmt``; returns the number of records written."""
+    fields = FIELDS + (AUDIO_FIELDS if include_audio else [])
+    return WRITERS[fmt](records, out, fields, chunk_size)
+
+
+def export_calls(store, fmt: str, out: BinaryIO, start: Optional[date] = None, end: Optional[date] = None,
+                 include_audio: bool = False, chunk_size: int = 5000, tenant: Optional[str] = None) -> int:
+    lower, upper = date_bounds(start, end)
+    records = store.iter_range(lower, upper, chunk_size=chunk_size, tenant=tenant)
+    return export_records(records, fmt, out, include_audio=include_audio, chunk_size=chunk_size)
@@ -0,0 +1,102 @@
+"""Rule-based fast path for business-info questions.
+
+Questions that only ask for the hours, the phone number or the business name
+are answered from a template filled with the profile fields, skipping the
+chat completion. Anything else, or anything ambiguous, falls through to the LLM.
+"""
+import re
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from budget import LENGTH_WORDS, count_words
+
+INTENT_PATTERNS = {
+    'hours': [
+        r"\b(business|opening|office|working|store) hours\b",
+        r"\bwhat are (your|the) hours\b",
+        r"\bwhat time (do|does|are) (you|they|it) (open|close)\b",
+        r"\bwhen (are|do) you (open|close)\b",
+        r"\bare you (open|closed)\b",
+        r"\bopen on (the )?(weekends?|saturdays?|sundays?|holidays?)\b",
+        r"\b(hours|open) (today|tomorrow)\b",
+    ],
+    'phone': [
+        r"\bphone number\b",
+        r"\b(how|where) (can|do|should|could) i (contact|reach|call)( you)?\b",
+        r"\bcontact (you|details|info|information|number)\b",
+        r"\bnumber (to|i can|i should) call\b",
+        r"\bcall (you )?back\b.*\bnumber\b",
+    ],
+    'business_name': [
+        r"\bwho (am i|is this) (calling|speaking|talking)\b",
+        r"\bwhat (business|company|place) is this\b",
+        r"\bwhat(' s|'s| is) (the |your )?(business|company) name\b",
+    ],
+}
+
+# Words that mean the caller wants something a template can't give them.
+BLOCKERS = re.compile(
+    r"\b(cancel|refund|order|appointment|book|booking|reserve|reservation|price|prices|cost|complain|complaint|"
+    r"manager|deliver|delivery|problem|issue|broken|service|services|location|address|directions|why|not)\b"
+)
+
+MAX_WORDS = 25
+
+COMPILED = {intent: [re.compile(p) for p in patterns] for intent, patterns in INTENT_PATTERNS.items()}
+
+
+@dataclass(frozen=True)
+class IntentMatch:
+    intents: Tuple[str, ...]
+    confidence: float
+
+
+class IntentClassifier:
+    def __init__(self, min_confidence: float = 0.8):
+        self.min_confidence = min_confidence
+
+    def classify(self, text: str) -> Optional[IntentMatch]:
+        normalized = re.sub(r"[^a-z0-9' ]+", ' ', text.lower())
+        words = normalized.split()
+        if not words:
+            return None
+
+        intents = tuple(intent for intent, patterns in COMPILED.items()
+                        if any(p.search(normalized) for p in patterns))
+        if not intents:
+            return None
+
+        confidence = 1.0
+        if BLOCKERS.search(normalized):
+            confidence -= 0.6
+        if len(words) > MAX_WORDS:
+            confidence -= 0.3
+        if len(intents) == 1 and ' and ' in f" {normalized} ":
+            # "hours and do you take walk-ins" - the second half isn't ours to answer
+            confidence -= 0.3
+        return IntentMatch(intents, confidence) if confidence >= self.min_confidence else None
+
+    def render(self, match: IntentMatch, business_name: str, phone_number: str, business_hours: str,
+               bookends: bool = True, include_callback: bool = True, response_length: str = 'Medium') -> str:
+        """The answer for a match; ``bookends=False`` leaves out the greeting and closing, for replies
+        that play recorded ones around it. ``include_callback`` and ``response_length`` are the
+        profile's, as the LLM is asked to follow them: past the length, the callback offer and then
+        "anything else" are left out, never the answer itself."""
+        parts = [f"Hello! Thank you for calling {business_name}."] if bookends else []
+        if 'business_name' in match.intents:
+            parts.append(f"You've reached {business_name}.")
+        if 'hours' in match.intents:
+            parts.append(f"Our business hours are {business_hours}.")
+        if 'phone' in match.intents:
+            parts.append(f"You can reach us at {phone_number}.")
+        if not bookends:
+            return " ".join(parts)
+        # Optional lines, in the order they go when the answer runs long
+        optional = []
+        if include_callback and 'phone' not in match.intents:
+            optional.append(f"Feel free to call us at {phone_number}.")
+        optional.append("Is there anything else I can help you with today?")
+        limit = LENGTH_WORDS.get(response_length, 100)
+        while optional and count_words(" ".join(parts + optional)) + 4 > limit:
+            optional.pop(0)
+        return " ".join(parts + optional[::-1] + ["Have a great day!"])
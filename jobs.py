@@ -0,0 +1,558 @@
+"""Durable queue for the app's calls, answered by worker processes.
+
+A submitted call is a row in ``jobs.db`` holding the upload, its settings and
+each stage as it completes: transcribed, then answered (the reply's text and
+audio). Worker processes lease a job and write every stage back before
+starting the next, so a call interrupted by a closed tab, a rerun, a server
+restart or a killed worker resumes from its last completed stage instead of
+starting over. The reply is streamed, as on the app's own calls: each sentence
+is stored the moment it is voiced, so the page plays it while the rest are
+still being written. A reply cut off mid-stream is written afresh on resume;
+the sentences it repeats come from the shared speech cache.
+
+Workers are spawned, sharing nothing with the Streamlit server but the
+database. A supervisor thread in the server restarts any that die and hands
+their jobs straight back to the queue. A job whose lease runs out (its worker
+hung, or the server went down with it) is taken up by the next free worker.
+
+API keys never touch the disk: a job records a hash of its key, and only a
+runner started with that key takes it.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from contextlib import aclosing
+from dataclasses import asdict, dataclass, field, replace
+from typing import Callable, Dict, List, Optional, Tuple
+
+import openai
+
+from call_processor import CallConfig, CallProcessor
+from metrics import METRICS, CallUsage, attach, call_scope
+from paths import data_dir
+from pipeline import AudioChunk, join_audio
+from phrases import BOOKENDS
+from replays import Replay, Upload
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('transcribed', 'answered')
+FINISHED = ('done', 'failed')
+RETRYABLE = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key_id TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',  -- queued, running, done or failed
+    stage TEXT NOT NULL DEFAULT '',  -- the last one completed
+    config TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    audio BLOB,  -- the upload, dropped once the call is done
+    digest TEXT,
+    fingerprint TEXT,
+    replay_key TEXT,
+    history TEXT NOT NULL DEFAULT '[]',
+    transcript TEXT,
+    answer TEXT,
+    source TEXT,
+    reply BLOB,
+    report TEXT NOT NULL DEFAULT '{}',
+    error TEXT,
+    error_type TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker INTEGER,
+    lease REAL NOT NULL DEFAULT 0,  -- running: held until; queued: not before
+    notified INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(key_id, state, lease);
+CREATE INDEX IF NOT EXISTS jobs_upload ON jobs(digest, replay_key);
+CREATE TABLE IF NOT EXISTS job_chunks (
+    job INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    audio BLOB NOT NULL,
+    PRIMARY KEY (job, idx)
+);
+"""
+JOB_COLUMNS = ('id, key_id, state, stage, config, filename, digest, fingerprint, replay_key, history, transcript, '
+               'answer, source, reply, report, error, error_type, attempts, worker, created, updated')
+
+
+@dataclass(frozen=True)
+class JobSettings:
+    workers: int = 2  # processes
+    jobs_per_worker: int = 4  # calls each process answers at once; they mostly wait on the API
+    lease: float = 30.0  # seconds a worker holds a job without renewing it before another may take it
+    poll: float = 0.2
+    max_attempts: int = 5  # leases (including resumes after a crash) before a job is failed
+    backoff: float = 1.0  # seconds before a job that hit a retryable API error is tried again, doubled each time
+    keep_seconds: float = 24 * 3600.0  # finished jobs are purged after this
+
+    @classmethod
+    def from_env(cls) -> 'JobSettings':
+        settings = cls()
+        overrides = {}
+        for name, value in vars(settings).items():
+            raw = os.environ.get(f"VOICE_JOB_{name.upper()}")
+            if raw is not None:
+                overrides[name] = type(value)(raw)
+        return replace(settings, **overrides)
+
+
+class NoSpeechError(Exception):
+    """The recording had nothing to answer."""
+
+
+def key_id(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+@dataclass
+class Job:
+    id: int
+    key_id: str
+    state: str
+    stage: str
+    config: CallConfig
+    filename: str
+    upload: Optional[Upload] = None
+    replay_key: Optional[str] = None
+    history: List[dict] = field(default_factory=list)
+    transcript: Optional[str] = None
+    answer: Optional[str] = None
+    source: Optional[str] = None
+    reply: Optional[bytes] = None
+    report: dict = field(default_factory=dict)
+    error: Optional[str] = None
+    error_type: Optional[str] = None
+    attempts: int = 0
+    worker: Optional[int] = None
+    created: float = 0.0
+    updated: float = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED
+
+    @classmethod
+    def from_row(cls, row: tuple) -> 'Job':
+        (id_, key, state, stage, config, filename, digest, fingerprint, replay_key, history, transcript, answer,
+         source, reply, report, error, error_type, attempts, worker, created, updated) = row
+        return cls(id_, key, state, stage, CallConfig(**json.loads(config)), filename,
+                   Upload(digest, fingerprint) if digest else None, replay_key, json.loads(history), transcript,
+                   answer, source, bytes(reply) if reply is not None else None, json.loads(report), error,
+                   error_type, attempts, worker, created, updated)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# ==================== QUEUE ====================
+class JobQueue:
+    def __init__(self, path: str = None, settings: JobSettings = None):
+        self.path = path or f"{data_dir()}/jobs.db"
+        self.settings = settings or JobSettings.from_env()
+        self._local = threading.local()
+        with self._conn as conn:
+            conn.executescript(SCHEMA)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def submit(self, key: str, audio: bytes, filename: str, config: CallConfig, upload: Upload = None,
+               replay_key: str = None, history: List[dict] = ()) -> int:
+        """Queue a call; the same upload with the same settings, still pending, is that job rather than a new one."""
+        now = time.time()
+        conn = self._conn
+        with conn:
+            # Taken before the lookup, so two tabs submitting the same upload at once can't both insert it
+            conn.execute('BEGIN IMMEDIATE')
+            if upload is not None:
+                row = conn.execute("SELECT id FROM jobs WHERE digest = ? AND replay_key IS ? AND key_id = ? "
+                                   "AND state IN ('queued', 'running')",
+                                   (upload.digest, replay_key, key)).fetchone()
+                if row is not None:
+                    return row[0]
+            cursor = conn.execute(
+                'INSERT INTO jobs (key_id, config, filename, audio, digest, fingerprint, replay_key, history, '
+                'created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, json.dumps(asdict(config)), filename, bytes(audio), upload.digest if upload else None,
+                 upload.fingerprint if upload else None, replay_key, json.dumps(list(history)), now, now)
+            )
+        return cursor.lastrowid
+
+    def get(self, job_id: int) -> Optional[Job]:
+        row = self._conn.execute(f'SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return Job.from_row(row) if row is not None else None
+
+    def audio(self, job_id: int) -> Optional[bytes]:
+        row = self._conn.execute('SELECT audio FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bytes(row[0]) if row is not None and row[0] is not None else None
+
+    def chunks(self, job_id: int) -> List[Tuple[int, str, bytes]]:
+        """The reply sentences voiced so far, in order."""
+        rows = self._conn.execute('SELECT idx, text, audio FROM job_chunks WHERE job = ? ORDER BY idx',
+                                  (job_id,)).fetchall()
+        return [(idx, text, bytes(audio)) for idx, text, audio in rows]
+
+    def counts(self, key: str = None) -> Dict[str, int]:
+        where, params = ('WHERE key_id = ?', (key,)) if key is not None else ('', ())
+        rows = self._conn.execute(f'SELECT state, COUNT(*) FROM jobs {where} GROUP BY state', params).fetchall()
+        return dict(rows)
+
+    # ==================== WORKERS ====================
+    def lease(self, key: str, worker: int) -> Optional[Job]:
+        """The oldest job this worker may take: queued and due, or running on a lapsed lease."""
+        now = time.time()
+        conn = self._conn
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            while True:
+                row = conn.execute(
+                    "SELECT id, attempts FROM jobs WHERE key_id = ? AND state IN ('queued', 'running') AND lease <= ? "
+                    "ORDER BY id LIMIT 1", (key, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                job_id, attempts = row
+                if attempts < self.settings.max_attempts:
+                    break
+                conn.execute("UPDATE jobs SET state = 'failed', error = ?, error_type = 'Abandoned', worker = NULL, "
+                             "updated = ? WHERE id = ?",
+                             (f"gave up after {attempts} attempts", now, job_id))
+            conn.execute("UPDATE jobs SET state = 'running', worker = ?, lease = ?, attempts = attempts + 1, "
+                         "updated = ? WHERE id = ?", (worker, now + self.settings.lease, now, job_id))
+        return self.get(job_id)
+
+    def renew(self, worker: int):
+        with self._conn as conn:
+            conn.execute("UPDATE jobs SET lease = ? WHERE worker = ? AND state = 'running'",
+                         (time.time() + self.settings.lease, worker))
+
+    def checkpoint(self, job_id: int, stage: str, **columns):
+        """Record a completed stage and what it produced."""
+        assignments = ''.join(f', {column} = ?' for column in columns)
+        with self._conn as conn:
+            conn.execute(f'UPDATE jobs SET stage = ?, updated = ?{assignments} WHERE id = ?',
+                         (stage, time.time(), *columns.values(), job_id))
+
+    def add_chunk(self, job_id: int, index: int, text: str, audio: bytes):
+        with self._conn as conn:
+            conn.execute('INSERT OR REPLACE INTO job_chunks VALUES (?, ?, ?, ?)', (job_id, index, text, audio))
+
+    def clear_chunks(self, job_id: int):
+        with self._conn as conn:
+            conn.execute('DELETE FROM job_chunks WHERE job = ?', (job_id,))
+
+    def finish(self, job_id: int, report: dict):
+        with self._conn as conn:
+            conn.execute("UPDATE jobs SET state = 'done', audio = NULL, report = ?, worker = NULL, updated = ? "
+                         "WHERE id = ?",
+                         (json.dumps(report), time.time(), job_id))
+            conn.execute('DELETE FROM job_chunks WHERE job = ?', (job_id,))
+
+    def fail(self, job_id: int, error: str, error_type: str, report: dict = None):
+        with self._conn as conn:
+            conn.execute("UPDATE jobs SET state = 'failed', error = ?, error_type = ?, report = ?, worker = NULL, "
+                         "updated = ? WHERE id = ?",
+                         (error, error_type, json.dumps(report or {}), time.time(), job_id))
+
+    def retry(self, job_id: int, delay: float, error: str, report: dict = None):
+        """Back to the queue after a retryable error, not to be taken again for ``delay`` seconds."""
+        now = time.time()
+        with self._conn as conn:
+            conn.execute("UPDATE jobs SET state = 'queued', error = ?, report = ?, worker = NULL, lease = ?, "
+                         "updated = ? WHERE id = ?", (error, json.dumps(report or {}), now + delay, now, job_id))
+
+    def release(self, worker: Optional[int]) -> int:
+        """Hand a dead worker's jobs back to the queue at once, rather than when their leases run out.
+
+        None takes back running jobs no worker holds.
+        """
+        with self._conn as conn:
+            return conn.execute("UPDATE jobs SET state = 'queued', worker = NULL, lease = 0 "
+                                "WHERE worker IS ? AND state = 'running'", (worker,)).rowcount
+
+    def recover(self, key: str) -> int:
+        """Requeue jobs left running by processes that no longer exist, as after a server restart."""
+        rows = self._conn.execute("SELECT DISTINCT worker FROM jobs WHERE key_id = ? AND state = 'running'",
+                                  (key,)).fetchall()
+        return sum(self.release(worker) for worker, in rows if worker is None or not _alive(worker))
+
+    # ==================== HOUSEKEEPING ====================
+    def unnotified(self, key: str) -> List[Job]:
+        """Finished jobs the submitting process hasn't been told about yet."""
+        rows = self._conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE key_id = ? AND notified = 0 "
+                                  "AND state IN ('done', 'failed') ORDER BY id", (key,)).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def mark_notified(self, job_id: int):
+        with self._conn as conn:
+            conn.execute('UPDATE jobs SET notified = 1 WHERE id = ?', (job_id,))
+
+    def purge(self) -> int:
+        cutoff = time.time() - self.settings.keep_seconds
+        with self._conn as conn:
+            conn.execute("DELETE FROM job_chunks WHERE job IN (SELECT id FROM jobs WHERE state IN ('done', 'failed') "
+                         "AND updated < ?)", (cutoff,))
+            return conn.execute("DELETE FROM jobs WHERE state IN ('done', 'failed') AND updated < ?",
+                                (cutoff,)).rowcount
+
+    def clear(self):
+        """Forget finished jobs; pending ones carry on."""
+        with self._conn as conn:
+            conn.execute("DELETE FROM job_chunks WHERE job IN (SELECT id FROM jobs WHERE state IN ('done', 'failed'))")
+            conn.execute("DELETE FROM jobs WHERE state IN ('done', 'failed')")
+
+
+# ==================== WORKER PROCESS ====================
+def default_processor(api_key: str, base_url: str = None) -> CallProcessor:
+    """The app's processor setup, so a job gets the answer the app would give it."""
+    from answer_cache import AnswerCache
+    from intents import IntentClassifier
+    from phrases import PhraseBank
+    from preprocess import PreprocessConfig
+    from replays import ReplayStore
+    from tts_cache import TTSCache
+    return CallProcessor.from_api_key(api_key, base_url=base_url, tts_cache=TTSCache(), answer_cache=AnswerCache(),
+                                      intents=IntentClassifier(), preprocess_config=PreprocessConfig(),
+                                      replays=ReplayStore(), phrases=PhraseBank())
+
+
+class Worker:
+    """Answers jobs in one process: up to ``jobs_per_worker`` at once, each from its last completed stage."""
+
+    def __init__(self, queue: JobQueue, key: str, processor: CallProcessor, store=None, archive=None,
+                 parent: int = None):
+        self.queue = queue
+        self.key = key
+        self.processor = processor
+        self.store = store
+        self.archive = archive
+        self.parent = parent
+        self.pid = os.getpid()
+
+    async def run(self):
+        settings = self.queue.settings
+        running = set()
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            # A worker left behind by a killed server stops taking jobs; its leases lapse to the next server's workers
+            while self.parent is None or os.getppid() == self.parent:
+                while len(running) < settings.jobs_per_worker:
+                    job = await asyncio.to_thread(self.queue.lease, self.key, self.pid)
+                    if job is None:
+                        break
+                    running.add(asyncio.create_task(self.run_job(job)))
+                if running:
+                    _, running = await asyncio.wait(running, timeout=settings.poll,
+                                                     return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    await asyncio.sleep(settings.poll)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.queue.settings.lease / 3)
+            await asyncio.to_thread(self.queue.renew, self.pid)
+
+    async def run_job(self, job: Job):
+        usage = CallUsage()
+        report = dict(job.report)
+        error = None
+        try:
+            with attach(usage):
+                await self._stages(job, report)
+        except Exception as e:
+            error = e
+        report['cost'] = report.get('cost', 0.0) + usage.cost
+        report['tokens'] = report.get('tokens', 0) + usage.tokens()
+        # Every attempt's timings and billable units, for the server's metrics (JobRunner._notify)
+        report['timings'] = report.get('timings', []) + usage.timings
+        models = report.setdefault('usage', {})
+        for model, units in usage.models.items():
+            totals = models.setdefault(model, {})
+            for unit, amount in units.items():
+                totals[unit] = totals.get(unit, 0) + amount
+        settings = self.queue.settings
+        if error is None:
+            await asyncio.to_thread(self.queue.finish, job.id, report)
+        elif isinstance(error, RETRYABLE) and job.attempts < settings.max_attempts:
+            delay = settings.backoff * 2 ** (job.attempts - 1)
+            await asyncio.to_thread(self.queue.retry, job.id, delay, str(error), report)
+        else:
+            if not isinstance(error, (NoSpeechError, *RETRYABLE)):
+                logger.error("job %s failed", job.id, exc_info=error)
+            await asyncio.to_thread(self.queue.fail, job.id, str(error), type(error).__name__, report)
+
+    async def _stages(self, job: Job, report: dict):
+        queue, processor, config = self.queue, self.processor, job.config
+        # Greeting and closing clips render (or load from the speech cache) while the recording is transcribed
+        processor.prepare_phrases(config)
+        if not job.stage:
+            audio = await asyncio.to_thread(queue.audio, job.id)
+            start = time.perf_counter()
+            job.transcript = await processor.transcribe(audio, config, filename=job.filename, report=report,
+                                                        upload=job.upload)
+            report['transcribe'] = time.perf_counter() - start
+            await asyncio.to_thread(queue.checkpoint, job.id, 'transcribed', transcript=job.transcript,
+                                    report=json.dumps(report))
+            job.stage = 'transcribed'
+        if not job.transcript:
+            raise NoSpeechError("no speech found in the recording")
+        if job.stage == 'transcribed':
+            start = time.perf_counter()
+            chunks = await self._respond(job)
+            report['answer'] = time.perf_counter() - start
+            job.answer = " ".join(chunk.text for chunk in chunks)
+            job.source = next((chunk.source for chunk in chunks if chunk.source not in BOOKENDS), None)
+            job.reply = join_audio(chunks)
+            await asyncio.to_thread(queue.checkpoint, job.id, 'answered', answer=job.answer, source=job.source,
+                                    reply=job.reply, report=json.dumps(report))
+            job.stage = 'answered'
+        await asyncio.to_thread(self._record, job)
+
+    async def _respond(self, job: Job) -> List[AudioChunk]:
+        """Stream the reply, storing each sentence as soon as it is voiced so the page can play it."""
+        await asyncio.to_thread(self.queue.clear_chunks, job.id)  # what an interrupted attempt left
+        turn = 1 + sum(message.get('role') == 'user' for message in job.history)
+        chunks = []
+        async with aclosing(self.processor.stream_response(job.transcript, job.config, turn=turn,
+                                                           history=job.history)) as stream:
+            async for chunk in stream:
+                chunks.append(chunk)
+                await asyncio.to_thread(self.queue.add_chunk, job.id, chunk.index, chunk.text, chunk.audio)
+        return chunks
+
+    def _record(self, job: Job):
+        replays = self.processor.replays
+        if replays is not None and job.upload is not None and job.replay_key:
+            replays.put_result(job.upload, job.replay_key, Replay(job.transcript, job.answer, job.reply, job.source))
+        if self.store is not None:
+            # A crash between this and finish() records the call twice; better than not at all
+            record = {'customer_message': job.transcript, 'ai_response': job.answer,
+                      'timestamp': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(job.created)),
+                      'tenant': job.config.tenant}
+            if self.archive is not None:
+                # Archived twice in that case too, but the clips are stored once
+                record['audio_ref'] = self.archive.put(self.queue.audio(job.id), job.reply, job.filename)
+            self.store.add(record)
+            self.store.flush()
+
+
+def _worker_main(path: str, settings: JobSettings, api_key: str, base_url: Optional[str],
+                 factory: Callable[..., CallProcessor], parent: int):
+    from archive import AudioArchive
+    from call_store import CallStore
+    processor = factory(api_key, base_url)
+    worker = Worker(JobQueue(path, settings), key_id(api_key), processor, store=CallStore(), archive=AudioArchive(),
+                    parent=parent)
+    asyncio.run(worker.run())
+
+
+# ==================== RUNNER ====================
+@dataclass
+class RunnerStats:
+    restarts: int = 0
+    released: int = 0  # jobs handed back from workers that died
+    recovered: int = 0  # jobs left running by an earlier server
+
+
+class JobRunner:
+    """Worker processes for one API key, kept running by a supervisor thread.
+
+    ``on_done`` is called in this process for every job that finishes, once,
+    including jobs finished while no one was watching.
+    """
+
+    def __init__(self, queue: JobQueue, api_key: str, base_url: str = None,
+                 factory: Callable[..., CallProcessor] = default_processor,
+                 on_done: Callable[[Job], None] = None):
+        self.queue = queue
+        self.settings = queue.settings
+        self.key = key_id(api_key)
+        self._args = (queue.path, queue.settings, api_key, base_url, factory, os.getpid())
+        self.on_done = on_done
+        self.stats = RunnerStats()
+        # Spawned, not forked: the server has threads and an event loop a child must not inherit
+        self._context = multiprocessing.get_context('spawn')
+        self.processes: List[multiprocessing.Process] = []
+        self._stop = threading.Event()
+        self._supervisor = None
+
+    def start(self) -> 'JobRunner':
+        self.stats.recovered += self.queue.recover(self.key)
+        self.queue.purge()
+        self.processes = [self._spawn() for _ in range(self.settings.workers)]
+        self._supervisor = threading.Thread(target=self._supervise, name='job-supervisor', daemon=True)
+        self._supervisor.start()
+        return self
+
+    def _spawn(self) -> multiprocessing.Process:
+        process = self._context.Process(target=_worker_main, args=self._args, name='call-worker', daemon=True)
+        process.start()
+        return process
+
+    def _supervise(self):
+        while not self._stop.wait(self.settings.poll):
+            for i, process in enumerate(self.processes):
+                if process.is_alive() or self._stop.is_set():
+                    continue
+                released = self.queue.release(process.pid)
+                self.stats.released += released
+                self.stats.restarts += 1
+                logger.warning("call worker %s exited with %s; restarting it and requeueing %d job(s)",
+                               process.pid, process.exitcode, released)
+                self.processes[i] = self._spawn()
+            for job in self.queue.unnotified(self.key):
+                self._notify(job)
+
+    def _notify(self, job: Job):
+        # The worker's metrics stay in its process; each of its stage timings and its usage by model are
+        # recorded again in this one's
+        with call_scope():
+            for stage, seconds in job.report.get('timings', []):
+                METRICS.observe(stage, seconds)
+            for model, units in job.report.get('usage', {}).items():
+                METRICS.add_usage(model, **units)
+        try:
+            if self.on_done is not None:
+                self.on_done(job)
+        except Exception:
+            logger.exception("job %s: on_done failed", job.id)
+        self.queue.mark_notified(job.id)
+
+    def submit(self, audio: bytes, filename: str, config: CallConfig, **kwargs) -> int:
+        return self.queue.submit(self.key, audio, filename, config, **kwargs)
+
+    def stop(self):
+        self._stop.set()
+        if self._supervisor is not None:
+            self._supervisor.join()
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
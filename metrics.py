@@ -0,0 +1,311 @@
+"""Per-stage latency, traffic, token usage and cost, exported for Prometheus.
+
+Stages report themselves with ``span('stt')`` around a block, or ``observe``
+for a duration measured some other way (such as time to first token). Each
+one lands in a fixed-bucket histogram in the process-wide ``METRICS``
+registry, which renders the Prometheus text format for a ``/metrics``
+endpoint. When ``opentelemetry`` is installed, every stage is also exported
+as a span under its call's root span. Usage recorded while a ``CallUsage`` is
+attached (``call_scope`` or ``attach``) adds up to that call's real cost.
+
+Set ``VOICE_METRICS=0`` to turn recording off.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, List, Optional, Tuple
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+LATENCY_BUCKETS = (0.005, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0, 30.0)
+COST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+# first_audio and first_answer_audio run from the transcript to the first clip played: a recorded greeting
+# or filler (phrases.py) when there is one, and the answer itself
+STAGES = ('preprocess', 'stt', 'llm_first_token', 'llm', 'tts_first_byte', 'tts', 'first_audio', 'first_answer_audio',
+          'render')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# USD list prices per unit; a dated model name ('gpt-4o-2024-08-06') uses its longest listed prefix.
+# Edit or extend for other models or negotiated rates.
+PRICES: Dict[str, Dict[str, float]] = {
+    'gpt-4o': {'input_tokens': 2.50e-6, 'cached_tokens': 1.25e-6, 'output_tokens': 10.00e-6},
+    'gpt-4o-mini': {'input_tokens': 0.15e-6, 'cached_tokens': 0.075e-6, 'output_tokens': 0.60e-6},
+    'whisper-1': {'audio_seconds': 0.006 / 60},
+    'tts-1': {'characters': 15e-6},
+    'tts-1-hd': {'characters': 30e-6},
+}
+
+
+def price(model: str, **units: float) -> float:
+    matches = [name for name in PRICES if model.startswith(name)]
+    if not matches:
+        return 0.0
+    rates = PRICES[max(matches, key=len)]
+    return sum(rates.get(unit, 0.0) * amount for unit, amount in units.items())
+
+
+# ==================== PER-CALL USAGE ====================
+@dataclass
+class CallUsage:
+    """What one call used: seconds per stage, billable units and their cost in USD."""
+    cost: float = 0.0
+    units: Dict[str, float] = field(default_factory=dict)
+    stages: Dict[str, float] = field(default_factory=dict)
+    models: Dict[str, Dict[str, float]] = field(default_factory=dict)  # model -> unit -> amount
+    timings: List[Tuple[str, float]] = field(default_factory=list)  # every (stage, seconds) observed
+    span: object = None  # OpenTelemetry root span, when tracing
+
+    def tokens(self) -> int:
+        return int(sum(self.units.get(unit, 0) for unit in ('input_tokens', 'cached_tokens', 'output_tokens')))
+
+    def add(self, other: 'CallUsage'):
+        """Fold in usage recorded apart from this call, such as a speculative reply's."""
+        self.cost += other.cost
+        for unit, amount in other.units.items():
+            self.units[unit] = self.units.get(unit, 0) + amount
+        for stage, seconds in other.stages.items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        for model, units in other.models.items():
+            totals = self.models.setdefault(model, {})
+            for unit, amount in units.items():
+                totals[unit] = totals.get(unit, 0) + amount
+        self.timings.extend(other.timings)
+
+
+_current: ContextVar[Optional[CallUsage]] = ContextVar('call_usage', default=None)
+
+
+# ==================== HISTOGRAM ====================
+class Histogram:
+    """Cumulative Prometheus buckets, plus the most recent values for live percentiles."""
+
+    def __init__(self, buckets: Tuple[float, ...], recent: int = 512):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent: Deque[float] = deque(maxlen=recent)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(len(values) * q))] if values else None
+
+    def lines(self, name: str, labels: str) -> List[str]:
+        prefix = f"{labels}," if labels else ''
+        lines, running = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {running}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ''
+        lines.append(f"{name}_sum{suffix} {self.sum:.6f}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+# ==================== REGISTRY ====================
+class Metrics:
+    def __init__(self, enabled: bool = None):
+        self.enabled = os.environ.get('VOICE_METRICS', '1') != '0' if enabled is None else enabled
+        self.tracer = otel_trace.get_tracer('ai-voice-answering') if otel_trace is not None else None
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Histogram] = {}
+        self.bytes: Dict[Tuple[str, str], int] = {}  # (stage, 'in' or 'out') -> bytes
+        self.units: Dict[Tuple[str, str], float] = {}  # (model, unit) -> amount
+        self.cost: Dict[str, float] = {}  # model -> USD
+        self.events: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], int] = {}  # (name, labels) -> count
+        self.call_cost = Histogram(COST_BUCKETS)
+        self.calls = 0
+
+    def observe(self, stage: str, seconds: float, **attributes):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+        usage = _current.get()
+        if usage is not None:
+            usage.stages[stage] = usage.stages.get(stage, 0.0) + seconds
+            usage.timings.append((stage, seconds))
+        if self.tracer is not None:
+            end = time.time_ns()
+            self._export_span(stage, end - int(seconds * 1e9), end, attributes, usage)
+
+    def add_bytes(self, stage: str, direction: str, count: int):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.bytes[(stage, direction)] = self.bytes.get((stage, direction), 0) + count
+
+    def add_usage(self, model: str, **units: float):
+        """Billable units for one API request: input/cached/output tokens, audio seconds or characters."""
+        if not self.enabled:
+            return
+        cost = price(model, **units)
+        with self._lock:
+            for unit, amount in units.items():
+                self.units[(model, unit)] = self.units.get((model, unit), 0) + amount
+            self.cost[model] = self.cost.get(model, 0.0) + cost
+        usage = _current.get()
+        if usage is not None:
+            usage.cost += cost
+            totals = usage.models.setdefault(model, {})
+            for unit, amount in units.items():
+                usage.units[unit] = usage.units.get(unit, 0) + amount
+                totals[unit] = totals.get(unit, 0) + amount
+
+    def count(self, name: str, amount: int = 1, **labels: str):
+        """Bump the ``voice_<name>_total`` counter, e.g. ``count('retries', endpoint='chat')``."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.events[key] = self.events.get(key, 0) + amount
+
+    # ==================== CALLS ====================
+    def new_call(self, **attributes) -> CallUsage:
+        usage = CallUsage()
+        if self.enabled and self.tracer is not None:
+            usage.span = self.tracer.start_span('call', attributes=attributes)
+        return usage
+
+    def end_call(self, usage: CallUsage):
+        if usage.span is not None:
+            usage.span.set_attribute('cost_usd', usage.cost)
+            usage.span.end()
+        if not self.enabled:
+            return
+        with self._lock:
+            self.calls += 1
+            self.call_cost.observe(usage.cost)
+
+    def _export_span(self, stage: str, start_ns: int, end_ns: int, attributes: dict, usage: Optional[CallUsage]):
+        parent = otel_trace.set_span_in_context(usage.span) if usage is not None and usage.span is not None else None
+        otel_span = self.tracer.start_span(stage, context=parent, start_time=start_ns, attributes=attributes)
+        otel_span.end(end_time=end_ns)
+
+    # ==================== EXPORT ====================
+    def snapshot(self) -> dict:
+        """Recent p50/p95 per stage and cost so far, for the app's latency panel."""
+        with self._lock:
+            stages = {stage: {'count': h.count, 'p50': h.percentile(0.5), 'p95': h.percentile(0.95)}
+                      for stage, h in self.stages.items()}
+            tokens = sum(amount for (_, unit), amount in self.units.items() if unit.endswith('_tokens'))
+            return {
+                'stages': stages,
+                'calls': self.calls,
+                'cost': sum(self.cost.values()),
+                'cost_per_call': self.call_cost.sum / self.calls if self.calls else None,
+                'tokens': int(tokens),
+            }
+
+    def render(self) -> str:
+        with self._lock:
+            lines = ['# HELP voice_stage_seconds Time spent in each stage of a call.',
+                     '# TYPE voice_stage_seconds histogram']
+            for stage, histogram in sorted(self.stages.items()):
+                lines.extend(histogram.lines('voice_stage_seconds', f'stage="{stage}"'))
+            lines += ['# HELP voice_bytes_total Audio bytes sent to and received from the API.',
+                      '# TYPE voice_bytes_total counter']
+            lines.extend(f'voice_bytes_total{{stage="{stage}",direction="{direction}"}} {count}'
+                         for (stage, direction), count in sorted(self.bytes.items()))
+            lines += ['# HELP voice_usage_total Billable units reported by the API, by model.',
+                      '# TYPE voice_usage_total counter']
+            lines.extend(f'voice_usage_total{{model="{model}",unit="{unit}"}} {amount:g}'
+                         for (model, unit), amount in sorted(self.units.items()))
+            lines += ['# HELP voice_cost_usd_total Cost at list price, by model.',
+                      '# TYPE voice_cost_usd_total counter']
+            lines.extend(f'voice_cost_usd_total{{model="{model}"}} {cost:.6f}'
+                         for model, cost in sorted(self.cost.items()))
+            lines += ['# HELP voice_call_cost_usd Cost of each finished call.',
+                      '# TYPE voice_call_cost_usd histogram']
+            lines.extend(self.call_cost.lines('voice_call_cost_usd', ''))
+            for name in sorted({name for name, _ in self.events}):
+                lines.append(f'# TYPE voice_{name}_total counter')
+                for (event, labels), count in sorted(self.events.items()):
+                    if event == name:
+                        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                        lines.append(f'voice_{name}_total{{{label_text}}} {count}')
+            lines += ['# HELP voice_calls_total Finished calls.', '# TYPE voice_calls_total counter',
+                      f'voice_calls_total {self.calls}']
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Time a block as ``stage``; a block that raises is timed too, with the exception's type as ``error``."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as exc:
+        attributes['error'] = type(exc).__name__
+        raise
+    finally:
+        METRICS.observe(stage, time.perf_counter() - start, **attributes)
+
+
+@contextmanager
+def attach(usage: CallUsage):
+    """Add usage recorded in this block (and tasks it starts) to ``usage``."""
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def call_scope(**attributes):
+    """One call from start to finish: attach a fresh ``CallUsage`` and record its cost at the end."""
+    usage = METRICS.new_call(**attributes)
+    try:
+        with attach(usage):
+            yield usage
+    finally:
+        METRICS.end_call(usage)
+
+
+# ==================== HTTP ENDPOINT ====================
+def serve_metrics(port: int, host: str = '0.0.0.0', registry: Metrics = None) -> ThreadingHTTPServer:
+    """Serve ``/metrics`` from a daemon thread, for processes without an HTTP server of their own."""
+    registry = registry or METRICS
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
@@ -0,0 +1,10 @@
+"""Where the app keeps caches, history and other local state."""
+import os
+
+
+def data_dir(*parts: str) -> str:
+    """Return (and create) a directory under ``$VOICE_DATA_DIR`` (default ``~/.ai-voice-answering``)."""
+    root = os.environ.get('VOICE_DATA_DIR') or os.path.join(os.path.expanduser('~'), '.ai-voice-answering')
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
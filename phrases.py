@@ -0,0 +1,143 @@
+"""Pre-synthesized greeting, filler and closing clips, so a reply starts with sound.
+
+While GPT-4o is still writing, the caller would hear nothing. A PhraseBank
+keeps each business's greeting ("Hello! Thank you for calling Acme."), fillers
+("Let me check that for you.") and closing voiced ahead of time, per voice,
+speed, speech backend and format. They are rendered in the background whenever
+those settings change, through the processor's speech cache, so a restart
+doesn't synthesize them again.
+
+Once a business's set is ready, CallProcessor opens each reply with the
+greeting (a call's first reply) or a filler (later replies that need the
+model) the moment the transcript is in, has the model answer without greeting
+or closing (``CallConfig.greeted``), and ends with the recorded closing.
+"""
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# AudioChunk sources of recorded clips, as opposed to the answer's own route
+BOOKENDS = ('greeting', 'filler', 'closing')
+
+FILLERS = (
+    "Let me check that for you.",
+    "Sure, one moment.",
+    "Good question, let me look into that.",
+)
+
+
+def greeting_text(config) -> str:
+    return f"Hello! Thank you for calling {config.business_name}."
+
+
+def closing_text(config) -> str:
+    callback = f" Feel free to call us at {config.phone_number}." if config.include_callback else ""
+    return f"Is there anything else I can help you with today?{callback} Have a great day!"
+
+
+def phrase_key(config) -> Tuple:
+    """Everything that changes how a set's clips sound or what they say."""
+    return (config.tenant, config.business_name, config.phone_number, config.include_callback, config.voice,
+            round(float(config.speed), 2), config.tts_backend, config.tts_model, config.audio_format)
+
+
+@dataclass(frozen=True)
+class Phrase:
+    text: str
+    audio: bytes
+
+
+@dataclass(frozen=True)
+class PhraseSet:
+    greeting: Phrase
+    fillers: Tuple[Phrase, ...]
+    closing: Phrase
+
+    def filler(self, turn: int) -> Phrase:
+        return self.fillers[turn % len(self.fillers)]
+
+    @property
+    def size(self) -> int:
+        return sum(len(p.audio) for p in (self.greeting, self.closing, *self.fillers))
+
+
+# ==================== BANK ====================
+class PhraseBank:
+    """Ready phrase sets by ``phrase_key``, least recently used dropped past ``max_bytes``."""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.renders = 0
+        self.failures = 0
+        self._sets: 'OrderedDict[Tuple, PhraseSet]' = OrderedDict()
+        self._pending: Dict[Tuple, object] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, config) -> Optional[PhraseSet]:
+        """The set for this config if it has been rendered; never waits for one."""
+        key = phrase_key(config)
+        with self._lock:
+            found = self._sets.get(key)
+            if found is not None:
+                self._sets.move_to_end(key)
+            return found
+
+    def prepare(self, synthesize: Callable[[str, object], Awaitable[bytes]], config,
+                loop: asyncio.AbstractEventLoop = None):
+        """Render this config's set in the background unless it is ready or already rendering.
+
+        ``synthesize(text, config)`` voices one phrase. Runs on ``loop`` (from any
+        thread), or on the running loop. Returns the task or future, or None.
+        """
+        key = phrase_key(config)
+        with self._lock:
+            if key in self._sets or key in self._pending:
+                return None
+            self._pending[key] = None
+        coro = self._render(synthesize, config, key)
+        if loop is None:
+            task = asyncio.ensure_future(coro)
+        else:
+            task = asyncio.run_coroutine_threadsafe(coro, loop)
+        with self._lock:
+            if key in self._pending:
+                self._pending[key] = task  # held, so the task isn't garbage-collected mid-render
+        return task
+
+    async def render(self, synthesize: Callable[[str, object], Awaitable[bytes]], config) -> PhraseSet:
+        """Render this config's set now and keep it."""
+        return await self._render(synthesize, config, phrase_key(config))
+
+    async def _render(self, synthesize, config, key) -> Optional[PhraseSet]:
+        texts = [greeting_text(config), closing_text(config), *FILLERS]
+        try:
+            clips = await asyncio.gather(*(synthesize(text, config) for text in texts))
+        except Exception as e:
+            self.failures += 1
+            logger.warning("could not render greeting and fillers for %s: %s", config.business_name, e)
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+        phrases: List[Phrase] = [Phrase(text, audio) for text, audio in zip(texts, clips)]
+        rendered = PhraseSet(greeting=phrases[0], closing=phrases[1], fillers=tuple(phrases[2:]))
+        with self._lock:
+            previous = self._sets.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._sets[key] = rendered
+            self._bytes += rendered.size
+            while self._bytes > self.max_bytes and len(self._sets) > 1:
+                _, dropped = self._sets.popitem(last=False)
+                self._bytes -= dropped.size
+            self.renders += 1
+        return rendered
+
+    def __len__(self) -> int:
+        return len(self._sets)
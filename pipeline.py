@@ -0,0 +1,240 @@
+"""Sentence-pipelined LLM -> TTS streaming for voice responses."""
+import asyncio
+import re
+import time
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Iterator, List
+
+from audio_io import concat_wav
+from budget import count_words
+from metrics import METRICS
+from sessions import message_tokens
+
+# ==================== SENTENCE SPLITTING ====================
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+SENTENCE_ENDS = ('.', '!', '?', '"', "'")
+
+# Fragments shorter than this are held back and merged with the next one, so
+# "9 A.M. to 9 P.M." style abbreviations don't become their own TTS request.
+MIN_SENTENCE_CHARS = 20
+
+
+class SentenceSplitter:
+    """Incrementally cut a stream of text deltas into complete sentences."""
+
+    def __init__(self, min_chars: int = MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self.buffer = ''
+
+    def feed(self, delta: str) -> List[str]:
+        if not delta:
+            return []
+        self.buffer += delta
+        parts = SENTENCE_BREAK.split(self.buffer)
+        sentences = []
+        pending = ''
+        for part in parts[:-1]:
+            pending = f"{pending} {part}" if pending else part
+            if len(pending) >= self.min_chars:
+                sentences.append(pending.strip())
+                pending = ''
+        self.buffer = f"{pending} {parts[-1]}" if pending else parts[-1]
+        return sentences
+
+    def flush(self) -> List[str]:
+        rest, self.buffer = self.buffer.strip(), ''
+        return [rest] if rest else []
+
+
+def split_sentences(deltas: Iterable[str], min_chars: int = MIN_SENTENCE_CHARS) -> Iterator[str]:
+    splitter = SentenceSplitter(min_chars)
+    for delta in deltas:
+        yield from splitter.feed(delta)
+    yield from splitter.flush()
+
+
+# ==================== STREAMING PIPELINE ====================
+@dataclass
+class AudioChunk:
+    index: int
+    text: str
+    audio: bytes
+    source: str = 'llm'
+
+
+async def stream_chat_text(client, messages, model="gpt-4o", temperature=0.7, max_tokens=300,
+                           stop=None) -> AsyncIterator[str]:
+    """The reply's text deltas. Closing the iterator early closes the completion, so generation stops."""
+    start = time.perf_counter()
+    deltas = 0
+    billed = False
+    try:
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            **({"stop": list(stop)} if stop else {})
+        )
+    except asyncio.CancelledError:
+        # Dropped while the request was in flight (a cancelled speculative reply): the prompt was sent
+        METRICS.add_usage(model, input_tokens=message_tokens(messages, model))
+        raise
+    try:
+        async for chunk in stream:
+            if chunk.usage:
+                # Sent in a final chunk with no choices
+                billed = True
+                details = getattr(chunk.usage, 'prompt_tokens_details', None)
+                cached = (getattr(details, 'cached_tokens', 0) or 0) if details else 0
+                METRICS.add_usage(model, input_tokens=chunk.usage.prompt_tokens - cached, cached_tokens=cached,
+                                  output_tokens=chunk.usage.completion_tokens)
+            if chunk.choices and chunk.choices[0].delta.content:
+                if not deltas:
+                    METRICS.observe('llm_first_token', time.perf_counter() - start, model=model)
+                deltas += 1
+                yield chunk.choices[0].delta.content
+        METRICS.observe('llm', time.perf_counter() - start, model=model)
+    finally:
+        if not billed:
+            # Cut short before the usage chunk (a word budget, a cancelled speculative reply): the
+            # prompt was still read in full, and each delta is about one token generated
+            METRICS.add_usage(model, input_tokens=message_tokens(messages, model), output_tokens=deltas)
+        await stream.close()
+
+
+async def openai_speech(client, text, voice, model="tts-1", speed=1.0, response_format="mp3") -> bytes:
+    start = time.perf_counter()
+    pieces = []
+    async with client.audio.speech.with_streaming_response.create(
+        model=model,
+        voice=voice,
+        input=text,
+        speed=speed,
+        response_format=response_format
+    ) as speech:
+        async for piece in speech.iter_bytes():
+            if not pieces:
+                METRICS.observe('tts_first_byte', time.perf_counter() - start, model=model)
+            pieces.append(piece)
+    audio = b''.join(pieces)
+    METRICS.observe('tts', time.perf_counter() - start, model=model)
+    METRICS.add_bytes('tts', 'in', len(audio))
+    METRICS.add_usage(model, characters=len(text))
+    return audio
+
+
+async def synthesize(client, text, voice, model="tts-1", speed=1.0, cache=None, response_format="mp3",
+                     backend=None) -> bytes:
+    """Speech for ``text``, from the cache or else the client's speech endpoint.
+
+    ``backend`` (see backends.py) synthesizes in its place; ``model`` should then
+    be the backend's ``model``, so the cache keeps its audio apart.
+    """
+    if cache is not None:
+        audio = cache.get(model, voice, speed, text, response_format)
+        if audio is not None:
+            return audio
+
+    if backend is None:
+        audio = await openai_speech(client, text, voice, model=model, speed=speed, response_format=response_format)
+    else:
+        audio = await backend.synthesize(text, voice, speed=speed, response_format=response_format)
+    if cache is not None:
+        cache.put(model, voice, speed, text, audio, response_format)
+    return audio
+
+
+async def stream_voice_response(client, messages, voice, speed=1.0, max_tokens=300, temperature=0.7,
+                                chat_model="gpt-4o", tts_model="tts-1", tts_workers=3,
+                                tts_cache=None, response_format="mp3", tts_backend=None,
+                                stop=None, max_words=None, lookahead=None) -> AsyncIterator[AudioChunk]:
+    """Stream the chat reply and yield synthesized audio sentence by sentence, in order.
+
+    The completion is consumed by a background task; each sentence is handed to
+    TTS as soon as it closes, so the first chunk is ready while later sentences
+    are still being generated. With ``max_words`` (budget.py), the reply ends
+    after the last whole sentence that fits: the completion is closed there,
+    and a fragment left unfinished by ``max_tokens`` isn't spoken. With
+    ``lookahead`` (1 or more), the completion is read no further while that many
+    sentences are voiced ahead of the last chunk handed out, so a caller that
+    stops taking chunks stops the spending too; None runs ahead freely.
+    """
+    pending: asyncio.Queue = asyncio.Queue()
+    tts_slots = asyncio.Semaphore(tts_workers)
+    tasks = []
+    taken = 0
+    consumed = asyncio.Event()
+
+    async def voice_sentence(text):
+        async with tts_slots:
+            return await synthesize(client, text, voice, model=tts_model, speed=speed, cache=tts_cache,
+                                    response_format=response_format, backend=tts_backend)
+
+    async def submit(sentence):
+        while lookahead is not None and len(tasks) - taken >= lookahead:
+            consumed.clear()
+            await consumed.wait()
+        task = asyncio.create_task(voice_sentence(sentence))
+        tasks.append(task)
+        pending.put_nowait((len(tasks) - 1, sentence, task))
+
+    words = 0
+
+    def fits(sentence):
+        nonlocal words
+        words += count_words(sentence)
+        if max_words is None or not tasks or words <= max_words:
+            return True
+        METRICS.count('answers_cut', reason='words')
+        return False
+
+    async def produce():
+        splitter = SentenceSplitter()
+        try:
+            deltas = stream_chat_text(client, messages, model=chat_model, temperature=temperature,
+                                      max_tokens=max_tokens, stop=stop)
+            async with aclosing(deltas):
+                async for delta in deltas:
+                    for sentence in splitter.feed(delta):
+                        if not fits(sentence):
+                            return
+                        await submit(sentence)
+            for sentence in splitter.flush():
+                if max_words is not None and tasks and not sentence.endswith(SENTENCE_ENDS):
+                    METRICS.count('answers_cut', reason='tokens')
+                    return
+                if fits(sentence):
+                    await submit(sentence)
+        finally:
+            pending.put_nowait(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (item := await pending.get()) is not None:
+            index, sentence, task = item
+            chunk = AudioChunk(index=index, text=sentence, audio=await task)
+            taken += 1
+            consumed.set()
+            yield chunk
+        await producer
+    finally:
+        producer.cancel()
+        # Its completion is billed as it closes; let that land in the caller's usage before the stream ends
+        await asyncio.gather(producer, return_exceptions=True)
+        for task in tasks:
+            task.cancel()
+            if task.done() and not task.cancelled():
+                task.exception()  # a later sentence's failure is moot once this stream has ended
+
+
+def join_audio(chunks: List[AudioChunk]) -> bytes:
+    # MP3 is a frame stream (and raw PCM has no header), so sentence clips concatenate into one playable clip.
+    # WAV clips (local TTS without an MP3 encoder) each have a header, so their samples are merged instead.
+    clips = [chunk.audio for chunk in chunks]
+    if len(clips) > 1 and all(clip[:4] == b'RIFF' for clip in clips):
+        return concat_wav(clips)
+    return b''.join(clips)
@@ -0,0 +1,147 @@
+"""Shrink caller audio before it is uploaded to Whisper.
+
+Downmixes to mono, resamples to 16 kHz, keeps only the speech found by the
+voice activity detector (long pauses shrink to a short gap) and re-encodes to a
+compact codec (Opus, or low-bitrate MP3). Recordings longer
+than ``max_chunk_seconds`` are cut at pauses so the pieces can be transcribed
+in parallel and stitched back together in order.
+"""
+import io
+import os
+import shutil
+from dataclasses import dataclass, field, replace
+from functools import reduce
+from typing import List, Tuple
+
+from audio_io import BufferReader, BytesLike, as_memoryview
+from vad import VADConfig, speech_segments
+
+try:
+    from pydub import AudioSegment
+    from pydub.exceptions import CouldntDecodeError
+    from pydub.silence import detect_silence
+except ImportError:  # pydub needs audioop, which Python 3.13 dropped unless audioop-lts is installed
+    AudioSegment = None
+    CouldntDecodeError = Exception
+
+HAS_FFMPEG = shutil.which('ffmpeg') is not None or shutil.which('avconv') is not None
+
+# Whisper rejects uploads over 25 MB; stay clear of the limit.
+MAX_UPLOAD_BYTES = 24 * 1024 * 1024
+
+
+@dataclass
+class PreprocessConfig:
+    sample_rate: int = 16000
+    silence_margin_db: float = 16.0
+    min_silence_ms: int = 400
+    keep_silence_ms: int = 150
+    codec: str = 'opus'
+    bitrate: str = '24k'
+    max_chunk_seconds: int = 120
+    # Pauses longer than vad.hangover_ms are cut down to keep_silence_ms either side
+    vad: VADConfig = field(default_factory=lambda: VADConfig(hangover_ms=700))
+
+
+@dataclass
+class PreparedAudio:
+    chunks: List[Tuple[str, bytes]]
+    original_bytes: int
+    duration_ms: int = 0
+    trimmed_ms: int = 0
+    processed: bool = False
+    notes: List[str] = field(default_factory=list)
+
+    @property
+    def uploaded_bytes(self) -> int:
+        return sum(len(data) for _, data in self.chunks)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.uploaded_bytes
+
+
+def _passthrough(audio: BytesLike, filename: str, note: str) -> PreparedAudio:
+    view = as_memoryview(audio)
+    return PreparedAudio(chunks=[(filename, view)], original_bytes=len(view), notes=[note])
+
+
+def _export(segment, config: PreprocessConfig, stem: str) -> Tuple[str, bytes]:
+    out = io.BytesIO()
+    if not HAS_FFMPEG:
+        # pydub writes WAV natively; mono 16 kHz PCM is still far smaller than stereo 44.1 kHz
+        segment.set_sample_width(2).export(out, format='wav')
+        return f"{stem}.wav", out.getvalue()
+    if config.codec == 'opus':
+        segment.export(out, format='ogg', codec='libopus', bitrate=config.bitrate)
+        return f"{stem}.ogg", out.getvalue()
+    segment.export(out, format='mp3', bitrate=config.bitrate)
+    return f"{stem}.mp3", out.getvalue()
+
+
+def _cut_points(segment, config: PreprocessConfig, threshold: float) -> List[int]:
+    """Split positions (ms) at pauses, each piece at most ``max_chunk_seconds`` long."""
+    max_ms = config.max_chunk_seconds * 1000
+    if len(segment) <= max_ms:
+        return []
+    pauses = [(start + end) // 2 for start, end in
+              detect_silence(segment, min_silence_len=config.min_silence_ms, silence_thresh=threshold, seek_step=20)]
+    cuts, position = [], 0
+    while len(segment) - position > max_ms:
+        candidates = [p for p in pauses if position < p <= position + max_ms]
+        # No pause in range: cut hard rather than exceed the chunk length
+        position = candidates[-1] if candidates else position + max_ms
+        cuts.append(position)
+    return cuts
+
+
+def _speech_spans(segment, config: PreprocessConfig) -> List[Tuple[int, int]]:
+    """Speech regions (ms) padded by keep_silence_ms, with overlapping regions merged."""
+    vad_config = replace(config.vad, sample_rate=config.sample_rate)
+    spans = []
+    for start, end in speech_segments(segment.raw_data, vad_config):
+        start, end = max(0, int(start) - config.keep_silence_ms), min(len(segment), int(end) + config.keep_silence_ms)
+        if spans and start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+    return spans
+
+
+def preprocess(audio: BytesLike, filename: str = 'audio.wav', config: PreprocessConfig = None) -> PreparedAudio:
+    """Return upload-ready chunks; falls back to the original bytes if decoding isn't possible."""
+    config = config or PreprocessConfig()
+    if AudioSegment is None:
+        return _passthrough(audio, filename, 'pydub unavailable')
+
+    extension = os.path.splitext(filename)[1].lstrip('.').lower() or None
+    if extension != 'wav' and not HAS_FFMPEG:
+        return _passthrough(audio, filename, 'ffmpeg not installed')
+
+    try:
+        segment = AudioSegment.from_file(BufferReader(audio, name=filename), format=extension)
+    except (CouldntDecodeError, OSError, ValueError, IndexError) as e:
+        return _passthrough(audio, filename, f"could not decode: {e}")
+
+    original_bytes = len(as_memoryview(audio))
+    duration_ms = len(segment)
+    segment = segment.set_channels(1).set_frame_rate(config.sample_rate).set_sample_width(2)
+    notes = []
+
+    spans = _speech_spans(segment, config)
+    if spans:
+        segment = reduce(lambda joined, piece: joined + piece, (segment[start:end] for start, end in spans))
+    else:
+        notes.append('no speech detected; sent untrimmed')
+    trimmed_ms = duration_ms - len(segment)
+
+    # Silence for chunk cut points is judged relative to the recording's own loudness
+    threshold = segment.dBFS - config.silence_margin_db if segment.dBFS != float('-inf') else -50.0
+    stem = os.path.splitext(os.path.basename(filename))[0] or 'audio'
+    bounds = [0] + _cut_points(segment, config, threshold) + [len(segment)]
+    chunks = [_export(segment[start:end], config, f"{stem}_{i}") for i, (start, end) in enumerate(zip(bounds, bounds[1:]))]
+
+    prepared = PreparedAudio(chunks, original_bytes, duration_ms, trimmed_ms, processed=True, notes=notes)
+    if prepared.uploaded_bytes >= original_bytes and original_bytes <= MAX_UPLOAD_BYTES:
+        return _passthrough(audio, filename, 'original was already smaller')
+    return prepared
@@ -0,0 +1,234 @@
+"""Memoized transcripts and call results for uploads seen before.
+
+An upload is identified by a SHA-256 of its bytes, streamed block by block out
+of the caller's buffer, and by a fingerprint of the decoded audio: a coarse
+loudness envelope of the speech, resampled and normalized, so the same
+recording saved with another header, sample rate, channel count or volume
+still matches. Transcripts (per speech-to-text engine) and full call results
+(per prompt, voice and format) are kept in SQLite until their TTL runs out.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from audio_io import BufferReader, BytesLike, as_memoryview, read_wav, resample
+from paths import data_dir
+from preprocess import HAS_FFMPEG, AudioSegment
+
+HASH_BLOCK = 1024 * 1024
+FINGERPRINT_RATE = 8000
+FINGERPRINT_FRAME = 256  # 32 ms at 8 kHz
+FINGERPRINT_FLOOR_DB = 40  # sound this far under the peak is silence, trimmed from either end
+FINGERPRINT_STEP_DB = 6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    digest TEXT NOT NULL,
+    fingerprint TEXT,
+    key TEXT NOT NULL,
+    transcript TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_digest ON transcripts(digest, key);
+CREATE INDEX IF NOT EXISTS transcripts_fingerprint ON transcripts(fingerprint, key);
+CREATE INDEX IF NOT EXISTS transcripts_expires ON transcripts(expires);
+CREATE TABLE IF NOT EXISTS results (
+    digest TEXT NOT NULL,
+    fingerprint TEXT,
+    key TEXT NOT NULL,
+    customer_message TEXT NOT NULL,
+    ai_response TEXT NOT NULL,
+    audio BLOB NOT NULL,
+    source TEXT,
+    timestamp TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_digest ON results(digest, key);
+CREATE INDEX IF NOT EXISTS results_fingerprint ON results(fingerprint, key);
+CREATE INDEX IF NOT EXISTS results_expires ON results(expires);
+"""
+
+
+@dataclass(frozen=True)
+class ReplaySettings:
+    ttl: float = 7 * 24 * 3600.0  # seconds a transcript or result is replayed for
+    max_bytes: int = 256 * 1024 * 1024  # reply audio kept; oldest results go first past this
+
+    @classmethod
+    def from_env(cls) -> 'ReplaySettings':
+        settings = cls()
+        overrides = {}
+        for name, value in vars(settings).items():
+            raw = os.environ.get(f"VOICE_REPLAY_{name.upper()}")
+            if raw is not None:
+                overrides[name] = type(value)(raw)
+        return replace(settings, **overrides)
+
+
+# ==================== IDENTIFYING UPLOADS ====================
+@dataclass(frozen=True)
+class Upload:
+    digest: str
+    fingerprint: Optional[str] = None
+
+
+def upload_digest(data: BytesLike) -> str:
+    """SHA-256 of an upload, fed from its buffer a block at a time without copying it."""
+    view = as_memoryview(data)
+    digest = hashlib.sha256()
+    for offset in range(0, len(view), HASH_BLOCK):
+        digest.update(view[offset:offset + HASH_BLOCK])
+    return digest.hexdigest()
+
+
+def _decode(data: BytesLike, filename: str) -> Optional[tuple]:
+    decoded = read_wav(data)
+    if decoded is not None or AudioSegment is None:
+        return decoded
+    extension = os.path.splitext(filename)[1].lstrip('.').lower() or None
+    if extension != 'wav' and not HAS_FFMPEG:
+        return None
+    try:
+        segment = AudioSegment.from_file(BufferReader(data, name=filename), format=extension)
+    except Exception:
+        return None
+    segment = segment.set_channels(1).set_sample_width(2)
+    return np.frombuffer(segment.raw_data, dtype='<i2'), segment.frame_rate
+
+
+def audio_fingerprint(data: BytesLike, filename: str = 'audio.wav') -> Optional[str]:
+    """Hash of the recording's speech envelope, or None when it can't be decoded here."""
+    decoded = _decode(data, filename)
+    if decoded is None:
+        return None
+    samples, rate = decoded
+    samples = resample(samples, rate, FINGERPRINT_RATE).astype(np.float32)
+    # Frames start where the sound does, so leading silence can't shift them
+    loud = np.flatnonzero(np.abs(samples) > np.abs(samples).max() * 10 ** (-FINGERPRINT_FLOOR_DB / 20))
+    if not len(loud):
+        return None
+    samples = samples[loud[0]:loud[-1] + 1]
+    frames = samples[:len(samples) // FINGERPRINT_FRAME * FINGERPRINT_FRAME].reshape(-1, FINGERPRINT_FRAME)
+    if not len(frames):
+        return None
+    energy = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1.0)
+    envelope = energy - energy.max()
+    levels = np.round(envelope / FINGERPRINT_STEP_DB).astype(np.int8)
+    return hashlib.sha256(levels.tobytes()).hexdigest()
+
+
+def identify(data: BytesLike, filename: str = 'audio.wav') -> Upload:
+    return Upload(upload_digest(data), audio_fingerprint(data, filename))
+
+
+# ==================== STORE ====================
+@dataclass(frozen=True)
+class Replay:
+    customer_message: str
+    ai_response: str
+    audio: bytes
+    source: Optional[str] = None
+    timestamp: str = ''
+
+
+@dataclass
+class ReplayStats:
+    transcript_hits: int = 0
+    result_hits: int = 0
+    expired: int = 0
+
+
+class ReplayStore:
+    def __init__(self, path: str = None, settings: ReplaySettings = None):
+        self.path = path or f"{data_dir()}/replays.db"
+        self.settings = settings or ReplaySettings.from_env()
+        self.stats = ReplayStats()
+        self._local = threading.local()
+        with self._conn as conn:
+            conn.executescript(SCHEMA)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _find(self, table: str, columns: str, upload: Upload, key: str) -> Optional[tuple]:
+        # Two lookups rather than an OR, so each uses its index
+        for column, value in (('digest', upload.digest), ('fingerprint', upload.fingerprint)):
+            if value is None:
+                continue
+            row = self._conn.execute(
+                f'SELECT {columns} FROM {table} WHERE {column} = ? AND key = ? AND expires > ? '
+                'ORDER BY expires DESC LIMIT 1', (value, key, time.time())
+            ).fetchone()
+            if row is not None:
+                return row
+        return None
+
+    # ==================== TRANSCRIPTS ====================
+    def transcript(self, upload: Upload, key: str) -> Optional[str]:
+        """The transcript an earlier upload of this recording got from the same engine."""
+        row = self._find('transcripts', 'transcript', upload, key)
+        if row is None:
+            return None
+        self.stats.transcript_hits += 1
+        return row[0]
+
+    def put_transcript(self, upload: Upload, key: str, transcript: str):
+        with self._conn as conn:
+            conn.execute('DELETE FROM transcripts WHERE digest = ? AND key = ?', (upload.digest, key))
+            conn.execute('INSERT INTO transcripts VALUES (?, ?, ?, ?, ?)',
+                         (upload.digest, upload.fingerprint, key, transcript, time.time() + self.settings.ttl))
+            self._evict(conn)
+
+    # ==================== RESULTS ====================
+    def result(self, upload: Upload, key: str) -> Optional[Replay]:
+        """The full call result of an earlier submission with the same settings."""
+        row = self._find('results', 'customer_message, ai_response, audio, source, timestamp', upload, key)
+        if row is None:
+            return None
+        self.stats.result_hits += 1
+        return Replay(row[0], row[1], bytes(row[2]), row[3], row[4])
+
+    def put_result(self, upload: Upload, key: str, replay: Replay):
+        timestamp = replay.timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._conn as conn:
+            conn.execute('DELETE FROM results WHERE digest = ? AND key = ?', (upload.digest, key))
+            conn.execute('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         (upload.digest, upload.fingerprint, key, replay.customer_message, replay.ai_response,
+                          replay.audio, replay.source, timestamp, time.time() + self.settings.ttl))
+            self._evict(conn)
+
+    # ==================== EVICTION ====================
+    def _evict(self, conn: sqlite3.Connection):
+        now = time.time()
+        expired = conn.execute('DELETE FROM transcripts WHERE expires <= ?', (now,)).rowcount
+        expired += conn.execute('DELETE FROM results WHERE expires <= ?', (now,)).rowcount
+        self.stats.expired += expired
+        total = conn.execute('SELECT COALESCE(SUM(length(audio)), 0) FROM results').fetchone()[0]
+        if total > self.settings.max_bytes:
+            # Results expire in the order they were stored, so the soonest to expire are the oldest
+            rows = conn.execute('SELECT rowid, length(audio) FROM results ORDER BY expires').fetchall()
+            dropped = []
+            for rowid, size in rows:
+                if total <= self.settings.max_bytes:
+                    break
+                dropped.append((rowid,))
+                total -= size
+            conn.executemany('DELETE FROM results WHERE rowid = ?', dropped)
+
+    def clear(self):
+        with self._conn as conn:
+            conn.execute('DELETE FROM transcripts')
+            conn.execute('DELETE FROM results')
@@ -0,0 +1,371 @@
+"""Shared scheduling for OpenAI requests: rate limits, adaptive concurrency, retries and hedging.
+
+One ``RequestScheduler`` sits in each pooled client's transport (see
+clients.py), so every session, phone call and batch using an API key shares
+it. Transcription, chat and speech requests each get:
+
+- a token bucket (``*_rps``) that also holds every request back while a 429's
+  Retry-After runs out;
+- an AIMD concurrency limit: +1 slot per window of fast successes, halved on
+  429/503 and cut by 10% when responses take longer than ``latency_target``;
+- retries of 429, 5xx and connection failures with full-jitter exponential
+  backoff, never sooner than Retry-After.
+
+Speech requests can also be hedged: when one has not answered by the recent
+p95, a second copy is sent and whichever answers first wins. Hedges need a
+free rate token and stay within ``hedge_budget``, so they don't add load when
+the API is already struggling.
+"""
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+import httpx
+
+from metrics import METRICS
+
+ENDPOINTS = {
+    '/audio/transcriptions': 'transcription',
+    '/chat/completions': 'chat',
+    '/audio/speech': 'speech',
+}
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+CONGESTION_STATUSES = (429, 503)
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+Send = Callable[[httpx.Request], Awaitable[httpx.Response]]
+
+
+# ==================== SETTINGS ====================
+@dataclass(frozen=True)
+class SchedulerSettings:
+    enabled: bool = True
+    # Requests per second per endpoint, 0 for no limit; your account's RPM / 60
+    transcription_rps: float = 0.0
+    chat_rps: float = 0.0
+    speech_rps: float = 0.0
+    burst: int = 10
+    initial_concurrency: int = 16
+    min_concurrency: int = 1
+    max_concurrency: int = 64
+    # Seconds to response headers; slower chat/speech responses shrink the concurrency limit
+    latency_target: float = 4.0
+    retries: int = 4
+    backoff: float = 0.5  # first retry waits up to this long, doubling each time
+    max_backoff: float = 20.0
+    hedge_speech: bool = True
+    hedge_budget: float = 0.1  # largest share of speech requests that may be hedged
+
+    @classmethod
+    def from_env(cls) -> 'SchedulerSettings':
+        settings = cls()
+        overrides = {}
+        for name, value in vars(settings).items():
+            raw = os.environ.get(f"VOICE_SCHED_{name.upper()}")
+            if raw is None:
+                continue
+            if isinstance(value, bool):
+                overrides[name] = raw.lower() in ('1', 'true', 'yes')
+            else:
+                overrides[name] = type(value)(raw)
+        return replace(settings, **overrides)
+
+
+def retry_after(headers: httpx.Headers) -> Optional[float]:
+    """Seconds the server asked us to wait, from retry-after-ms or Retry-After (seconds or a date)."""
+    if 'retry-after-ms' in headers:
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# ==================== LIMITERS ====================
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        now = time.monotonic()
+        if now < self.paused_until:
+            return False
+        if not self.rate:
+            return True
+        self._refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def take(self):
+        while not self.try_take():
+            now = time.monotonic()
+            wait = self.paused_until - now
+            if wait <= 0:
+                wait = (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class AdaptiveLimit:
+    """AIMD concurrency limit; a released slot is handed straight to the next waiter."""
+
+    def __init__(self, settings: SchedulerSettings):
+        self.settings = settings
+        self.limit = float(settings.initial_concurrency)
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # the slot arrived just as we gave up
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def on_success(self, latency: Optional[float]):
+        if latency is not None and latency > self.settings.latency_target:
+            self._decrease(0.9)
+        else:
+            self.limit = min(self.settings.max_concurrency, self.limit + 1 / self.limit)
+            self._wake()
+
+    def on_congestion(self):
+        self._decrease(0.5)
+
+    def _decrease(self, factor: float):
+        # One cut per second: a burst of 429s from the same overload is one signal
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(self.settings.min_concurrency, self.limit * factor)
+
+
+# ==================== ENDPOINT STATE ====================
+@dataclass
+class EndpointStats:
+    requests: int = 0
+    retries: int = 0
+    throttled: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+
+
+class Endpoint:
+    def __init__(self, name: str, settings: SchedulerSettings, rate: float, latency_target: bool):
+        self.name = name
+        self.bucket = TokenBucket(rate, settings.burst)
+        self.limit = AdaptiveLimit(settings)
+        self.use_latency = latency_target
+        self.stats = EndpointStats()
+        self.latencies: Deque[float] = deque(maxlen=200)
+        self._p95: Optional[float] = None
+        self._samples = 0
+
+    def record_latency(self, seconds: float):
+        self.latencies.append(seconds)
+        self._samples += 1
+        if self._samples % 20 == 0:  # re-sorted every 20 samples, not on every request
+            ordered = sorted(self.latencies)
+            self._p95 = ordered[int(len(ordered) * 0.95)]
+
+    @property
+    def p95(self) -> Optional[float]:
+        return self._p95 if len(self.latencies) >= 20 else None
+
+    def snapshot(self) -> dict:
+        return {'limit': int(self.limit.limit), 'in_flight': self.limit.in_flight, 'p95': self.p95,
+                **vars(self.stats)}
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that gives its concurrency slot back once it has been read or closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+# ==================== SCHEDULER ====================
+class RequestScheduler:
+    def __init__(self, settings: SchedulerSettings = None):
+        self.settings = settings or SchedulerSettings()
+        s = self.settings
+        self.endpoints: Dict[str, Endpoint] = {
+            'transcription': Endpoint('transcription', s, s.transcription_rps, latency_target=False),
+            'chat': Endpoint('chat', s, s.chat_rps, latency_target=True),
+            'speech': Endpoint('speech', s, s.speech_rps, latency_target=True),
+        }
+
+    def endpoint_for(self, request: httpx.Request) -> Optional[Endpoint]:
+        path = request.url.path
+        for suffix, name in ENDPOINTS.items():
+            if path.endswith(suffix):
+                return self.endpoints[name]
+        return None
+
+    async def send(self, request: httpx.Request, send: Send) -> httpx.Response:
+        endpoint = self.endpoint_for(request)
+        if endpoint is None:
+            return await send(request)
+        endpoint.stats.requests += 1
+        hedge = self.settings.hedge_speech and endpoint.name == 'speech'
+        for attempt in range(self.settings.retries + 1):
+            last = attempt == self.settings.retries
+            try:
+                if hedge:
+                    response, latency = await self._hedged(request, send, endpoint)
+                else:
+                    response, latency = await self._attempt(request, send, endpoint)
+            except RETRY_ERRORS:
+                if last:
+                    raise
+                await self._retry_wait(endpoint, attempt, None)
+                continue
+
+            if response.status_code == 429:
+                endpoint.stats.throttled += 1
+            if response.status_code in CONGESTION_STATUSES:
+                endpoint.limit.on_congestion()
+            else:
+                endpoint.limit.on_success(latency if endpoint.use_latency else None)
+            if response.status_code not in RETRY_STATUSES or last:
+                return response
+
+            wait = retry_after(response.headers)
+            await response.aclose()
+            if response.status_code == 429 and wait:
+                endpoint.bucket.pause(wait)  # the limit applies to every request on this key, not just this one
+            await self._retry_wait(endpoint, attempt, wait)
+        raise AssertionError("unreachable")
+
+    async def _retry_wait(self, endpoint: Endpoint, attempt: int, at_least: Optional[float]):
+        endpoint.stats.retries += 1
+        METRICS.count('retries', endpoint=endpoint.name)
+        backoff = random.uniform(0, min(self.settings.max_backoff, self.settings.backoff * 2 ** attempt))
+        await asyncio.sleep(max(backoff, at_least or 0.0))
+
+    async def _attempt(self, request: httpx.Request, send: Send, endpoint: Endpoint,
+                       take_token: bool = True) -> Tuple[httpx.Response, float]:
+        if take_token:
+            await endpoint.bucket.take()
+        await endpoint.limit.acquire()
+        start = time.monotonic()
+        try:
+            response = await send(request)
+        except BaseException:
+            endpoint.limit.release()
+            raise
+        latency = time.monotonic() - start
+        if response.status_code < 400:
+            endpoint.record_latency(latency)
+        response.stream = _ReleasingStream(response.stream, endpoint.limit.release)
+        return response, latency
+
+    async def _hedged(self, request: httpx.Request, send: Send, endpoint: Endpoint) -> Tuple[httpx.Response, float]:
+        delay = endpoint.p95
+        if delay is None or endpoint.stats.hedges >= endpoint.stats.requests * self.settings.hedge_budget:
+            return await self._attempt(request, send, endpoint)
+        first = asyncio.create_task(self._attempt(request, send, endpoint))
+        tasks, winner = [first], None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            # Only into spare capacity: a hedge must not queue behind, or crowd out, other requests
+            if done or endpoint.limit.in_flight >= int(endpoint.limit.limit) or not endpoint.bucket.try_take():
+                winner = first
+                return await first
+            endpoint.stats.hedges += 1
+            METRICS.count('hedges', endpoint=endpoint.name)
+            tasks.append(asyncio.create_task(self._attempt(request, send, endpoint, take_token=False)))
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in tasks if task in done and task.exception() is None), None)
+            if winner is None:
+                return first.result()  # both failed: raise the original request's error
+            if winner is not first:
+                endpoint.stats.hedge_wins += 1
+            return winner.result()
+        finally:
+            for task in tasks:
+                if task is not winner:
+                    await _discard(task)
+
+    def snapshot(self) -> dict:
+        return {name: endpoint.snapshot() for name, endpoint in self.endpoints.items()}
+
+
+async def _discard(task: asyncio.Task):
+    """Cancel the losing copy of a hedged request, closing its response if it already has one."""
+    if not task.done():
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            return
+    if not task.cancelled() and task.exception() is None:
+        response, _ = task.result()
+        await response.aclose()
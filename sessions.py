@@ -0,0 +1,218 @@
+"""Conversation memory per caller, so a follow-up turn or call continues where it left off.
+
+A session holds the caller's recent exchanges verbatim. Once they outgrow a
+token budget (counted with tiktoken when it is installed), the oldest are
+folded into a short summary by a small model, off the reply's critical path.
+
+The messages sent for a turn are laid out for provider-side prompt caching:
+the memoized system prompt, then the summary, then earlier turns in order,
+then the new question. Between summaries, each request repeats the previous
+one's messages byte for byte and only appends to them, so the longer a call
+runs, the more of its prompt is served from the cache.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from metrics import METRICS
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_LABEL = "Summary of the conversation so far:\n"
+SUMMARY_PROMPT = ("Summarize this phone conversation between a business's answering assistant and a caller "
+                  "in under {words} words. Keep names, numbers, dates and what the caller still needs.")
+
+
+# ==================== TOKENS ====================
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+    except Exception as e:
+        # The encoding files are downloaded on first use
+        logger.warning("tiktoken encoding for %s unavailable (%s); estimating tokens from length", model, e)
+        return None
+
+
+def count_tokens(text: str, model: str = 'gpt-4o') -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4  # about four characters per token in English
+    return len(encoding.encode(text))
+
+
+def turn_tokens(turns: List[Tuple[str, str]], model: str = 'gpt-4o') -> int:
+    """Prompt tokens for exchanges as chat messages, counting the few tokens of framing each message adds."""
+    return sum(count_tokens(said, model) + count_tokens(answered, model) + 8 for said, answered in turns)
+
+
+def message_tokens(messages: List[dict], model: str = 'gpt-4o') -> int:
+    """Prompt tokens for chat messages, as OpenAI would count them before its own figure is known."""
+    return sum(count_tokens(message.get('content') or '', model) + 4 for message in messages) + 3
+
+
+# ==================== SESSIONS ====================
+@dataclass(frozen=True)
+class SessionSettings:
+    history_tokens: int = 2000  # earlier turns kept verbatim; older ones are summarized
+    keep_turns: int = 2  # most recent exchanges never summarized
+    summary_words: int = 80
+    summary_model: str = 'gpt-4o-mini'
+    idle_seconds: float = 1800.0  # a caller who rings back within this continues the conversation
+    max_sessions: int = 10000
+
+    @classmethod
+    def from_env(cls) -> 'SessionSettings':
+        settings = cls()
+        overrides = {}
+        for name, value in vars(settings).items():
+            raw = os.environ.get(f"VOICE_SESSION_{name.upper()}")
+            if raw is not None:
+                overrides[name] = type(value)(raw)
+        return replace(settings, **overrides)
+
+
+@dataclass
+class Session:
+    turns: List[Tuple[str, str]] = field(default_factory=list)  # (caller said, assistant answered)
+    summary: str = ''
+    summarized: int = 0  # exchanges folded into the summary
+    updated: float = field(default_factory=time.monotonic)
+    compacting: bool = False
+
+    @property
+    def length(self) -> int:
+        return self.summarized + len(self.turns)
+
+
+def history_messages(session: Session, budget: int, model: str = 'gpt-4o') -> List[dict]:
+    """The summary and earlier turns as chat messages.
+
+    While a summary is being written the turns may run past ``budget``, which
+    keeps the cached prefix intact; only past twice the budget are the oldest dropped.
+    """
+    turns = list(session.turns)
+    while len(turns) > 1 and turn_tokens(turns, model) > 2 * budget:
+        turns.pop(0)
+    messages = [{"role": "system", "content": SUMMARY_LABEL + session.summary}] if session.summary else []
+    for said, answered in turns:
+        messages.append({"role": "user", "content": said})
+        messages.append({"role": "assistant", "content": answered})
+    return messages
+
+
+async def summarize(client, summary: str, turns: List[Tuple[str, str]], model: str, words: int) -> str:
+    transcript = "\n".join(f"Caller: {said}\nAssistant: {answered}" for said, answered in turns)
+    if summary:
+        transcript = f"{SUMMARY_LABEL}{summary}\n\nThen:\n{transcript}"
+    response = await client.chat.completions.create(
+        model=model,
+        messages=[{"role": "system", "content": SUMMARY_PROMPT.format(words=words)},
+                  {"role": "user", "content": transcript}],
+        temperature=0.2,
+        max_tokens=words * 2
+    )
+    if response.usage:
+        METRICS.add_usage(model, input_tokens=response.usage.prompt_tokens,
+                          output_tokens=response.usage.completion_tokens)
+    return response.choices[0].message.content.strip()
+
+
+@dataclass
+class SessionStats:
+    turns: int = 0
+    summaries: int = 0
+    summary_failures: int = 0
+    expired: int = 0
+
+
+class SessionStore:
+    """Sessions by (tenant, caller), least recently active dropped past ``max_sessions``."""
+
+    def __init__(self, settings: SessionSettings = None):
+        self.settings = settings or SessionSettings.from_env()
+        self.stats = SessionStats()
+        self._sessions: 'OrderedDict[Tuple[str, str], Session]' = OrderedDict()
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    def get(self, tenant: str, caller: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.get((tenant, caller))
+            if session is not None and time.monotonic() - session.updated > self.settings.idle_seconds:
+                del self._sessions[(tenant, caller)]
+                self.stats.expired += 1
+                return None
+            return session
+
+    def history(self, tenant: str, caller: str, model: str = 'gpt-4o') -> List[dict]:
+        session = self.get(tenant, caller)
+        if session is None:
+            return []
+        with self._lock:
+            return history_messages(session, self.settings.history_tokens, model)
+
+    def record(self, client, tenant: str, caller: str, said: str, answered: str, model: str = 'gpt-4o'):
+        """Add an exchange; summarizes older ones in the background once they outgrow the budget."""
+        now = time.monotonic()
+        with self._lock:
+            key = (tenant, caller)
+            session = self._sessions.get(key)
+            if session is None or now - session.updated > self.settings.idle_seconds:
+                session = self._sessions[key] = Session()
+            self._sessions.move_to_end(key)
+            session.turns.append((said, answered))
+            session.updated = now
+            self.stats.turns += 1
+            while len(self._sessions) > self.settings.max_sessions:
+                self._sessions.popitem(last=False)
+            due = (not session.compacting and len(session.turns) > self.settings.keep_turns
+                   and turn_tokens(session.turns, model) > self.settings.history_tokens)
+            if due:
+                session.compacting = True
+        if due:
+            task = asyncio.ensure_future(self._compact(client, session))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _compact(self, client, session: Session):
+        with self._lock:
+            folded = session.turns[:-self.settings.keep_turns]
+            summary = session.summary
+        try:
+            summary = await summarize(client, summary, folded, self.settings.summary_model,
+                                      self.settings.summary_words)
+        except Exception as e:
+            self.stats.summary_failures += 1
+            logger.warning("could not summarize a conversation: %s", e)
+            session.compacting = False
+            return
+        with self._lock:
+            # Turns added while the summary was being written stay verbatim
+            session.turns = session.turns[len(folded):]
+            session.summary = summary
+            session.summarized += len(folded)
+            session.compacting = False
+            self.stats.summaries += 1
+
+    def forget(self, tenant: str, caller: str):
+        with self._lock:
+            self._sessions.pop((tenant, caller), None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -0,0 +1,119 @@
+"""Speculative replies on phone calls: the model starts while the caller pauses.
+
+A phone turn ends after the VAD hangover (vad.py), and only then is it sent to
+Whisper; the model waits for the whole transcript. With speculation on, a
+shorter pause (``pause_ms``) already transcribes the turn so far and starts a
+reply on that partial transcript: written, voiced and held back, not played.
+
+When the turn ends, the final transcript is compared with the partial one word
+by word. If the caller said nothing more, the partial transcript is the final
+one and isn't transcribed again. If the final transcript starts with it and
+adds no more than ``max_tail_words`` ("um", "thanks"), the held-back reply is
+committed and plays at once. Otherwise it is cancelled and the turn is answered
+from the final transcript as usual. A caller who goes on talking pauses again
+before the turn ends; the longer partial transcript is held to the same test,
+and a reply it rules out is cancelled and restarted from it.
+
+A held-back reply is written as far as its first sentence of answer, with
+one more voiced ahead (``LOOKAHEAD``), then waits: the completion isn't read
+any further, and the rest of the reply, and the turn in the caller's session
+history, only follow once it is committed.
+
+Outcomes are counted in ``voice_speculations_total{outcome=...}``; tokens spent
+on cancelled replies, the prompt they sent included, in
+``voice_speculation_wasted_tokens_total``.
+"""
+import asyncio
+import os
+import re
+from contextlib import aclosing
+from dataclasses import dataclass, replace
+from typing import AsyncIterator, List
+
+from call_processor import CallConfig, CallProcessor
+from metrics import METRICS, CallUsage, attach
+from phrases import BOOKENDS
+from pipeline import AudioChunk
+
+WORD = re.compile(r"[\w']+")
+LOOKAHEAD = 1  # sentences a held-back reply voices beyond those it holds
+
+
+@dataclass(frozen=True)
+class SpeculationSettings:
+    pause_ms: int = 0  # a pause this long starts a speculative reply; keep it under the hangover. 0 turns it off
+    min_speech_ms: int = 1000  # shorter turns transcribe quickly enough without
+    max_tail_words: int = 2  # words the final transcript may add and still be answered by the speculative reply
+
+    @property
+    def enabled(self) -> bool:
+        return self.pause_ms > 0
+
+    @classmethod
+    def from_env(cls) -> 'SpeculationSettings':
+        settings = cls()
+        overrides = {name: type(value)(os.environ[f"VOICE_SPECULATE_{name.upper()}"])
+                     for name, value in vars(settings).items() if f"VOICE_SPECULATE_{name.upper()}" in os.environ}
+        return replace(settings, **overrides)
+
+
+def words(text: str) -> List[str]:
+    return WORD.findall(text.lower())
+
+
+def extends(partial: str, final: str, max_tail_words: int) -> bool:
+    """Whether ``final`` is ``partial`` plus at most ``max_tail_words`` more, ignoring case and punctuation."""
+    head, whole = words(partial), words(final)
+    return whole[:len(head)] == head and len(whole) - len(head) <= max_tail_words
+
+
+class Speculation:
+    """A reply started on a partial transcript, held back until the turn ends."""
+
+    def __init__(self, processor: CallProcessor, text: str, config: CallConfig, turn: int,
+                 settings: SpeculationSettings):
+        self.text = text
+        self.settings = settings
+        self.usage = CallUsage()
+        self.committed = False
+        self._go = asyncio.Event()
+        self._chunks: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(processor, config, turn))
+
+    async def _run(self, processor: CallProcessor, config: CallConfig, turn: int):
+        try:
+            with attach(self.usage):
+                async with aclosing(processor.stream_response(self.text, config, turn=turn,
+                                                              lookahead=LOOKAHEAD)) as chunks:
+                    async for chunk in chunks:
+                        self._chunks.put_nowait(chunk)
+                        if chunk.source not in BOOKENDS:
+                            await self._go.wait()
+        finally:
+            self._chunks.put_nowait(None)
+
+    def matches(self, transcript: str) -> bool:
+        """Whether this reply still answers ``transcript``, a later or the final one."""
+        return extends(self.text, transcript, self.settings.max_tail_words)
+
+    async def commit(self) -> AsyncIterator[AudioChunk]:
+        """The held-back reply, then whatever is still to come of it."""
+        self.committed = True
+        self._go.set()
+        METRICS.count('speculations', outcome='committed')
+        try:
+            while (chunk := await self._chunks.get()) is not None:
+                yield chunk
+            await self._task  # raises if the reply failed
+        finally:
+            # Closed early by a barge-in: the rest of the reply isn't wanted
+            self._task.cancel()
+
+    async def cancel(self, outcome: str = 'cancelled') -> int:
+        """Stop the reply; returns the tokens it had used, prompt and output."""
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        wasted = self.usage.tokens()
+        METRICS.count('speculations', outcome=outcome)
+        METRICS.count('speculation_wasted_tokens', amount=wasted)
+        return wasted
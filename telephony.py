@@ -0,0 +1,505 @@
+"""Real-time phone calls over Twilio Media Streams.
+
+Point a Twilio number's voice webhook (HTTP GET) at ``/twiml``; the TwiML it
+returns connects the call to ``/media`` as a bidirectional Media Stream. The
+caller's audio arrives as 20 ms frames of 8 kHz μ-law and is endpointed into
+turns by vad.py. Each turn goes through the same CallProcessor the Streamlit app uses
+(Whisper, intent fast paths, answer cache, GPT-4o, TTS), and the reply streams
+back sentence by sentence as μ-law frames. If the caller talks over the reply,
+Twilio is told to clear its playback buffer (barge-in).
+
+With ``--tenants``, one gateway answers for many businesses: the number the
+caller dialed (Twilio's ``To``) picks the tenant's profile, caches and history
+partition (see tenants.py).
+
+Each call is one conversation: later turns are answered knowing the earlier
+ones. It is keyed by the caller's number (Twilio's ``From``), so calling back
+soon afterwards picks the conversation up again (see sessions.py).
+
+With ``--speculate-pause-ms``, a reply is started on what the caller said
+before a short pause, and kept if the turn ends there (see speculation.py).
+
+With an archive (archive.py), what the caller said and what they were played
+back are kept with the call's history row, as two μ-law tracks.
+
+    python telephony.py --port 8080 --business-name "Acme Plumbing"
+    python telephony.py --port 8080 --tenants tenants.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import struct
+import time
+from collections import deque
+from contextlib import aclosing, suppress
+from dataclasses import dataclass, field, replace
+from http import HTTPStatus
+from typing import Deque, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+from websockets.asyncio.server import ServerConnection, serve
+from websockets.exceptions import ConnectionClosed
+
+from audio_io import pcm16_to_ulaw, resample, ulaw_to_pcm16
+from call_processor import CallConfig, CallProcessor
+from metrics import CONTENT_TYPE, METRICS, attach
+from phrases import BOOKENDS, PhraseBank
+from speculation import Speculation, SpeculationSettings
+from tenants import TenantRegistry
+from vad import Endpointer, VADConfig, VADEvent
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 8000
+FRAME_MS = 20
+FRAME_BYTES = SAMPLE_RATE * FRAME_MS // 1000  # μ-law is one byte per sample
+TTS_SAMPLE_RATE = 24000  # what the speech endpoint returns for response_format='pcm'
+# Played when a turn's transcription, answer or speech fails, so the caller isn't left in silence
+APOLOGY = "Sorry, I'm having trouble hearing you right now. Could you say that again?"
+
+
+def ulaw_wav(data: bytes, rate: int = SAMPLE_RATE) -> bytes:
+    """Wrap raw μ-law in a WAV header; Whisper takes it as is, at half the bytes of 16-bit PCM."""
+    fmt = struct.pack('<HHIIHHH', 7, 1, rate, rate, 1, 8, 0)  # WAVE_FORMAT_MULAW, mono, 8-bit
+    body = (b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+            + b'fact' + struct.pack('<II', 4, len(data))
+            + b'data' + struct.pack('<I', len(data)) + data)
+    return b'RIFF' + struct.pack('<I', len(body)) + body
+
+
+def reply_frames(audio: bytes) -> bytes:
+    """24 kHz 16-bit speech from the TTS endpoint as 8 kHz μ-law for the call."""
+    pcm = np.frombuffer(audio, dtype='<i2', count=len(audio) // 2)
+    return pcm16_to_ulaw(resample(pcm, TTS_SAMPLE_RATE, SAMPLE_RATE))
+
+
+# ==================== SETTINGS ====================
+@dataclass
+class GatewaySettings:
+    # Turns are endpointed on the decoded 8 kHz stream; hangover_ms is the pause that ends a turn
+    vad: VADConfig = field(default_factory=VADConfig)
+    # Target from the end of the caller's speech to the first reply audio:
+    # hangover + STT + first sentence of the answer + its TTS
+    turn_budget_ms: int = 1500
+    speculation: SpeculationSettings = field(default_factory=SpeculationSettings.from_env)
+
+
+# ==================== CALL SESSION ====================
+@dataclass
+class GatewayStats:
+    calls: int = 0
+    active_calls: int = 0
+    turns: int = 0
+    budget_misses: int = 0
+    barge_ins: int = 0
+    speculations: int = 0
+    speculation_hits: int = 0  # speculative replies that were played
+    wasted_tokens: int = 0  # used by the ones that were cancelled
+    # Seconds from the end of the caller's speech to the first reply frame sent, which is a
+    # recorded greeting or filler when one is ready, and to the first frame of the answer itself
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=2000))
+    answer_latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=2000))
+
+    def percentile(self, q: float, values: Deque[float] = None) -> Optional[float]:
+        values = self.latencies if values is None else values
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def snapshot(self) -> dict:
+        return {
+            'calls': self.calls,
+            'active_calls': self.active_calls,
+            'turns': self.turns,
+            'budget_misses': self.budget_misses,
+            'barge_ins': self.barge_ins,
+            'speculations': self.speculations,
+            'speculation_hits': self.speculation_hits,
+            'wasted_tokens': self.wasted_tokens,
+            'latency_p50': self.percentile(0.5),
+            'latency_p95': self.percentile(0.95),
+            'answer_latency_p50': self.percentile(0.5, self.answer_latencies),
+            'answer_latency_p95': self.percentile(0.95, self.answer_latencies),
+        }
+
+
+class CallSession:
+    """One Media Stream: inbound frames in, turns through the processor, reply frames out."""
+
+    def __init__(self, gateway: 'MediaStreamGateway', connection: ServerConnection):
+        self.gateway = gateway
+        self.connection = connection
+        self.config = replace(gateway.config, audio_format='pcm')
+        self.processor = gateway.processor
+        self.endpointer = Endpointer(replace(gateway.settings.vad, sample_rate=SAMPLE_RATE,
+                                             pause_ms=gateway.settings.speculation.pause_ms))
+        self.stream_sid = None
+        self.reply: Optional[asyncio.Task] = None
+        self.reply_input = b''
+        self.reply_audio_sent = False
+        self.reply_answered = False  # past the recorded greeting or filler, into the answer
+        self.pending_marks = set()
+        # The turn so far as of the caller's last pause and its transcription, and a reply
+        # started on an earlier one, held back until the turn ends
+        self.partial: Optional[Tuple[bytes, asyncio.Task]] = None
+        self.speculation: Optional[Speculation] = None
+        self.discarding = set()  # speculative replies being cancelled in the background
+        # Audio of a turn whose reply was cut off before its answer began; the
+        # caller was still talking, so it is prepended to their next turn
+        self.unanswered = b''
+        self.turns = 0
+        self.transcript: List[tuple] = []
+        # Both sides of the call as μ-law, for the archive; the reply track leaves out the pauses between replies
+        self.heard = bytearray() if gateway.archive is not None else None
+        self.said = bytearray() if gateway.archive is not None else None
+        self.started = time.monotonic()
+        self.usage = METRICS.new_call(transport='twilio')
+
+    @property
+    def speaking(self) -> bool:
+        return (self.reply is not None and not self.reply.done()) or bool(self.pending_marks)
+
+    async def run(self):
+        try:
+            async for message in self.connection:
+                event = json.loads(message)
+                kind = event.get('event')
+                if kind == 'start':
+                    self.start(event['start'])
+                elif kind == 'media' and event['media'].get('track', 'inbound') == 'inbound':
+                    await self.on_media(base64.b64decode(event['media']['payload']))
+                elif kind == 'mark':
+                    self.pending_marks.discard(event['mark']['name'])
+                elif kind == 'stop':
+                    break
+        except ConnectionClosed:
+            pass
+        finally:
+            if self.reply is not None:
+                self.reply.cancel()
+            if self.partial is not None:
+                self.partial[1].cancel()
+            if self.speculation is not None:
+                await self.discard(self.speculation)
+            # Their tokens belong to this call's usage, which save() closes
+            await asyncio.gather(*self.discarding, return_exceptions=True)
+            await self.save()
+
+    def start(self, start: dict):
+        self.stream_sid = start.get('streamSid')
+        parameters = start.get('customParameters') or {}
+        tenants = self.gateway.tenants
+        if tenants is not None and parameters.get('to'):
+            routed = tenants.route(parameters['to'])
+            if routed is None:
+                logger.warning("no tenant for dialed number %s; answering with the default profile", parameters['to'])
+            else:
+                tenant, self.processor = routed
+                self.config = replace(tenant.config, audio_format='pcm')
+        # <Parameter> values on the TwiML <Stream> override the business profile for this call
+        overrides = {k: v for k, v in parameters.items()
+                     if k in ('business_name', 'phone_number', 'business_hours', 'voice')}
+        if overrides:
+            self.config = replace(self.config, **overrides)
+        # The caller's number keys their conversation, so calling back continues it; without one, it lasts the call
+        self.config = replace(self.config, caller=parameters.get('from') or self.stream_sid or '')
+        # Usually ready well before the caller finishes their first sentence
+        self.processor.prepare_phrases(self.config)
+
+    async def on_media(self, frame: bytes):
+        if self.heard is not None:
+            self.heard += frame
+        for event in self.endpointer.push(ulaw_to_pcm16(frame).tobytes()):
+            if event.kind == 'speech_start' and self.speaking:
+                await self.barge_in()
+            elif event.kind == 'pause':
+                self.speculate(event)
+            elif event.kind == 'utterance_complete':
+                # The caller stopped talking one hangover ago
+                speech_end = time.monotonic() - (event.at_ms - event.end_ms) / 1000
+                self.reply_input = self.unanswered + pcm16_to_ulaw(np.frombuffer(event.audio, dtype=np.int16))
+                self.unanswered = b''
+                self.reply_audio_sent = False
+                self.reply_answered = False
+                partial, self.partial = self.partial, None
+                speculation, self.speculation = self.speculation, None
+                self.reply = asyncio.create_task(self.respond(self.reply_input, speech_end, partial, speculation))
+
+    def speculate(self, pause: VADEvent):
+        settings = self.gateway.settings.speculation
+        if self.unanswered or pause.end_ms - pause.start_ms < settings.min_speech_ms:
+            return
+        audio = pcm16_to_ulaw(np.frombuffer(pause.audio, dtype=np.int16))
+        self.partial = (audio, asyncio.create_task(self.transcribe_partial(audio)))
+
+    async def transcribe_partial(self, audio: bytes) -> str:
+        """The turn so far; starts a reply on it unless the one already started still answers it."""
+        with attach(self.usage):
+            text = await self.processor.transcribe(ulaw_wav(audio), self.config,
+                                                   filename=f"turn{self.turns + 1}-partial.wav", prepare=False)
+        if self.partial is None or self.partial[0] is not audio:
+            return text  # a later pause or the end of the turn came first
+        speculation = self.speculation
+        if speculation is not None and speculation.matches(text):
+            return text
+        if speculation is not None:
+            task = asyncio.create_task(self.discard(speculation, 'restarted'))
+            self.discarding.add(task)
+            task.add_done_callback(self.discarding.discard)
+        self.speculation = None
+        if text:
+            self.speculation = Speculation(self.processor, text, self.config, self.turns + 1,
+                                           self.gateway.settings.speculation)
+            self.gateway.stats.speculations += 1
+        return text
+
+    async def discard(self, speculation: Speculation, outcome: str = 'cancelled'):
+        self.gateway.stats.wasted_tokens += await speculation.cancel(outcome)
+        self.usage.add(speculation.usage)
+
+    async def barge_in(self):
+        if self.reply is not None and not self.reply.done():
+            self.reply.cancel()
+            if not self.reply_answered:
+                self.unanswered = self.reply_input
+        if self.reply_audio_sent or self.pending_marks:
+            await self.send({'event': 'clear'})
+            self.pending_marks.clear()
+            self.gateway.stats.barge_ins += 1
+        self.reply_audio_sent = False
+
+    async def respond(self, audio: bytes, speech_end: float, partial: Optional[Tuple[bytes, asyncio.Task]] = None,
+                      speculation: Optional[Speculation] = None):
+        try:
+            with attach(self.usage):
+                await self._respond(audio, speech_end, partial, speculation)
+        except ConnectionClosed:
+            pass  # the caller hung up mid-reply
+        except Exception:
+            logger.exception("turn %s on %s failed", self.turns, self.stream_sid)
+            await self.apologize()
+        finally:
+            if speculation is not None:
+                if speculation.committed:
+                    self.usage.add(speculation.usage)
+                else:
+                    await self.discard(speculation)
+
+    async def _respond(self, audio: bytes, speech_end: float, partial: Optional[Tuple[bytes, asyncio.Task]],
+                       speculation: Optional[Speculation]):
+        processor, stats = self.processor, self.gateway.stats
+        self.turns += 1
+        turn = self.turns
+        text = None
+        if partial is not None and partial[0] == audio:
+            # Nothing was said after the last pause: its transcript is the turn's
+            with suppress(Exception):
+                text = await partial[1]
+        if text is None:
+            text = await processor.transcribe(ulaw_wav(audio), self.config, filename=f"turn{turn}.wav",
+                                              prepare=False)
+        if text and speculation is not None and speculation.matches(text):
+            stats.speculation_hits += 1
+            replies = speculation.commit()
+        elif not text:
+            return
+        else:
+            replies = processor.stream_response(text, self.config, turn=turn)
+
+        sentences = []
+        async with aclosing(replies) as chunks:
+            async for chunk in chunks:
+                frames = reply_frames(chunk.audio)
+                if not self.reply_audio_sent:
+                    self.reply_audio_sent = True
+                    latency = time.monotonic() - speech_end
+                    stats.turns += 1
+                    stats.latencies.append(latency)
+                    if latency * 1000 > self.gateway.settings.turn_budget_ms:
+                        stats.budget_misses += 1
+                        logger.info("turn %s on %s took %.0f ms to first audio", turn, self.stream_sid,
+                                    latency * 1000)
+                if not self.reply_answered and chunk.source not in BOOKENDS:
+                    self.reply_answered = True
+                    stats.answer_latencies.append(time.monotonic() - speech_end)
+                await self.send_audio(frames)
+                sentences.append(chunk.text)
+
+        await self.send_mark(f"turn-{turn}")
+        self.transcript.append((text, " ".join(sentences)))
+
+    async def apologize(self):
+        # Best effort: if speech is what failed, the caller at least gets the mark's end of turn
+        with suppress(Exception):
+            async with aclosing(self.processor.speak(APOLOGY, self.config, source='apology')) as chunks:
+                async for chunk in chunks:
+                    self.reply_audio_sent = True
+                    await self.send_audio(reply_frames(chunk.audio))
+        with suppress(ConnectionClosed):
+            await self.send_mark(f"turn-{self.turns}-apology")
+
+    async def send_mark(self, mark: str):
+        self.pending_marks.add(mark)
+        await self.send({'event': 'mark', 'mark': {'name': mark}})
+
+    async def send_audio(self, audio: bytes):
+        if self.said is not None:
+            self.said += audio
+        for offset in range(0, len(audio), FRAME_BYTES):
+            payload = base64.b64encode(audio[offset:offset + FRAME_BYTES]).decode()
+            await self.send({'event': 'media', 'media': {'payload': payload}})
+
+    async def send(self, message: dict):
+        message['streamSid'] = self.stream_sid
+        await self.connection.send(json.dumps(message))
+
+    async def save(self):
+        METRICS.end_call(self.usage)
+        store, archive = self.gateway.store, self.gateway.archive
+        if store is None or not self.transcript:
+            return
+        record = {
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time())),
+            'customer_message': "\n".join(caller for caller, _ in self.transcript),
+            'ai_response': "\n".join(reply for _, reply in self.transcript),
+            'duration': f"{time.monotonic() - self.started:.0f}s",
+            'tenant': self.config.tenant,
+        }
+        if archive is not None:
+            # Encoding an hour-long call takes a while; other calls carry on meanwhile
+            record['audio_ref'] = await asyncio.to_thread(archive.put, ulaw_wav(self.heard), ulaw_wav(self.said),
+                                                          'call.wav')
+        store.add(record)
+
+
+# ==================== SERVER ====================
+class MediaStreamGateway:
+    """WebSocket server for Twilio Media Streams.
+
+    One CallProcessor serves every call, or with ``tenants``, one per tenant,
+    chosen by the dialed number; numbers no tenant owns get ``processor`` and ``config``.
+    """
+
+    def __init__(self, processor: CallProcessor, config: CallConfig = None, settings: GatewaySettings = None,
+                 store=None, public_url: str = None, tenants: TenantRegistry = None, archive=None):
+        self.processor = processor
+        self.config = config or CallConfig()
+        self.settings = settings or GatewaySettings()
+        self.store = store
+        self.archive = archive
+        self.public_url = public_url
+        self.tenants = tenants
+        self.stats = GatewayStats()
+
+    def twiml(self, host: str, dialed: str = None, caller: str = None) -> str:
+        url = self.public_url or f"wss://{host}/media"
+        # Media Streams don't carry the dialed or calling number, so they're handed to the stream as parameters
+        parameters = ''.join(f'<Parameter name="{name}" value={quoteattr(value)}/>'
+                             for name, value in (('to', dialed), ('from', caller)) if value)
+        return ('<?xml version="1.0" encoding="UTF-8"?>'
+                f'<Response><Connect><Stream url={quoteattr(url)}>{parameters}</Stream></Connect></Response>')
+
+    def process_request(self, connection: ServerConnection, request):
+        url = urlsplit(request.path)
+        path = url.path
+        if path == '/twiml':
+            query = parse_qs(url.query)
+            twiml = self.twiml(request.headers.get('Host', 'localhost'), query.get('To', [None])[0],
+                               query.get('From', [None])[0])
+            response = connection.respond(HTTPStatus.OK, twiml)
+            del response.headers['Content-Type']
+            response.headers['Content-Type'] = 'text/xml'
+            return response
+        if path == '/health':
+            return connection.respond(HTTPStatus.OK, json.dumps(self.stats.snapshot()) + '\n')
+        if path == '/metrics':
+            response = connection.respond(HTTPStatus.OK, METRICS.render())
+            del response.headers['Content-Type']
+            response.headers['Content-Type'] = CONTENT_TYPE
+            return response
+        if path != '/media':
+            return connection.respond(HTTPStatus.NOT_FOUND, 'Not found\n')
+        return None
+
+    async def handle(self, connection: ServerConnection):
+        self.stats.calls += 1
+        self.stats.active_calls += 1
+        try:
+            await CallSession(self, connection).run()
+        finally:
+            self.stats.active_calls -= 1
+
+    def serve(self, host: str = '0.0.0.0', port: int = 8080):
+        """``async with gateway.serve(...) as server:``; port 0 picks a free port."""
+        return serve(self.handle, host, port, process_request=self.process_request, compression=None)
+
+
+# ==================== CLI ====================
+def main():
+    from answer_cache import AnswerCache
+    from archive import AudioArchive
+    from backends import MODEL_POOL
+    from call_store import CallStore
+    from intents import IntentClassifier
+    from sessions import SessionStore
+    from tts_cache import TTSCache
+
+    defaults = CallConfig()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--public-url', help='wss:// URL Twilio should stream to (default: from the Host header)')
+    parser.add_argument('--business-name', default=defaults.business_name)
+    parser.add_argument('--phone-number', default=defaults.phone_number)
+    parser.add_argument('--business-hours', default=defaults.business_hours)
+    parser.add_argument('--voice', default=defaults.voice)
+    parser.add_argument('--stt-backend', default=defaults.stt_backend,
+                        help="'openai', or a local backend such as 'faster-whisper' or 'faster-whisper:small.en'")
+    parser.add_argument('--tts-backend', default=defaults.tts_backend,
+                        help="'openai', or a local backend such as 'piper' or 'piper:en_US-amy-medium'")
+    parser.add_argument('--tenants', help='JSON list of tenant profiles to route calls by dialed number')
+    parser.add_argument('--hangover-ms', type=int, default=VADConfig.hangover_ms, help='pause that ends a turn')
+    parser.add_argument('--turn-budget-ms', type=int, default=GatewaySettings.turn_budget_ms)
+    parser.add_argument('--speculate-pause-ms', type=int, default=SpeculationSettings.from_env().pause_ms,
+                        help='pause that starts a speculative reply, under the hangover (0: off)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    config = CallConfig(business_name=args.business_name, phone_number=args.phone_number,
+                        business_hours=args.business_hours, voice=args.voice,
+                        stt_backend=args.stt_backend, tts_backend=args.tts_backend)
+    phrases, sessions = PhraseBank(), SessionStore()
+    processor = CallProcessor.from_api_key(os.environ['OPENAI_API_KEY'], tts_cache=TTSCache(),
+                                           answer_cache=AnswerCache(), intents=IntentClassifier(), phrases=phrases,
+                                           sessions=sessions)
+    settings = GatewaySettings(vad=VADConfig(hangover_ms=args.hangover_ms), turn_budget_ms=args.turn_budget_ms,
+                               speculation=replace(SpeculationSettings.from_env(), pause_ms=args.speculate_pause_ms))
+    tenants = (TenantRegistry.load(processor.client, args.tenants, intents=IntentClassifier(), phrases=phrases,
+                                   sessions=sessions)
+               if args.tenants else None)
+    configs = [config] + [tenant.config for tenant in tenants or ()]
+    # Local models load before the first call rings, not during it
+    MODEL_POOL.warm([c.stt_backend for c in configs], [c.tts_backend for c in configs])
+    gateway = MediaStreamGateway(processor, config, settings,
+                                 store=CallStore(), public_url=args.public_url, tenants=tenants,
+                                 archive=AudioArchive())
+
+    async def run():
+        async with gateway.serve(args.host, args.port):
+            logger.info("Media Streams gateway on ws://%s:%s/media (TwiML at /twiml)", args.host, args.port)
+            await asyncio.get_running_loop().create_future()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
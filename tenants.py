@@ -0,0 +1,150 @@
+"""Tenant registry: one deployment answering for many businesses.
+
+A tenant is a business profile (name, hours, voice, speed and answer style)
+reached on one or more dialed numbers. ``TenantRegistry.route`` maps the number
+a caller dialed to the tenant's ready-made ``CallConfig`` and a CallProcessor
+with the tenant's own answer and speech caches, with a dict lookup: system
+prompts are compiled when a tenant is added, not per call. Call history is
+partitioned by ``CallConfig.tenant``.
+
+Tenants are read from a JSON list (``$VOICE_TENANTS``, default ``tenants.json``
+in the data directory); any ``CallConfig`` field may be set per tenant:
+
+    [{"id": "acme", "business_name": "Acme Plumbing", "phone_number": "+15550100",
+      "business_hours": "24/7", "voice": "onyx", "speed": 1.1, "response_style": "Friendly"}]
+"""
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, fields
+from typing import Dict, Iterator, Optional, Tuple
+
+from openai import AsyncOpenAI
+
+from answer_cache import AnswerCache
+from call_processor import CallConfig, CallProcessor, build_system_prompt, prompt_key
+from intents import IntentClassifier
+from paths import data_dir
+from phrases import PhraseBank
+from preprocess import PreprocessConfig
+from sessions import SessionStore
+from tts_cache import TTSCache
+
+# Per-call fields that a tenant's profile doesn't set
+PROFILE_FIELDS = {f.name for f in fields(CallConfig)} - {'tenant', 'audio_format', 'greeted', 'caller'}
+TENANT_ID = re.compile(r'^[A-Za-z0-9_-]+$')  # also a directory name for the tenant's caches
+
+
+def normalize_number(number: str) -> str:
+    """'+1 (555) 010-0100' -> '+15550100100'. Twilio sends E.164 already; hand-written configs may not."""
+    digits = re.sub(r'\D', '', number or '')
+    return f"+{digits}" if digits else ''
+
+
+# ==================== TENANT ====================
+@dataclass(frozen=True)
+class Tenant:
+    tenant_id: str
+    config: CallConfig
+    numbers: Tuple[str, ...]  # dialed numbers that reach this tenant, normalized
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Tenant':
+        tenant_id = str(data['id'])
+        if not TENANT_ID.match(tenant_id):
+            raise ValueError(f"tenant id {tenant_id!r} may only use letters, digits, '-' and '_'")
+        config = CallConfig(**{k: v for k, v in data.items() if k in PROFILE_FIELDS}, tenant=tenant_id)
+        numbers = tuple(normalize_number(n) for n in data.get('numbers') or [config.phone_number])
+        return cls(tenant_id, config, numbers)
+
+
+@dataclass(frozen=True)
+class TenantSettings:
+    # Cache budgets per tenant; with hundreds of tenants they add up
+    answer_entries: int = 500
+    tts_memory_bytes: int = 2 * 1024 * 1024
+    tts_disk_bytes: int = 64 * 1024 * 1024
+
+
+# ==================== REGISTRY ====================
+class TenantRegistry:
+    """Tenants by id and by dialed number, each with a lazily created CallProcessor on one shared client."""
+
+    def __init__(self, client: AsyncOpenAI, settings: TenantSettings = None, intents: IntentClassifier = None,
+                 preprocess_config: PreprocessConfig = None, phrases: PhraseBank = None,
+                 sessions: SessionStore = None):
+        self.client = client
+        self.settings = settings or TenantSettings()
+        self.intents = intents
+        self.preprocess_config = preprocess_config
+        self.phrases = phrases  # one bank for every tenant; sets are keyed by tenant
+        self.sessions = sessions  # likewise, keyed by tenant and caller
+        self._tenants: Dict[str, Tenant] = {}
+        self._by_number: Dict[str, Tenant] = {}
+        self._processors: Dict[str, CallProcessor] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, client: AsyncOpenAI, path: str = None, **kwargs) -> 'TenantRegistry':
+        path = path or os.environ.get('VOICE_TENANTS') or os.path.join(data_dir(), 'tenants.json')
+        registry = cls(client, **kwargs)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for data in json.load(f):
+                    registry.add(Tenant.from_dict(data))
+        return registry
+
+    def add(self, tenant: Tenant):
+        """Add or replace a tenant; a replaced tenant's next call starts with empty caches."""
+        # Compiled now (and memoized) so routing a call never builds a prompt
+        prompt_key(build_system_prompt(tenant.config), tenant.config.chat_model)
+        with self._lock:
+            previous = self._tenants.get(tenant.tenant_id)
+            if previous is not None:
+                for number in previous.numbers:
+                    self._by_number.pop(number, None)
+                self._processors.pop(tenant.tenant_id, None)
+            self._tenants[tenant.tenant_id] = tenant
+            for number in tenant.numbers:
+                self._by_number[number] = tenant
+
+    def get(self, tenant_id: str) -> Optional[Tenant]:
+        return self._tenants.get(tenant_id)
+
+    def lookup(self, dialed: str) -> Optional[Tenant]:
+        tenant = self._by_number.get(dialed)
+        return tenant if tenant is not None else self._by_number.get(normalize_number(dialed))
+
+    def route(self, dialed: str) -> Optional[Tuple[Tenant, CallProcessor]]:
+        """The tenant a dialed number belongs to and the processor for its calls, or None if it's not ours."""
+        tenant = self.lookup(dialed)
+        return (tenant, self.processor_for(tenant)) if tenant is not None else None
+
+    def processor_for(self, tenant: Tenant) -> CallProcessor:
+        processor = self._processors.get(tenant.tenant_id)
+        if processor is None:
+            with self._lock:
+                processor = self._processors.get(tenant.tenant_id)
+                if processor is None:
+                    processor = self._processors[tenant.tenant_id] = self._new_processor(tenant)
+        return processor
+
+    def _new_processor(self, tenant: Tenant) -> CallProcessor:
+        s = self.settings
+        return CallProcessor(
+            self.client,
+            tts_cache=TTSCache(data_dir('tenants', tenant.tenant_id, 'tts_cache'),
+                               memory_max_bytes=s.tts_memory_bytes, disk_max_bytes=s.tts_disk_bytes),
+            answer_cache=AnswerCache(max_entries=s.answer_entries),
+            intents=self.intents,
+            preprocess_config=self.preprocess_config,
+            phrases=self.phrases,
+            sessions=self.sessions
+        )
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    def __iter__(self) -> Iterator[Tenant]:
+        return iter(list(self._tenants.values()))
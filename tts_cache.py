@@ -0,0 +1,149 @@
+"""Content-addressed cache for synthesized speech.
+
+Entries are keyed on a hash of (model, voice, speed, format, normalized text), so the
+test greeting and word-for-word repeated answers are synthesized once. A small
+in-memory LRU sits in front of an on-disk tier with size-based eviction.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from paths import data_dir
+
+# Formats the speech endpoint can return, as cached file extensions
+AUDIO_EXTENSIONS = ('.mp3', '.opus', '.aac', '.flac', '.wav', '.pcm')
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+
+def cache_key(model: str, voice: str, speed: float, text: str, response_format: str = 'mp3') -> str:
+    parts = [model, voice, round(float(speed), 2), normalize_text(text)]
+    if response_format != 'mp3':
+        # MP3 keys predate the format field; leaving them unchanged keeps existing caches valid
+        parts.append(response_format)
+    payload = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    memory_bytes: int = 0
+    disk_bytes: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class TTSCache:
+    def __init__(self, directory: str = None, memory_max_bytes: int = 32 * 1024 * 1024,
+                 disk_max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory or data_dir('tts_cache')
+        os.makedirs(self.directory, exist_ok=True)
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.stats = CacheStats()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats.disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    # ==================== LOOKUP ====================
+    def get(self, model: str, voice: str, speed: float, text: str, response_format: str = 'mp3') -> Optional[bytes]:
+        key = cache_key(model, voice, speed, text, response_format)
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.stats.memory_hits += 1
+                return audio
+
+        path = self._path(key, response_format)
+        try:
+            with open(path, 'rb') as f:
+                audio = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.stats.misses += 1
+            return None
+
+        with self._lock:
+            self.stats.disk_hits += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, model: str, voice: str, speed: float, text: str, audio: bytes, response_format: str = 'mp3'):
+        key = cache_key(model, voice, speed, text, response_format)
+        path = self._path(key, response_format)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._remember(key, audio)
+            self.stats.disk_bytes += len(audio) - previous
+            if self.stats.disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.stats = CacheStats()
+            for path, _, _ in self._disk_entries():
+                os.unlink(path)
+
+    # ==================== INTERNALS ====================
+    def _path(self, key: str, response_format: str = 'mp3') -> str:
+        return os.path.join(self.directory, f"{key}.{response_format}")
+
+    def _remember(self, key: str, audio: bytes):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = audio
+        self.stats.memory_bytes += len(audio)
+        while self.stats.memory_bytes > self.memory_max_bytes and len(self._memory) > 1:
+            _, dropped = self._memory.popitem(last=False)
+            self.stats.memory_bytes -= len(dropped)
+
+    def _disk_entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(AUDIO_EXTENSIONS):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _evict_disk(self):
+        # Hits touch the file's mtime, so oldest mtime is least recently used.
+        # Trim to 90% so a full cache doesn't rescan on every put.
+        target = int(self.disk_max_bytes * 0.9)
+        entries = sorted(self._disk_entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            self.stats.evictions += 1
+        self.stats.disk_bytes = total
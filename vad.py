@@ -0,0 +1,182 @@
+"""Streaming voice activity detection and endpointing on 20 ms PCM frames.
+
+``Endpointer`` takes 16-bit mono PCM in pieces of any size and classifies each
+frame as speech or not: WebRTC-VAD when the ``webrtcvad`` package is
+installed, otherwise frame energy against a tracked noise floor. It emits
+'speech_start' once someone has talked for ``min_speech_ms`` and
+'utterance_complete' after ``hangover_ms`` of silence. A completed utterance
+carries its audio from just before speech began to the last voiced frame, so
+the silence around it never reaches Whisper. With ``pause_ms`` set, a shorter
+silence inside an utterance emits 'pause' with the audio so far, once per pause
+(speculation.py starts on it).
+"""
+import math
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, List, Tuple
+
+import numpy as np
+
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+WEBRTC_RATES = (8000, 16000, 32000, 48000)
+WEBRTC_FRAME_MS = (10, 20, 30)
+
+
+@dataclass
+class VADConfig:
+    sample_rate: int = 8000
+    frame_ms: int = 20
+    backend: str = 'auto'  # 'webrtc', 'energy', or 'auto' (WebRTC-VAD when installed)
+    aggressiveness: int = 2  # WebRTC-VAD mode, 0 (keeps most audio) to 3 (strictest)
+    energy_margin_db: float = 10.0  # speech sits at least this far above the noise floor
+    energy_min_dbfs: float = -50.0  # nothing quieter than this counts as speech
+    noise_window_ms: int = 2000  # the noise floor is the quietest frame in this window
+    min_speech_ms: int = 160
+    hangover_ms: int = 500
+    preroll_ms: int = 200
+    max_utterance_ms: int = 30000
+    pause_ms: int = 0  # 0: no 'pause' events
+
+
+@dataclass
+class VADEvent:
+    kind: str  # 'speech_start', 'pause' or 'utterance_complete'
+    at_ms: float  # stream position when the event fired
+    audio: bytes = b''  # utterance PCM (so far, on 'pause')
+    start_ms: float = 0.0  # stream position where ``audio`` begins
+    end_ms: float = 0.0  # stream position where the last voiced frame ends
+
+
+# ==================== FRAME CLASSIFIERS ====================
+class EnergyClassifier:
+    """Speech is a frame well above the noise floor.
+
+    The floor is the quietest frame in a sliding window; gaps between words
+    keep pulling it back down to the line noise, even during long turns.
+    """
+
+    def __init__(self, config: VADConfig):
+        self.margin = config.energy_margin_db
+        self.min_dbfs = config.energy_min_dbfs
+        self.window = max(1, config.noise_window_ms // config.frame_ms)
+        self._levels: Deque[Tuple[int, float]] = deque()  # (frame number, dBFS), ascending dBFS
+        self._frames = 0
+
+    def __call__(self, frame: bytes) -> bool:
+        samples = np.frombuffer(frame, dtype='<i2').astype(np.float32)
+        rms = math.sqrt(float(np.dot(samples, samples)) / max(1, len(samples)))
+        level = 20 * math.log10(max(rms, 1.0) / 32768)
+
+        # Monotonic deque: the front is always the window minimum
+        while self._levels and self._levels[-1][1] >= level:
+            self._levels.pop()
+        self._levels.append((self._frames, level))
+        while self._levels[0][0] <= self._frames - self.window:
+            self._levels.popleft()
+        self._frames += 1
+        return level >= max(self._levels[0][1] + self.margin, self.min_dbfs)
+
+
+def make_classifier(config: VADConfig) -> Tuple[str, Callable[[bytes], bool]]:
+    backend = config.backend
+    if backend == 'auto':
+        usable = config.sample_rate in WEBRTC_RATES and config.frame_ms in WEBRTC_FRAME_MS
+        backend = 'webrtc' if webrtcvad is not None and usable else 'energy'
+    if backend == 'webrtc':
+        if webrtcvad is None:
+            raise RuntimeError("WebRTC-VAD needs the webrtcvad package: pip install webrtcvad")
+        vad = webrtcvad.Vad(config.aggressiveness)
+        return backend, lambda frame: vad.is_speech(frame, config.sample_rate)
+    return 'energy', EnergyClassifier(config)
+
+
+# ==================== ENDPOINTING ====================
+class Endpointer:
+    def __init__(self, config: VADConfig = None):
+        self.config = config or VADConfig()
+        self.backend, self.is_speech = make_classifier(self.config)
+        self.frame_bytes = self.config.sample_rate * self.config.frame_ms // 1000 * 2
+        self.position_ms = 0.0
+        self.in_speech = False
+        self._pending = b''
+        # Holds the min_speech_ms that triggered 'speech_start' plus preroll_ms before it
+        self._preroll: Deque[bytes] = deque(maxlen=(self.config.preroll_ms + self.config.min_speech_ms)
+                                            // self.config.frame_ms)
+        self._frames: List[bytes] = []
+        self._tail: List[bytes] = []
+        self._voiced_ms = 0.0
+        self._silent_ms = 0.0
+        self._start_ms = 0.0
+        self._last_voice_ms = 0.0
+        self._paused = False
+
+    def push(self, pcm: bytes) -> List[VADEvent]:
+        data = self._pending + bytes(pcm) if self._pending else bytes(pcm)
+        whole = len(data) - len(data) % self.frame_bytes
+        self._pending = data[whole:]
+        events = []
+        for offset in range(0, whole, self.frame_bytes):
+            event = self._frame(data[offset:offset + self.frame_bytes])
+            if event is not None:
+                events.append(event)
+        return events
+
+    def flush(self) -> List[VADEvent]:
+        """End of stream: complete an utterance that is still open."""
+        self._pending = b''
+        return [self._complete()] if self.in_speech else []
+
+    def _frame(self, frame: bytes):
+        frame_ms = self.config.frame_ms
+        voiced = self.is_speech(frame)
+        self.position_ms += frame_ms
+
+        if not self.in_speech:
+            self._preroll.append(frame)
+            self._voiced_ms = self._voiced_ms + frame_ms if voiced else 0.0
+            if self._voiced_ms < self.config.min_speech_ms:
+                return None
+            self.in_speech = True
+            self._frames, self._tail = list(self._preroll), []
+            self._preroll.clear()
+            self._start_ms = self.position_ms - len(self._frames) * frame_ms
+            self._last_voice_ms = self.position_ms
+            self._silent_ms = 0.0
+            return VADEvent('speech_start', self.position_ms)
+
+        if voiced:
+            self._frames.extend(self._tail)
+            self._frames.append(frame)
+            self._tail, self._silent_ms = [], 0.0
+            self._last_voice_ms = self.position_ms
+            self._paused = False
+        else:
+            self._tail.append(frame)
+            self._silent_ms += frame_ms
+        if (self._silent_ms >= self.config.hangover_ms
+                or self.position_ms - self._start_ms >= self.config.max_utterance_ms):
+            return self._complete()
+        if self.config.pause_ms and not self._paused and self._silent_ms >= self.config.pause_ms:
+            self._paused = True
+            return VADEvent('pause', self.position_ms, b''.join(self._frames), self._start_ms, self._last_voice_ms)
+        return None
+
+    def _complete(self) -> VADEvent:
+        event = VADEvent('utterance_complete', self.position_ms, b''.join(self._frames),
+                         self._start_ms, self._last_voice_ms)
+        self.in_speech = False
+        self._paused = False
+        self._voiced_ms = 0.0
+        self._frames, self._tail = [], []
+        return event
+
+
+def speech_segments(pcm: bytes, config: VADConfig = None) -> List[Tuple[float, float]]:
+    """(start_ms, end_ms) of every utterance in a whole recording."""
+    endpointer = Endpointer(config)
+    events = endpointer.push(pcm) + endpointer.flush()
+    return [(e.start_ms, e.end_ms) for e in events if e.kind == 'utterance_complete']
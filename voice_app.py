@@ -1,9 +1,25 @@
 import streamlit as st
-from openai import OpenAI
-import tempfile
-import os
 from datetime import datetime
-import json
+import os
+import tempfile
+import threading
+
+from answer_cache import AnswerCache
+from archive import AudioArchive
+from backends import MODEL_POOL, available_backends
+from call_processor import CallConfig, CallProcessor, CallResult, background_loop, run_sync
+from call_store import CallStore
+from clients import get_client, pool_stats, scheduler_stats
+from export import FORMATS as EXPORT_FORMATS, available_formats, export_calls
+from intents import IntentClassifier
+from jobs import STAGES as JOB_STAGES, JobQueue, JobRunner
+from metrics import METRICS, STAGES, serve_metrics, span
+from paths import data_dir
+from phrases import PhraseBank
+from preprocess import PreprocessConfig
+from replays import ReplayStore, identify
+from sessions import SessionStore
+from tts_cache import TTSCache
 
 # ==================== PAGE CONFIG ====================
 st.set_page_config(
@@ -13,9 +29,6 @@ st.set_page_config(
 )
 
 # ==================== SESSION STATE ====================
-if 'call_history' not in st.session_state:
-    st.session_state.call_history = []
-
 if 'api_key' not in st.session_state:
     st.session_state.api_key = ''
 
@@ -28,6 +41,259 @@ if 'business_hours' not in st.session_state:
 if 'phone_number' not in st.session_state:
     st.session_state.phone_number = '+1234567890'
 
+if 'voice' not in st.session_state:
+    st.session_state.voice = 'Nova (Warm Female)'
+
+# ==================== CALL PROCESSING ====================
+HISTORY_PAGE_SIZE = 20
+
+VOICE_OPTIONS = {
+    'Alloy (Neutral)': 'alloy',
+    'Echo (Deep Male)': 'echo',
+    'Fable (British)': 'fable',
+    'Onyx (Strong Male)': 'onyx',
+    'Nova (Warm Female)': 'nova',
+    'Shimmer (Soft Female)': 'shimmer'
+}
+
+
+@st.cache_resource(show_spinner=False)
+def get_tts_cache():
+    return TTSCache()
+
+
+@st.cache_resource(show_spinner=False)
+def get_call_store():
+    return CallStore()
+
+
+@st.cache_resource(show_spinner=False)
+def get_answer_cache():
+    return AnswerCache()
+
+
+@st.cache_resource(show_spinner=False)
+def get_phrase_bank():
+    return PhraseBank()
+
+
+@st.cache_resource(show_spinner=False)
+def get_replay_store():
+    return ReplayStore()
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_store():
+    return SessionStore()
+
+
+@st.cache_resource(show_spinner=False)
+def get_audio_archive():
+    archive = AudioArchive()
+    # Retention and compaction run once per server start, off the page's thread
+    threading.Thread(target=archive.maintain, name='archive-maintenance', daemon=True).start()
+    return archive
+
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_server():
+    # Prometheus scrapes this process on its own port; Streamlit can't add routes
+    port = os.environ.get('VOICE_METRICS_PORT')
+    return serve_metrics(int(port)) if port else None
+
+
+start_metrics_server()
+
+
+@st.cache_resource(show_spinner=False)
+def _processor_for_key(api_key):
+    # Shared by every session using this key, so its connection pool stays warm
+    return CallProcessor(
+        get_client(api_key),
+        tts_cache=get_tts_cache(),
+        answer_cache=get_answer_cache(),
+        intents=IntentClassifier(),
+        preprocess_config=PreprocessConfig(),
+        phrases=get_phrase_bank(),
+        replays=get_replay_store(),
+        sessions=get_session_store()
+    )
+
+
+def get_processor():
+    return _processor_for_key(st.session_state.api_key)
+
+
+@st.cache_resource(show_spinner=False)
+def get_job_queue():
+    return JobQueue()
+
+
+@st.cache_resource(show_spinner=False)
+def _job_runner_slot():
+    # The server's one set of call workers and the key they answer for
+    return {'lock': threading.Lock(), 'key': None, 'runner': None}
+
+
+def _start_job_runner(api_key):
+    # Worker processes answer this key's calls (jobs.py); they carry on when a tab closes or
+    # reruns, and pick up calls an earlier server left unfinished
+    processor = _processor_for_key(api_key)
+    sessions = get_session_store()
+
+    def finished(job):
+        # Conversations live in this process (sessions.py); the worker only answered the turn
+        if job.state == 'done' and job.config.caller:
+            background_loop().call_soon_threadsafe(sessions.record, processor.client, job.config.tenant,
+                                                   job.config.caller, job.transcript, job.answer,
+                                                   job.config.chat_model)
+
+    return JobRunner(get_job_queue(), api_key, on_done=finished).start()
+
+
+def get_job_runner():
+    api_key = st.session_state.api_key
+    slot = _job_runner_slot()
+    with slot['lock']:
+        if slot['key'] != api_key:
+            if slot['runner'] is not None:
+                # A new key (or a mistyped one corrected) replaces the workers rather than adding to them;
+                # the old key's unfinished calls resume when it is used again
+                slot['runner'].stop()
+                slot['runner'] = slot['key'] = None
+            slot['runner'], slot['key'] = _start_job_runner(api_key), api_key
+        return slot['runner']
+
+
+def prepare_phrases():
+    # The greeting, fillers and closing for the current settings render in the background (phrases.py),
+    # into the speech cache on disk the call workers render theirs from
+    if st.session_state.api_key:
+        get_processor().prepare_phrases(current_call_config(), loop=background_loop())
+
+
+def show_replay(replay, audio_file):
+    # The same recording was answered before with these settings; play that answer back for free
+    st.markdown("### 📝 Customer Message (Transcribed):")
+    st.success(f"**Customer said:** {replay.customer_message}")
+    st.markdown("---")
+    st.markdown("### 🤖 AI Response (Text):")
+    st.info(replay.ai_response)
+    st.markdown("### 🔊 AI Voice Response:")
+    st.audio(replay.audio, format='audio/mp3', autoplay=True)
+    st.caption(f"🔁 Replay: this recording was answered at {replay.timestamp}, so nothing was sent to OpenAI")
+    result = CallResult(customer_message=replay.customer_message, ai_response=replay.ai_response,
+                        audio=replay.audio, replay=True,
+                        audio_ref=get_audio_archive().put(audio_file.getbuffer(), replay.audio, audio_file.name))
+    st.markdown("---")
+    st.download_button(
+        "📥 Download AI Response (MP3)",
+        result.audio,
+        file_name=f"ai_response_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp3",
+        mime="audio/mp3",
+        use_container_width=True
+    )
+    get_call_store().add(result.to_record())
+    st.success("✅ Call replayed from history!")
+
+
+JOB_ERRORS = {
+    'RateLimitError': ("❌ OpenAI is rate-limiting this API key right now, even after several retries.",
+                       "Wait a minute and try again, or raise your account's rate limits."),
+    'AuthenticationError': ("❌ OpenAI rejected the API key.", "Please check your API key in the sidebar."),
+    'APIConnectionError': ("❌ Could not reach OpenAI.", "Please check your internet connection and try again."),
+    'NoSpeechError': ("❌ No speech was found in the recording.", "Please upload a recording of the customer speaking."),
+}
+
+
+@st.fragment(run_every=1)
+def job_progress(job_id):
+    # Polls the job's checkpoints; once it has finished, a full rerun shows the result and stops the polling
+    job = get_job_queue().get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    done = JOB_STAGES.index(job.stage) + 1 if job.stage else 0
+    labels = ["🎧 AI is listening to the customer...", "🤖 AI is answering...", "💾 Saving the call..."]
+    st.progress(done / (len(JOB_STAGES) + 1), text=labels[done] if job.state == 'running' else "⏳ Waiting for a worker...")
+    if job.transcript:
+        st.success(f"**Customer said:** {job.transcript}")
+    # The reply's sentences appear as the worker voices them; the first plays on its own
+    chunks = get_job_queue().chunks(job_id)
+    if chunks:
+        st.info(" ".join(text for _, text, _ in chunks))
+        for idx, _, audio in chunks:
+            st.audio(audio, format='audio/mp3', autoplay=idx == 0)
+        st.session_state.played_job = job_id  # so the finished call doesn't play the reply over again
+    if job.attempts > 1:
+        st.caption(f"♻️ Resumed after an interruption (attempt {job.attempts}); finished steps weren't repeated")
+    st.caption("You can leave this page: the call keeps going and is saved to Call History when it is answered.")
+
+
+def show_job(job):
+    if job.state == 'failed':
+        message, hint = JOB_ERRORS.get(job.error_type, (f"❌ Error: {job.error}",
+                                                        "Please check your API key and ensure you have credits available."))
+        st.error(message)
+        st.info(hint)
+        return
+    report = job.report
+    st.markdown("### 📝 Customer Message (Transcribed):")
+    st.success(f"**Customer said:** {job.transcript}")
+    if report.get('transcript_replayed'):
+        st.caption("🔁 Transcript reused from an earlier upload of this recording")
+    elif report.get('upload_bytes_saved', 0) > 0:
+        st.caption(
+            f"🗜️ Upload {report['upload_bytes'] / 1024:.0f} KB sent "
+            f"({report['upload_bytes_saved'] / 1024:.0f} KB saved, {report['silence_trimmed']:.1f}s silence trimmed, "
+            f"{report['stt_chunks']} chunk(s), STT {report['stt']:.1f}s, "
+            f"{report['stt_parallel_saved']:.1f}s saved in parallel)"
+        )
+    st.markdown("---")
+    st.markdown("### 🤖 AI Response (Text):")
+    if job.history:
+        st.caption(f"🧵 Continued the conversation with {job.config.caller}")
+    st.info(job.answer)
+    st.markdown("### 🔊 AI Voice Response:")
+    # Autoplay once, unless it already played while streaming; later reruns show it without playing it again
+    st.audio(job.reply, format='audio/mp3', autoplay=st.session_state.get('played_job') != job.id)
+    st.session_state.played_job = job.id
+    if job.source == 'answer_cache':
+        st.caption("⚡ Answered from cache — matched an earlier question")
+    elif job.source == 'fast_path':
+        st.caption("⚡ Answered instantly from your business info")
+    if job.attempts > 1:
+        st.caption(f"♻️ Resumed after an interruption: took {job.attempts} attempts, finished steps weren't repeated")
+    if report.get('cost'):
+        st.caption(f"💰 This call: ${report['cost']:.4f} · {report.get('tokens', 0)} tokens · "
+                   f"answered in {job.updated - job.created:.1f}s")
+    st.markdown("---")
+    st.download_button(
+        "📥 Download AI Response (MP3)",
+        job.reply,
+        file_name=f"ai_response_{datetime.fromtimestamp(job.created).strftime('%Y%m%d_%H%M%S')}.mp3",
+        mime="audio/mp3",
+        use_container_width=True
+    )
+    st.success("✅ Call processed successfully!")
+
+
+def current_call_config():
+    return CallConfig(
+        business_name=st.session_state.business_name,
+        phone_number=st.session_state.phone_number,
+        business_hours=st.session_state.business_hours,
+        voice=VOICE_OPTIONS[st.session_state.voice],
+        # Advanced Settings; its widgets keep these in session state once they have rendered
+        speed=st.session_state.get('audio_speed', 1.0),
+        response_style=st.session_state.get('response_style', 'Professional'),
+        response_length=st.session_state.get('response_length', 'Medium'),
+        include_callback=st.session_state.get('include_callback', True),
+        include_hours=st.session_state.get('include_hours', True),
+        stt_backend=st.session_state.get('stt_backend', 'openai'),
+        tts_backend=st.session_state.get('tts_backend', 'openai'),
+        caller=st.session_state.get('caller', '').strip()
+    )
+
 # ==================== CSS ====================
 st.markdown("""
 <style>
@@ -118,10 +384,11 @@ st.markdown('<h1 class="main-header">📞 AI Voice Answering System</h1>', unsaf
 st.markdown('<p class="sub-header">Professional AI-Powered Phone Assistant</p>', unsafe_allow_html=True)
 
 # ==================== SIDEBAR ====================
-with st.sidebar:
-    st.markdown("## ⚙️ System Settings")
-    
-    st.markdown("---")
+@st.fragment
+def business_settings():
+    # Edits here rerun only this fragment, then the whole app if what changed is
+    # shown elsewhere on the page; each of these is, in System Info
+    rerun_app = False
     
     # Business Settings
     st.markdown("### 🏢 Business Info")
@@ -133,6 +400,7 @@ with st.sidebar:
     )
     if business_name != st.session_state.business_name:
         st.session_state.business_name = business_name
+        rerun_app = True
     
     phone_number = st.text_input(
         "Phone Number",
@@ -141,6 +409,7 @@ with st.sidebar:
     )
     if phone_number != st.session_state.phone_number:
         st.session_state.phone_number = phone_number
+        rerun_app = True
     
     business_hours = st.text_area(
         "Business Hours",
@@ -149,6 +418,7 @@ with st.sidebar:
     )
     if business_hours != st.session_state.business_hours:
         st.session_state.business_hours = business_hours
+        rerun_app = True
     
     st.markdown("---")
     
@@ -163,6 +433,7 @@ with st.sidebar:
     )
     if api_key != st.session_state.api_key:
         st.session_state.api_key = api_key
+        rerun_app = True
     
     if st.session_state.api_key:
         st.success("✅ API Key Set")
@@ -176,34 +447,43 @@ with st.sidebar:
     # Voice Settings
     st.markdown("### 🎙️ Voice Settings")
     
-    voice_options = {
-        'Alloy (Neutral)': 'alloy',
-        'Echo (Deep Male)': 'echo',
-        'Fable (British)': 'fable',
-        'Onyx (Strong Male)': 'onyx',
-        'Nova (Warm Female)': 'nova',
-        'Shimmer (Soft Female)': 'shimmer'
-    }
-    
     selected_voice = st.selectbox(
         "AI Voice",
-        options=list(voice_options.keys()),
-        index=4
+        options=list(VOICE_OPTIONS.keys()),
+        index=list(VOICE_OPTIONS).index(st.session_state.voice)
     )
+    if selected_voice != st.session_state.voice:
+        st.session_state.voice = selected_voice
+        rerun_app = True
+    
+    if rerun_app:
+        st.rerun()
+    prepare_phrases()
+
+
+total_calls = get_call_store().count()
+
+with st.sidebar:
+    st.markdown("## ⚙️ System Settings")
+    
+    st.markdown("---")
     
-    ai_voice = voice_options[selected_voice]
+    business_settings()
     
     st.markdown("---")
     
     # Stats
     st.markdown("### 📊 Statistics")
-    st.metric("Total Calls", len(st.session_state.call_history))
+    st.metric("Total Calls", total_calls)
     
     st.markdown("---")
     
     # Clear History
     if st.button("🗑️ Clear Call History", use_container_width=True):
-        st.session_state.call_history = []
+        get_call_store().clear()
+        get_replay_store().clear()
+        get_job_queue().clear()
+        get_audio_archive().clear()
         st.success("Cleared!")
         st.rerun()
 
@@ -249,6 +529,7 @@ with tab1:
         """)
     
     else:
+        get_job_runner()  # starts the call workers, which resume any calls left unfinished
         col1, col2 = st.columns([2, 1])
         
         with col1:
@@ -279,6 +560,13 @@ with tab1:
                 type=['mp3', 'wav', 'm4a', 'webm', 'ogg'],
                 help="Upload a voice recording from the customer"
             )
+            st.text_input(
+                "📱 Caller's number (optional)",
+                key='caller',
+                placeholder="e.g. +15551234567",
+                help=f"Messages from the same number within {get_session_store().settings.idle_seconds / 60:.0f} "
+                     "minutes continue one conversation"
+            )
             
             if audio_file:
                 st.success(f"✅ Audio file uploaded: {audio_file.name}")
@@ -291,130 +579,33 @@ with tab1:
                 
                 # Process Button
                 if st.button("📞 Process Call & Generate AI Response", type="primary", use_container_width=True):
-                    
-                    with st.spinner("🎧 AI is listening to the customer..."):
-                        try:
-                            client = OpenAI(api_key=st.session_state.api_key)
-                            
-                            # Save temporarily
-                            with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{audio_file.name.split(".")[-1]}') as tmp:
-                                tmp.write(audio_file.read())
-                                tmp_path = tmp.name
-                            
-                            # Speech-to-Text
-                            with open(tmp_path, 'rb') as audio:
-                                transcript = client.audio.transcriptions.create(
-                                    model="whisper-1",
-                                    file=audio,
-                                    response_format="text"
-                                )
-                            
-                            customer_message = transcript if isinstance(transcript, str) else transcript.text
-                            
-                            os.unlink(tmp_path)
-                            
-                            # Display what customer said
-                            st.markdown("### 📝 Customer Message (Transcribed):")
-                            st.success(f"**Customer said:** {customer_message}")
-                            
-                            st.markdown("---")
-                            
-                            # Generate AI Response
-                            with st.spinner("🤖 AI is generating response..."):
-                                
-                                system_prompt = f"""You are a professional phone answering assistant for {st.session_state.business_name}.
-
-Phone Number: {st.session_state.phone_number}
-Business Hours: {st.session_state.business_hours}
-
-Your role:
-- Answer customer questions professionally
-- Provide business information clearly
-- Be friendly and helpful
-- Keep responses concise (under 100 words)
-- If asked about hours, services, location, or contact - provide the information
-- If you don't know something, politely say you'll have someone call them back
-
-Always:
-- Greet the customer warmly
-- Speak naturally as if on a phone call
-- End with a friendly closing
-- Mention the phone number if they need to call back
-
-Example response style:
-"Hello! Thank you for calling {st.session_state.business_name}. [Answer their question]. Is there anything else I can help you with today? Feel free to call us at {st.session_state.phone_number}. Have a great day!"
-"""
-                                
-                                messages = [
-                                    {"role": "system", "content": system_prompt},
-                                    {"role": "user", "content": customer_message}
-                                ]
-                                
-                                response = client.chat.completions.create(
-                                    model="gpt-4o",
-                                    messages=messages,
-                                    temperature=0.7,
-                                    max_tokens=300
-                                )
-                                
-                                ai_response = response.choices[0].message.content
-                                
-                                # Display AI Response
-                                st.markdown("### 🤖 AI Response (Text):")
-                                st.info(ai_response)
-                                
-                                st.markdown("---")
-                            
-                            # Text-to-Speech
-                            with st.spinner("🔊 Converting to voice..."):
-                                
-                                speech = client.audio.speech.create(
-                                    model="tts-1",
-                                    voice=ai_voice,
-                                    input=ai_response,
-                                    speed=1.0
-                                )
-                                
-                                # Save audio
-                                with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as audio_tmp:
-                                    speech.stream_to_file(audio_tmp.name)
-                                    audio_response_path = audio_tmp.name
-                                
-                                # Play AI Voice Response
-                                st.markdown("### 🔊 AI Voice Response:")
-                                
-                                with open(audio_response_path, 'rb') as audio_play:
-                                    st.audio(audio_play, format='audio/mp3', autoplay=True)
-                                
-                                # Download option
-                                with open(audio_response_path, 'rb') as audio_download:
-                                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                                    st.download_button(
-                                        "📥 Download AI Response (MP3)",
-                                        audio_download,
-                                        file_name=f"ai_response_{timestamp}.mp3",
-                                        mime="audio/mp3",
-                                        use_container_width=True
-                                    )
-                                
-                                # Save to call history
-                                call_record = {
-                                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                                    'customer_message': customer_message,
-                                    'ai_response': ai_response,
-                                    'duration': 'N/A'
-                                }
-                                
-                                st.session_state.call_history.insert(0, call_record)
-                                
-                                # Clean up
-                                os.unlink(audio_response_path)
-                                
-                                st.success("✅ Call processed successfully!")
-                        
-                        except Exception as e:
-                            st.error(f"❌ Error: {str(e)}")
-                            st.info("Please check your API key and ensure you have credits available.")
+                    try:
+                        processor = get_processor()
+                        config = current_call_config()
+                        upload = identify(audio_file.getbuffer(), audio_file.name)
+                        replay_key = processor.replay_key(config)
+                        replay = get_replay_store().result(upload, replay_key)
+                        if replay is not None:
+                            st.session_state.job_id = None
+                            with span('render'):
+                                show_replay(replay, audio_file)
+                        else:
+                            history = get_session_store().history(config.tenant, config.caller, config.chat_model) \
+                                if config.caller else []
+                            # A double click, or another tab sending the same recording, gets the job already queued
+                            st.session_state.job_id = get_job_runner().submit(
+                                audio_file.getvalue(), audio_file.name, config, upload=upload, replay_key=replay_key,
+                                history=history
+                            )
+                    except Exception as e:
+                        st.error(f"❌ Error: {str(e)}")
+                
+                job = get_job_queue().get(st.session_state.job_id) if st.session_state.get('job_id') else None
+                if job is not None and job.finished:
+                    with span('render'):
+                        show_job(job)
+                elif job is not None:
+                    job_progress(job.id)
             
             else:
                 st.info("👆 Upload an audio file to simulate an incoming call")
@@ -469,67 +660,124 @@ Example response style:
             st.markdown("---")
             
             st.markdown("### 🎙️ Current Voice")
-            st.success(f"**Using:** {selected_voice}")
+            st.success(f"**Using:** {st.session_state.voice}")
             
             # Test voice
             if st.button("🔊 Test Voice", use_container_width=True):
                 try:
-                    client = OpenAI(api_key=st.session_state.api_key)
-                    
                     test_text = f"Hello! Thank you for calling {st.session_state.business_name}. How may I help you today?"
                     
                     with st.spinner("Generating..."):
-                        speech = client.audio.speech.create(
-                            model="tts-1",
-                            voice=ai_voice,
-                            input=test_text
-                        )
-                        
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp:
-                            speech.stream_to_file(tmp.name)
-                            with open(tmp.name, 'rb') as audio:
-                                st.audio(audio, format='audio/mp3')
-                            os.unlink(tmp.name)
+                        test_audio = run_sync(get_processor().synthesize(test_text, current_call_config()))
+                        st.audio(test_audio, format='audio/mp3')
                 except:
                     st.error("Could not generate test")
 
 # ==================== TAB 2: CALL HISTORY ====================
-with tab2:
-    st.markdown("## 📋 Call History")
+def play_recording(audio_ref):
+    # Archived calls play straight from the mapped segment (archive.py); voicemail replies are files of their own
+    recording = get_audio_archive().recording(audio_ref)
+    if recording is not None:
+        if recording.caller is not None:
+            st.markdown("**📥 Customer's Voice Message:**")
+            st.audio(recording.caller.reader(), format=recording.caller.mime)
+        if recording.response is not None:
+            st.markdown("**🔊 AI Voice Response:**")
+            st.audio(recording.response.reader(), format=recording.response.mime)
+    elif os.path.isfile(audio_ref):
+        st.audio(audio_ref)
+    else:
+        st.caption("The recording of this call is no longer kept.")
+
+
+@st.fragment
+def call_history():
+    # Loaded on request; searching, paging and exporting rerun only this fragment
+    call_store = get_call_store()
+    total_calls = call_store.count()
     
-    if st.session_state.call_history:
-        st.info(f"📞 Total Calls: {len(st.session_state.call_history)}")
-        
-        st.markdown("---")
-        
-        for i, call in enumerate(st.session_state.call_history):
-            with st.expander(f"📞 Call #{len(st.session_state.call_history) - i} - {call['timestamp']}"):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.markdown("**🎤 Customer Message:**")
-                    st.write(call['customer_message'])
-                
-                with col2:
-                    st.markdown("**🤖 AI Response:**")
-                    st.write(call['ai_response'])
-                
-                st.markdown(f"**⏱️ Time:** {call['timestamp']}")
-        
-        st.markdown("---")
+    if not total_calls:
+        st.info("📭 No calls yet. Process a call in the Voice Calls tab to see history here.")
+        return
+    
+    st.info(f"📞 Total Calls: {total_calls}")
+    
+    if not st.toggle("Show call history", key='show_history'):
+        return
+    
+    history_query = st.text_input("🔍 Search calls", placeholder="e.g. refund, weekend, appointment")
+    matching = call_store.search_count(history_query) if history_query else total_calls
+    page_count = max(1, -(-matching // HISTORY_PAGE_SIZE))
+    
+    page_number = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, step=1)
+    if history_query:
+        calls = call_store.search(history_query, limit=HISTORY_PAGE_SIZE, offset=(page_number - 1) * HISTORY_PAGE_SIZE)
+        st.caption(f"{matching} matching call(s)")
+    else:
+        calls = call_store.page(page_number - 1, HISTORY_PAGE_SIZE)
+    
+    st.markdown("---")
+    
+    for call in calls:
+        replayed = " · 🔁 replay" if call.get('replay') else ""
+        with st.expander(f"📞 Call #{call['id']} - {call['timestamp']}{replayed}"):
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.markdown("**🎤 Customer Message:**")
+                st.write(call['customer_message'])
+            
+            with col2:
+                st.markdown("**🤖 AI Response:**")
+                st.write(call['ai_response'])
+            
+            st.markdown(f"**⏱️ Time:** {call['timestamp']}")
+            if call.get('audio_ref') and st.toggle("🔊 Play recording", key=f"play_{call['id']}"):
+                play_recording(call['audio_ref'])
+    
+    st.markdown("---")
+    
+    # Export History
+    st.markdown("#### 📥 Export Call History")
+    
+    export_col1, export_col2 = st.columns(2)
+    
+    with export_col1:
+        export_format = st.selectbox(
+            "Format",
+            available_formats(),
+            format_func=lambda fmt: EXPORT_FORMATS[fmt][0]
+        )
+        include_audio = st.checkbox("Include audio references", value=False)
+    
+    with export_col2:
+        export_range = st.date_input("Date range (optional)", value=(), help="Leave empty to export every call")
+    
+    if st.button("📥 Export Call History", use_container_width=True):
+        export_start = export_range[0] if len(export_range) > 0 else None
+        export_end = export_range[1] if len(export_range) > 1 else export_start
+        export_name = f"call_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
         
-        # Export History
-        if st.button("📥 Export Call History (JSON)", use_container_width=True):
-            history_json = json.dumps(st.session_state.call_history, indent=2)
+        # Streamed to disk chunk by chunk, then read by the download button; the file is deleted when it closes
+        with tempfile.TemporaryFile(dir=data_dir('exports')) as export_file:
+            with st.spinner("Exporting..."):
+                exported = export_calls(
+                    call_store, export_format, export_file,
+                    start=export_start, end=export_end, include_audio=include_audio
+                )
+            export_file.seek(0)
             st.download_button(
-                "Download JSON",
-                history_json,
-                file_name=f"call_history_{datetime.now().strftime('%Y%m%d')}.json",
-                mime="application/json"
+                f"Download {exported} calls ({EXPORT_FORMATS[export_format][0]})",
+                export_file.read(),
+                file_name=export_name,
+                mime=EXPORT_FORMATS[export_format][1]
             )
+
+
+with tab2:
+    st.markdown("## 📋 Call History")
     
-    else:
-        st.info("📭 No calls yet. Process a call in the Voice Calls tab to see history here.")
+    call_history()
 
 # ==================== TAB 3: INSTRUCTIONS ====================
 with tab3:
@@ -592,11 +840,13 @@ with tab3:
     st.markdown("---")
     
     st.markdown("""
-    ### 🔗 Integration Options (Future)
+    ### 🔗 Integration Options
+    
+    **Live phone calls:** run `python telephony.py` and point a Twilio number's
+    voice webhook (HTTP GET) at `/twiml`. Calls are answered in real time with the
+    business details given on its command line, and callers can interrupt the assistant.
     
     **Coming Soon:**
-    - Direct phone number integration via Twilio
-    - Real-time call handling
     - Automatic call recording
     - SMS notifications
     - Call analytics dashboard
@@ -604,64 +854,184 @@ with tab3:
     """)
 
 # ==================== TAB 4: ADVANCED SETTINGS ====================
+@st.fragment(run_every=2)
+def latency_panel():
+    # Reruns on its own every 2 s, without rerunning the page
+    stages = METRICS.snapshot()['stages']
+    rows = [{
+        "Stage": stage,
+        "Count": stages[stage]['count'],
+        "p50 (ms)": round(stages[stage]['p50'] * 1000),
+        "p95 (ms)": round(stages[stage]['p95'] * 1000),
+    } for stage in STAGES if stage in stages]
+    if rows:
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+        if 'first_audio' in stages and 'first_answer_audio' in stages:
+            masked = stages['first_answer_audio']['p50'] - stages['first_audio']['p50']
+            st.caption(f"🔈 Callers hear a reply {stages['first_audio']['p50'] * 1000:.0f} ms after they are "
+                       f"transcribed (p50); a recorded greeting or filler covers {masked * 1000:.0f} ms "
+                       f"of the wait for the answer.")
+    else:
+        st.caption("No calls yet: stage timings appear here as calls are processed.")
+
+
+@st.fragment
+def ai_behavior():
+    # Kept in session state under each widget's key; changes rerun only this fragment
+    st.markdown("### 🤖 AI Behavior")
+    
+    st.selectbox(
+        "Response Style",
+        ["Professional", "Friendly", "Casual", "Formal"],
+        key='response_style'
+    )
+    
+    st.select_slider(
+        "Response Length",
+        options=["Very Short", "Short", "Medium", "Long"],
+        value="Medium",
+        key='response_length'
+    )
+    
+    st.checkbox("Include callback offer in responses", value=True, key='include_callback')
+    
+    st.checkbox("Always mention business hours", value=True, key='include_hours')
+    
+    st.markdown("---")
+    
+    st.markdown("### 🎙️ Voice Quality")
+    
+    audio_speed = st.slider(
+        "Speech Speed",
+        min_value=0.5,
+        max_value=2.0,
+        value=1.0,
+        step=0.1,
+        key='audio_speed'
+    )
+    
+    st.info(f"Current speed: {audio_speed}x")
+    
+    st.markdown("---")
+    
+    st.markdown("### 🖥️ Speech Engines")
+    
+    engines = available_backends()
+    st.selectbox("Transcription", engines['stt'], key='stt_backend',
+                 help="openai sends audio to Whisper; local engines run on this machine's CPU")
+    st.selectbox("Speech", engines['tts'], key='tts_backend',
+                 help="openai uses the selected AI voice; a local engine speaks with its own voice")
+    if len(engines['stt']) + len(engines['tts']) == 2:
+        st.caption("Install faster-whisper or piper-tts to transcribe or speak without the network.")
+    loaded = MODEL_POOL.loaded()
+    if loaded:
+        st.caption("Loaded: " + ", ".join(f"{model} ({seconds:.1f}s)" for model, seconds in loaded.items()))
+    
+    prepare_phrases()
+
+
+def system_info(total_calls: int):
+    # Drawn with the page; sidebar edits to what it shows rerun the whole app
+    st.markdown(f"""
+    **Business Name:** {st.session_state.business_name}
+    
+    **Phone Number:** {st.session_state.phone_number}
+    
+    **Hours:** {st.session_state.business_hours}
+    
+    **AI Voice:** {st.session_state.voice}
+    
+    **API Status:** {"✅ Active" if st.session_state.api_key else "❌ Inactive"}
+    
+    **Total Calls:** {total_calls}
+    """)
+
+
 with tab4:
     st.markdown("## ⚙️ Advanced Configuration")
     
     col1, col2 = st.columns(2)
     
     with col1:
-        st.markdown("### 🤖 AI Behavior")
-        
-        response_style = st.selectbox(
-            "Response Style",
-            ["Professional", "Friendly", "Casual", "Formal"]
-        )
-        
-        response_length = st.select_slider(
-            "Response Length",
-            options=["Very Short", "Short", "Medium", "Long"],
-            value="Medium"
-        )
-        
-        include_callback = st.checkbox("Include callback offer in responses", value=True)
-        
-        include_hours = st.checkbox("Always mention business hours", value=True)
-        
-        st.markdown("---")
-        
-        st.markdown("### 🎙️ Voice Quality")
-        
-        audio_speed = st.slider(
-            "Speech Speed",
-            min_value=0.5,
-            max_value=2.0,
-            value=1.0,
-            step=0.1
-        )
-        
-        st.info(f"Current speed: {audio_speed}x")
+        ai_behavior()
     
     with col2:
         st.markdown("### 📊 System Info")
+        system_info(total_calls)
         
-        st.markdown(f"""
-        **Business Name:** {st.session_state.business_name}
+        st.markdown("---")
+        
+        if st.session_state.api_key:
+            st.markdown("### 🔌 Connection Pool")
+            stats = pool_stats(get_processor().client)
+            pool_col1, pool_col2, pool_col3 = st.columns(3)
+            pool_col1.metric("Open", stats.get('open', 0))
+            pool_col2.metric("Reused", stats.get('reused', 0))
+            pool_col3.metric("Waiting", stats.get('waiting', 0))
+            st.caption(f"HTTP/2: {'on' if stats.get('http2') else 'off'} · Requests: {stats.get('requests', 0)}")
+            for endpoint, limits in scheduler_stats(get_processor().client).items():
+                if limits['requests']:
+                    st.caption(f"{endpoint.title()}: concurrency limit {limits['limit']} · {limits['retries']} retries · "
+                               f"{limits['throttled']} rate-limited · {limits['hedges']} hedged")
+            
+            st.markdown("---")
         
-        **Phone Number:** {st.session_state.phone_number}
+        st.markdown("### 🗂️ Voice Cache")
+        tts_stats = get_tts_cache().stats
+        cache_col1, cache_col2, cache_col3 = st.columns(3)
+        cache_col1.metric("Hits", tts_stats.hits)
+        cache_col2.metric("Misses", tts_stats.misses)
+        cache_col3.metric("Hit Rate", f"{tts_stats.hit_rate:.0%}")
+        st.caption(f"Memory: {tts_stats.memory_bytes / 1e6:.1f} MB · Disk: {tts_stats.disk_bytes / 1e6:.1f} MB · Evictions: {tts_stats.evictions}")
         
-        **Hours:** {st.session_state.business_hours}
+        st.markdown("---")
         
-        **AI Voice:** {selected_voice}
+        if st.session_state.api_key:
+            st.markdown("### 🚦 Response Routing")
+            routes = get_processor().route_stats
+            fast_latency = routes.mean_latency('fast_path')
+            llm_latency = routes.mean_latency('llm')
+            route_col1, route_col2, route_col3 = st.columns(3)
+            route_col1.metric("Fast Path", f"{routes.share('fast_path'):.0%}")
+            route_col2.metric("Fast Path Latency", f"{fast_latency * 1000:.0f} ms" if fast_latency is not None else "—")
+            route_col3.metric("LLM Latency", f"{llm_latency * 1000:.0f} ms" if llm_latency is not None else "—")
+            
+            st.markdown("---")
         
-        **API Status:** {"✅ Active" if st.session_state.api_key else "❌ Inactive"}
+        st.markdown("### ⏱️ Live Latency")
+        latency_panel()
         
-        **Total Calls:** {len(st.session_state.call_history)}
-        """)
+        st.markdown("---")
         
+        st.markdown("### 💬 Answer Cache")
+        answer_stats = get_answer_cache().stats
+        answer_col1, answer_col2, answer_col3 = st.columns(3)
+        answer_col1.metric("Hits", answer_stats.hits)
+        answer_col2.metric("Misses", answer_stats.misses)
+        answer_col3.metric("Hit Rate", f"{answer_stats.hit_rate:.0%}")
+        st.caption(f"Stored answers: {len(get_answer_cache())}")
+
+        st.markdown("---")
+
+        st.markdown("### 🔁 Repeat Uploads")
+        replay_stats = get_replay_store().stats
+        replay_col1, replay_col2 = st.columns(2)
+        replay_col1.metric("Replayed Calls", replay_stats.result_hits)
+        replay_col2.metric("Reused Transcripts", replay_stats.transcript_hits)
+        st.caption(f"Kept for {get_replay_store().settings.ttl / 3600:.0f} h (VOICE_REPLAY_TTL) · Expired: {replay_stats.expired}")
+
         st.markdown("---")
         
         st.markdown("### 💰 API Usage")
         
+        usage_stats = METRICS.snapshot()
+        if usage_stats['calls']:
+            usage_col1, usage_col2, usage_col3 = st.columns(3)
+            usage_col1.metric("Cost per Call", f"${usage_stats['cost_per_call']:.4f}")
+            usage_col2.metric("Total Cost", f"${usage_stats['cost']:.2f}")
+            usage_col3.metric("Tokens", f"{usage_stats['tokens']:,}")
+            st.caption(f"Measured from API usage over {usage_stats['calls']} call(s) since the app started, at list prices")
+        
         st.info("""
         **Estimated Cost per Call:**
         - Speech-to-Text: ~$0.01
@@ -682,7 +1052,10 @@ with tab4:
     
     with col_danger1:
         if st.button("🗑️ Clear All Call History", type="secondary", use_container_width=True):
-            st.session_state.call_history = []
+            get_call_store().clear()
+            get_replay_store().clear()
+            get_job_queue().clear()
+            get_audio_archive().clear()
             st.success("History cleared!")
             st.rerun()
     
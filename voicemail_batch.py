@@ -0,0 +1,361 @@
+"""Answer a whole folder of voicemails from the command line.
+
+    python voicemail_batch.py ~/voicemail/2025-06-01 --business-name "Acme Plumbing"
+    python voicemail_batch.py "inbox/*.wav" --stt-workers 8 --llm-workers 4 --tts-workers 4
+
+Transcription, answering and speech synthesis run as three stages, each with
+its own number of workers, joined by bounded queues so a slow stage holds the
+others back instead of piling up work. Failed API calls are retried with
+exponential backoff, by the client's scheduler (scheduler.py) or, when that is
+off, here. Every finished stage is appended to a checkpoint file, so a rerun
+skips voicemails that are done and resumes the rest from their last completed
+stage. Answers come from the same CallProcessor as the app. Each result goes
+into the call history once its last stage is checkpointed, with the reply
+audio saved alongside.
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import openai
+
+from archive import sniff_format
+from call_processor import CallConfig, CallProcessor
+from clients import scheduled, scheduler_stats
+from metrics import METRICS, CallUsage, attach
+from paths import data_dir
+from pipeline import join_audio
+from replays import identify
+
+AUDIO_EXTENSIONS = ('.mp3', '.mp4', '.mpeg', '.mpga', '.m4a', '.wav', '.webm', '.ogg')
+STAGES = ('transcribe', 'answer', 'synthesize')
+RETRYABLE = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+@dataclass
+class BatchSettings:
+    stt_workers: int = 4
+    llm_workers: int = 4
+    tts_workers: int = 4
+    retries: int = 3
+    backoff: float = 1.0  # seconds before the first retry, doubled for each one after
+
+
+@dataclass
+class Voicemail:
+    path: str
+    key: str
+    transcript: Optional[str] = None
+    answer: Optional[str] = None
+    source: Optional[str] = None
+    reply_path: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    usage: CallUsage = field(default_factory=CallUsage)
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchReport:
+    done: List[Voicemail] = field(default_factory=list)
+    failed: List[Voicemail] = field(default_factory=list)
+    skipped: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+    stage_seconds: Dict[str, List[float]] = field(default_factory=lambda: {stage: [] for stage in STAGES})
+
+    @property
+    def files_per_minute(self) -> float:
+        return len(self.done) / self.seconds * 60 if self.seconds else 0.0
+
+    @property
+    def cost(self) -> float:
+        return sum(voicemail.usage.cost for voicemail in self.done + self.failed)
+
+
+# ==================== INPUTS & CHECKPOINT ====================
+def find_audio(patterns: List[str]) -> List[str]:
+    """Audio files in the given directories and glob patterns, in a stable order."""
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            found.extend(os.path.join(pattern, name) for name in sorted(os.listdir(pattern)))
+        else:
+            found.extend(sorted(glob.glob(os.path.expanduser(pattern))))
+    seen = set()
+    return [p for p in found if p.lower().endswith(AUDIO_EXTENSIONS) and os.path.isfile(p)
+            and not (p in seen or seen.add(p))]
+
+
+def file_key(path: str) -> str:
+    # Path plus size and mtime, so a re-recorded file with the same name is processed again
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class Checkpoint:
+    """Append-only JSON Lines log of completed stages; the last line for a file wins."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut short by a crash
+                    self.entries[entry['key']] = entry
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def restore(self, voicemail: Voicemail) -> Optional[str]:
+        """Fill in what an earlier run finished; returns the last completed stage."""
+        entry = self.entries.get(voicemail.key)
+        if entry is None:
+            return None
+        voicemail.transcript = entry.get('transcript')
+        voicemail.answer = entry.get('answer')
+        voicemail.source = entry.get('source')
+        voicemail.reply_path = entry.get('reply')
+        return entry['stage']
+
+    def record(self, voicemail: Voicemail, stage: str):
+        entry = {'key': voicemail.key, 'stage': stage, 'transcript': voicemail.transcript,
+                 'answer': voicemail.answer, 'source': voicemail.source, 'reply': voicemail.reply_path}
+        self.entries[voicemail.key] = entry
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# ==================== PIPELINE ====================
+class VoicemailBatch:
+    def __init__(self, processor: CallProcessor, config: CallConfig, output_dir: str, checkpoint: Checkpoint,
+                 store=None, settings: BatchSettings = None, on_done: Callable[[Voicemail], None] = None):
+        self.processor = processor
+        self.config = config
+        self.output_dir = output_dir
+        self.checkpoint = checkpoint
+        self.store = store
+        self.settings = settings or BatchSettings()
+        # Retrying on top of the scheduler's own retries would multiply the attempts
+        self.retries = 0 if scheduled(processor.client) else self.settings.retries
+        self.on_done = on_done
+        self.report = BatchReport()
+        os.makedirs(output_dir, exist_ok=True)
+
+    async def run(self, paths: List[str]) -> BatchReport:
+        settings = self.settings
+        queues = [asyncio.Queue(maxsize=workers * 2)
+                  for workers in (settings.stt_workers, settings.llm_workers, settings.tts_workers)]
+        stages = [
+            self._stage('transcribe', self.transcribe, queues[0], queues[1], settings.stt_workers, settings.llm_workers),
+            self._stage('answer', self.answer, queues[1], queues[2], settings.llm_workers, settings.tts_workers),
+            self._stage('synthesize', self.synthesize, queues[2], None, settings.tts_workers, 0),
+        ]
+        start, retried = time.perf_counter(), self._scheduler_retries()
+        tasks = [asyncio.create_task(stage) for stage in stages]
+        for path in paths:
+            voicemail = Voicemail(path, file_key(path))
+            if self.checkpoint.restore(voicemail) == 'synthesize':
+                self.report.skipped += 1
+                continue
+            await queues[0].put(voicemail)
+        for _ in range(settings.stt_workers):
+            await queues[0].put(None)
+        await asyncio.gather(*tasks)
+        if self.store is not None:
+            await asyncio.to_thread(self.store.flush)
+        self.report.seconds = time.perf_counter() - start
+        self.report.retries += self._scheduler_retries() - retried
+        return self.report
+
+    def _scheduler_retries(self) -> int:
+        return sum(limits['retries'] for limits in scheduler_stats(self.processor.client).values())
+
+    async def _stage(self, name, work, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue], workers: int,
+                     next_workers: int):
+        async def worker():
+            while (voicemail := await inbox.get()) is not None:
+                start = time.perf_counter()
+                try:
+                    with attach(voicemail.usage):
+                        ran = await self._with_retries(lambda: work(voicemail))
+                except Exception as e:
+                    voicemail.error = f"{name}: {e}"
+                    self.report.failed.append(voicemail)
+                    METRICS.end_call(voicemail.usage)
+                    continue
+                if ran:
+                    elapsed = time.perf_counter() - start
+                    voicemail.timings[name] = elapsed
+                    self.report.stage_seconds[name].append(elapsed)
+                    self.checkpoint.record(voicemail, name)
+                if voicemail.error:
+                    self.report.failed.append(voicemail)
+                    METRICS.end_call(voicemail.usage)
+                elif outbox is not None:
+                    await outbox.put(voicemail)
+                else:
+                    # Only now, after the checkpoint: a crash before it redoes the stage, not the row
+                    self.save(voicemail)
+                    self.report.done.append(voicemail)
+                    METRICS.end_call(voicemail.usage)
+                    if self.on_done is not None:
+                        self.on_done(voicemail)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        for _ in range(next_workers):
+            await outbox.put(None)
+
+    async def _with_retries(self, call):
+        for attempt in range(self.retries + 1):
+            try:
+                return await call()
+            except RETRYABLE:
+                if attempt == self.retries:
+                    raise
+                self.report.retries += 1
+                await asyncio.sleep(self.settings.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    # ==================== STAGES ====================
+    # Each returns False when an earlier run already finished it
+    async def transcribe(self, voicemail: Voicemail) -> bool:
+        if voicemail.transcript is not None:
+            return False
+        audio = await asyncio.to_thread(_read, voicemail.path)
+        filename = os.path.basename(voicemail.path)
+        # A voicemail resubmitted under another name (or re-saved) reuses its earlier transcript
+        upload = await asyncio.to_thread(identify, audio, filename) if self.processor.replays is not None else None
+        voicemail.transcript = await self.processor.transcribe(audio, self.config, filename=filename, upload=upload)
+        return True
+
+    async def answer(self, voicemail: Voicemail) -> bool:
+        if not voicemail.transcript:
+            voicemail.error = 'transcribe: no speech found'
+            return False
+        if voicemail.answer is not None:
+            return False
+        voicemail.answer, voicemail.source = await self.processor.answer(voicemail.transcript, self.config)
+        return True
+
+    async def synthesize(self, voicemail: Voicemail) -> bool:
+        chunks = [chunk async for chunk in self.processor.speak(voicemail.answer, self.config, voicemail.source)]
+        audio = join_audio(chunks)
+        stem = os.path.splitext(os.path.basename(voicemail.path))[0]
+        digest = hashlib.sha1(voicemail.key.encode()).hexdigest()[:8]
+        # Named for what the audio is: WAV from a local voice without ffmpeg, raw PCM if asked for
+        extension = sniff_format(audio, f"reply.{self.config.audio_format}")
+        voicemail.reply_path = os.path.join(self.output_dir, f"{stem}.{digest}.reply.{extension}")
+        await asyncio.to_thread(_write, voicemail.reply_path, audio)
+        return True
+
+    def save(self, voicemail: Voicemail):
+        if self.store is not None:
+            self.store.add({
+                'timestamp': datetime.fromtimestamp(os.path.getmtime(voicemail.path)).strftime('%Y-%m-%d %H:%M:%S'),
+                'customer_message': voicemail.transcript,
+                'ai_response': voicemail.answer,
+                'audio_ref': voicemail.reply_path,
+                'tenant': self.config.tenant,
+            })
+
+
+def _read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _write(path: str, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def format_report(report: BatchReport) -> str:
+    lines = [f"{len(report.done)} answered, {len(report.failed)} failed, {report.skipped} already done, "
+             f"{report.retries} retries in {report.seconds:.1f}s ({report.files_per_minute:.1f} files/min), "
+             f"${report.cost:.4f} at list prices"]
+    for stage, seconds in report.stage_seconds.items():
+        if seconds:
+            ordered = sorted(seconds)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            lines.append(f"  {stage:<11} {len(seconds):>5} runs  p50 {ordered[len(ordered) // 2]:6.2f}s  "
+                         f"p95 {p95:6.2f}s  total {sum(seconds):8.1f}s")
+    for voicemail in report.failed:
+        lines.append(f"  FAILED {voicemail.path}: {voicemail.error}")
+    return "\n".join(lines)
+
+
+# ==================== CLI ====================
+def main():
+    from answer_cache import AnswerCache
+    from backends import MODEL_POOL
+    from call_store import CallStore
+    from intents import IntentClassifier
+    from preprocess import PreprocessConfig
+    from replays import ReplayStore
+    from tts_cache import TTSCache
+
+    defaults, batch_defaults = CallConfig(), BatchSettings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help='directories or glob patterns of audio files')
+    parser.add_argument('--output', default=None, help='where reply audio and the checkpoint go')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file (default: <output>/checkpoint.jsonl)')
+    parser.add_argument('--business-name', default=defaults.business_name)
+    parser.add_argument('--phone-number', default=defaults.phone_number)
+    parser.add_argument('--business-hours', default=defaults.business_hours)
+    parser.add_argument('--voice', default=defaults.voice)
+    parser.add_argument('--stt-backend', default=defaults.stt_backend,
+                        help="'openai', or a local backend such as 'faster-whisper' or 'faster-whisper:small.en'")
+    parser.add_argument('--tts-backend', default=defaults.tts_backend,
+                        help="'openai', or a local backend such as 'piper' or 'piper:en_US-amy-medium'")
+    parser.add_argument('--stt-workers', type=int, default=batch_defaults.stt_workers)
+    parser.add_argument('--llm-workers', type=int, default=batch_defaults.llm_workers)
+    parser.add_argument('--tts-workers', type=int, default=batch_defaults.tts_workers)
+    parser.add_argument('--retries', type=int, default=batch_defaults.retries)
+    args = parser.parse_args()
+
+    paths = find_audio(args.inputs)
+    if not paths:
+        parser.error("no audio files found")
+    output_dir = args.output or data_dir('voicemail')
+    os.makedirs(output_dir, exist_ok=True)
+    config = CallConfig(business_name=args.business_name, phone_number=args.phone_number,
+                        business_hours=args.business_hours, voice=args.voice,
+                        stt_backend=args.stt_backend, tts_backend=args.tts_backend)
+    settings = BatchSettings(args.stt_workers, args.llm_workers, args.tts_workers, args.retries)
+    # Same processor setup as the app, so a voicemail gets the answer it would get there
+    processor = CallProcessor.from_api_key(os.environ['OPENAI_API_KEY'], tts_cache=TTSCache(),
+                                           answer_cache=AnswerCache(), intents=IntentClassifier(),
+                                           preprocess_config=PreprocessConfig(), replays=ReplayStore())
+    MODEL_POOL.warm([config.stt_backend], [config.tts_backend])
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(output_dir, 'checkpoint.jsonl'))
+    store = CallStore()
+
+    def progress(voicemail: Voicemail):
+        print(f"done  {voicemail.path}  ({voicemail.source}, {sum(voicemail.timings.values()):.1f}s)", flush=True)
+
+    batch = VoicemailBatch(processor, config, output_dir, checkpoint, store=store, settings=settings,
+                           on_done=progress)
+    try:
+        report = asyncio.run(batch.run(paths))
+    finally:
+        checkpoint.close()
+        store.close()
+    print(format_report(report))
+
+
+if __name__ == '__main__':
+    main()